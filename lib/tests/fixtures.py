@@ -92,7 +92,8 @@ async def create_pool(
     config: BaseTestLocalConfig,
 ) -> asyncpg.pool.Pool:
     logger.info("🔌 Creating NEW connection pool...")
-    db_pool = await asyncpg.create_pool(dsn=config.DB_URL, min_size=1, max_size=10, command_timeout=60)
+    # параметры и кодеки те же, что и у пула приложения
+    db_pool = await asyncpg.create_pool(**Database(config).pool_options())
     logger.info("✅ Connection pool created")
     return db_pool
 
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from lib.utils.db.listener import NotificationListener
+from lib.utils.events.event_configs import EventConfigRegistry
+from lib.utils.events.event_types import EventType
+from lib.utils.metrics import registry
+from lib.utils.models import EVENTS_CHANGED_CHANNEL
+
+
+@pytest.mark.asyncio
+async def test_event_configs_cache(db_connection, db, config):
+    await db_connection.execute(
+        """
+        INSERT INTO events (type, processing) VALUES
+            ('event_1', '[{"type": "send_email", "conditions": true, "receiver": "user"}]'),
+            ('unknown', '[]')
+        """,
+    )
+    event_configs = EventConfigRegistry(db)
+    received = asyncio.Queue()
+
+    def on_notification(payload: str | None) -> None:
+        event_configs.on_events_notification(payload)
+        received.put_nowait(payload)
+
+    listener = NotificationListener(config)
+    listener.subscribe(EVENTS_CHANGED_CHANNEL, on_notification)
+    await listener.start()
+
+    try:
+        loads = registry.counter("events.configs.loads").value
+        processing = await event_configs.get(EventType.EVENT_1)
+        assert [action.type for action in processing] == ["send_email"]
+        assert await event_configs.get(EventType.EVENT_2) is None
+
+        # повторные обращения в базу не ходят
+        for _ in range(10):
+            await event_configs.get(EventType.EVENT_1)
+        assert registry.counter("events.configs.loads").value == loads + 1
+
+        # правка в админке сбрасывает кеш
+        await db_connection.execute("""UPDATE events SET processing = '[]' WHERE type = 'event_1'""")
+        await asyncio.wait_for(received.get(), timeout=1)
+        assert await event_configs.get(EventType.EVENT_1) == []
+        assert registry.counter("events.configs.loads").value == loads + 2
+    finally:
+        await listener.stop()
+        await db.disconnect()
@@ -0,0 +1,122 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from aiokafka import ConsumerRecord, TopicPartition
+from lib.utils.events.event_configs import EventConfigRegistry
+from lib.utils.events.event_consumer import EventConsumer
+from lib.utils.events.event_types import EventType
+from lib.utils.metrics import registry
+from lib.utils.schemas.events import EventMessage
+
+
+TP = TopicPartition("events", 0)
+
+
+class FakeConsumer:
+    def __init__(self, highwater: int, position: int):
+        self._highwater = highwater
+        self._position = position
+        self.committed: dict[TopicPartition, int] = {}
+
+    async def commit(self, offsets: dict[TopicPartition, int]) -> None:
+        self.committed.update(offsets)
+
+    def assignment(self) -> set[TopicPartition]:
+        return {TP}
+
+    def highwater(self, tp: TopicPartition) -> int:
+        return self._highwater
+
+    async def position(self, tp: TopicPartition) -> int:
+        return self._position
+
+
+def record(offset: int, payload: dict) -> ConsumerRecord:
+    value = EventMessage(id=uuid4(), event_type=EventType.EVENT_1, payload=payload).model_dump(mode="json")
+    return ConsumerRecord("events", 0, offset, 0, 0, None, value, None, 0, 0, [])
+
+
+@pytest.mark.asyncio
+async def test_dispatch_batch(config, monkeypatch):
+    monkeypatch.setattr(config, "EVENTS_CONSUMER_CONCURRENCY", 2)
+    consumer = EventConsumer(config=config)
+    consumer.consumer = FakeConsumer(highwater=10, position=4)
+
+    running = 0
+    max_running = 0
+    processed: list[tuple[int, int]] = []
+
+    async def process_message(event_message: EventMessage) -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        # первое событие юзера 1 самое медленное - второе все равно обрабатывается после него
+        await asyncio.sleep(0.02 if event_message.payload["n"] == 0 else 0.001)
+        processed.append((event_message.payload["user_id"], event_message.payload["n"]))
+        running -= 1
+
+    monkeypatch.setattr(consumer, "process_message", process_message)
+    payloads = [{"user_id": 1, "n": 0}, {"user_id": 2, "n": 1}, {"user_id": 1, "n": 2}, {"user_id": 3, "n": 3}]
+    consumer.dispatch_batch({TP: [record(offset, payload) for offset, payload in enumerate(payloads)]})
+    await consumer.drain()
+    await consumer.commit_offsets()
+    await consumer._report_lag()
+
+    assert max_running == 2
+    assert [n for user_id, n in processed if user_id == 1] == [0, 2]
+    assert sorted(n for _, n in processed) == [0, 1, 2, 3]
+    assert consumer.consumer.committed == {TP: 4}
+    assert registry.gauge("events.consumer.lag").value == 6
+    assert registry.gauge("events.consumer.pending").value == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_key_does_not_block_others(config, monkeypatch):
+    monkeypatch.setattr(config, "EVENTS_CONSUMER_CONCURRENCY", 2)
+    consumer = EventConsumer(config=config)
+    consumer.consumer = FakeConsumer(highwater=4, position=4)
+    release = asyncio.Event()
+    processed: list[int] = []
+
+    async def process_message(event_message: EventMessage) -> None:
+        if event_message.payload["n"] == 1:
+            await release.wait()
+        processed.append(event_message.payload["n"])
+
+    monkeypatch.setattr(consumer, "process_message", process_message)
+    payloads = [{"user_id": 1, "n": 0}, {"user_id": 2, "n": 1}, {"user_id": 3, "n": 2}, {"user_id": 1, "n": 3}]
+    consumer.dispatch_batch({TP: [record(offset, payload) for offset, payload in enumerate(payloads)]})
+    for _ in range(100):
+        if len(processed) == 3:
+            break
+        await asyncio.sleep(0.001)
+
+    # события других юзеров обработаны, не дожидаясь медленного; коммит - только до него
+    assert sorted(processed) == [0, 2, 3]
+    await consumer.commit_offsets()
+    assert consumer.consumer.committed == {TP: 1}
+
+    release.set()
+    await consumer.drain()
+    await consumer.commit_offsets()
+    assert consumer.consumer.committed == {TP: 4}
+
+
+@pytest.mark.asyncio
+# db_pool - чтобы после теста очистить event_log, состояние событий процессор пишет и без строки сендера
+@pytest.mark.usefixtures("db_pool")
+async def test_pool_outlives_messages(config, db):
+    consumer = EventConsumer(config=config)
+    consumer.db = db
+    consumer.event_configs = EventConfigRegistry(db)
+    pool = await db.connect()
+
+    for n in range(3):
+        await consumer.process_message(EventMessage(event_type=EventType.EVENT_1, payload={"n": n}))
+    # пул не пересоздается на каждое сообщение
+    assert db.pool is pool
+
+    await consumer.stop()
+    assert db.pool is None
@@ -0,0 +1,123 @@
+import asyncio
+from uuid import UUID
+
+import pytest
+
+from lib.utils.events import producer
+from lib.utils.events.event_sender import EventSender
+from lib.utils.events.event_types import EventType
+from lib.utils.metrics import registry
+
+
+class PendingProducer:
+    """Продюсер без брокера: future доставки каждого сообщения подтверждает сам тест"""
+
+    def __init__(self):
+        self.futures: list[asyncio.Future] = []
+        self.values: list[dict] = []
+
+    async def send(self, topic: str, value: dict, key: str | None = None) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.futures.append(future)
+        self.values.append(value)
+        return future
+
+    async def flush(self) -> None:
+        pass
+
+
+class FullBufferProducer:
+    """Продюсер, у которого send падает сразу - как при переполненном буфере"""
+
+    def __init__(self):
+        self.stopped = False
+
+    async def send(self, topic: str, value: dict, key: str | None = None) -> asyncio.Future:
+        raise RuntimeError("buffer is full")
+
+    async def stop(self) -> None:
+        self.stopped = True
+
+
+@pytest.mark.asyncio
+async def test_send_event_nowait(db_connection, db):
+    fake_producer = PendingProducer()
+    sender = EventSender(config=db.config, db=db, producer=fake_producer)
+    deliveries = []
+    failed = registry.counter("events.producer.failed").value
+
+    try:
+        first = await sender.send_event_nowait(
+            EventType.EVENT_1,
+            {"n": 1},
+            on_delivery=lambda message, error: deliveries.append((message.payload, error)),
+        )
+        await sender.send_event_nowait(EventType.EVENT_1, {"n": 2})
+        # event_log пишется после отправки: консьюмер успел обработать первое событие раньше
+        await db_connection.execute(
+            """INSERT INTO event_log (id, type, state, payload) VALUES ($1, $2, 'success', '{}')""",
+            UUID(fake_producer.values[0]["id"]),
+            EventType.EVENT_1,
+        )
+        await sender.flush()
+    finally:
+        await db.disconnect()
+
+    # ничего не подтверждено, но вызовы уже вернулись
+    assert not first.done()
+    assert sender.in_flight == 2
+    assert await db_connection.fetchval("""SELECT COUNT(*) FROM event_log""") == 2
+    # поздний INSERT сендера не перетер состояние консьюмера
+    assert await db_connection.fetchval("""SELECT COUNT(*) FROM event_log WHERE state = 'success'""") == 1
+
+    fake_producer.futures[0].set_result(None)
+    fake_producer.futures[1].set_exception(RuntimeError("broker is down"))
+    await asyncio.sleep(0)
+
+    assert sender.in_flight == 0
+    assert deliveries == [({"n": 1}, None)]
+    assert registry.counter("events.producer.failed").value == failed + 1
+
+
+@pytest.mark.asyncio
+async def test_send_event_nowait_send_error(db_connection, db):
+    fake_producer = FullBufferProducer()
+    sender = EventSender(config=db.config, db=db, producer=fake_producer)
+
+    try:
+        with pytest.raises(Exception, match="buffer is full"):
+            await sender.send_event_nowait(EventType.EVENT_1, {"n": 1})
+    finally:
+        await db.disconnect()
+
+    # в Kafka ничего не ушло - строки event_log нет, продюсер пересоздается при следующей отправке
+    assert await db_connection.fetchval("""SELECT COUNT(*) FROM event_log""") == 0
+    assert fake_producer.stopped
+    assert sender.in_flight == 0
+
+
+def test_compression_fallback(config, monkeypatch):
+    # по умолчанию сжатие только в режиме fire-and-forget
+    monkeypatch.setattr(config, "KAFKA_PRODUCER_COMPRESSION", "")
+    monkeypatch.setattr(config, "EVENTS_FIRE_AND_FORGET", False)
+    assert producer.compression_type(config) is None
+    monkeypatch.setattr(config, "EVENTS_FIRE_AND_FORGET", True)
+    monkeypatch.setitem(producer.COMPRESSION_CODECS, "lz4", lambda: True)
+    assert producer.compression_type(config) == "lz4"
+
+    monkeypatch.setattr(config, "KAFKA_PRODUCER_COMPRESSION", "zstd")
+    monkeypatch.setitem(producer.COMPRESSION_CODECS, "zstd", lambda: False)
+    assert producer.compression_type(config) is None
+
+    monkeypatch.setitem(producer.COMPRESSION_CODECS, "zstd", lambda: True)
+    assert producer.compression_type(config) == "zstd"
+
+    monkeypatch.setattr(config, "KAFKA_PRODUCER_COMPRESSION", "brotli")
+    with pytest.raises(ValueError, match="brotli"):
+        producer.compression_type(config)
+
+
+def test_message_key():
+    # события юзера - в одну партицию, консьюмер обработает их по порядку
+    assert producer.message_key({"user_id": 7, "n": 1}) == "7"
+    assert producer.message_key({"n": 1}) is None
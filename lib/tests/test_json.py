@@ -0,0 +1,40 @@
+import pytest
+
+from lib.utils.db.pool import Database
+from lib.utils.events.event_sender import EventSender
+from lib.utils.events.event_types import EventType
+from lib.utils.schemas.events import EventMessage
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("binary", [False, True])
+async def test_jsonb_codec(setup_database, config, monkeypatch, binary):
+    monkeypatch.setattr(config, "DB_JSONB_BINARY", binary)
+
+    db = Database(config)
+    try:
+        async with db.connection() as conn:
+            value = {"hand_size": 6, "names": ["Бронза", "Gold"], "nested": {"1": None}, 2: 1.5}
+            result = await conn.fetchval("SELECT $1::jsonb", value)
+            # не-строковые ключи, как и в stdlib json, становятся строками
+            assert result == {"hand_size": 6, "names": ["Бронза", "Gold"], "nested": {"1": None}, "2": 1.5}
+            assert await conn.fetchval("""SELECT $1::jsonb ->> 'hand_size'""", value) == "6"
+    finally:
+        await db.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_event_log_payload_is_object(db_connection, db):
+    message = EventMessage(event_type=EventType.EVENT_1, payload={"user_id": 1})
+
+    try:
+        await EventSender(config=db.config, db=db)._log_event(message=message, payload=message.payload)
+    finally:
+        await db.disconnect()
+
+    row = await db_connection.fetchrow(
+        """SELECT jsonb_typeof(payload) AS type, payload FROM event_log WHERE id = $1""",
+        message.id,
+    )
+    assert row["type"] == "object"
+    assert row["payload"] == {"user_id": 1}
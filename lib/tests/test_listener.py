@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from lib.utils.db.listener import NotificationListener
+from lib.utils.models import CATALOG_VERSION_CHANNEL, USER_CHANGED_CHANNEL
+
+
+@pytest.mark.asyncio
+async def test_catalog_version_notification(db_connection, config):
+    received = asyncio.Queue()
+
+    listener = NotificationListener(config)
+    listener.subscribe(CATALOG_VERSION_CHANNEL, received.put_nowait)
+    await listener.start()
+
+    try:
+        # любое изменение статической таблицы поднимает версию каталога и шлет NOTIFY
+        await db_connection.execute("""INSERT INTO game_constants (data) VALUES ('{}')""")
+        version = await db_connection.fetchval("""SELECT version FROM catalog_version WHERE id = 1""")
+        assert await asyncio.wait_for(received.get(), timeout=1) == str(version)
+
+        await db_connection.execute("""UPDATE game_constants SET data = '{"hand_size": 6}'""")
+        assert await asyncio.wait_for(received.get(), timeout=1) == str(version + 1)
+
+        # таблицы юзеров версию не трогают
+        await db_connection.execute("""INSERT INTO users (username, password, email) VALUES ('1', '1', '1')""")
+        assert await db_connection.fetchval("""SELECT version FROM catalog_version WHERE id = 1""") == version + 1
+    finally:
+        await listener.stop()
+
+
+@pytest.mark.asyncio
+async def test_user_changed_notification(db_connection, config):
+    received = asyncio.Queue()
+
+    listener = NotificationListener(config)
+    listener.subscribe(USER_CHANGED_CHANNEL, received.put_nowait)
+    await listener.start()
+
+    try:
+        user_id = await db_connection.fetchval(
+            """INSERT INTO users (username, password, email) VALUES ('1', '1', '1') RETURNING id""",
+        )
+        # обычные правки юзера не интересны, только деактивация/смена почты или пароля
+        await db_connection.execute("""UPDATE users SET username = '2' WHERE id = $1""", user_id)
+        await db_connection.execute("""UPDATE users SET is_active = FALSE WHERE id = $1""", user_id)
+        assert await asyncio.wait_for(received.get(), timeout=1) == str(user_id)
+        assert received.empty()
+    finally:
+        await listener.stop()
@@ -0,0 +1,62 @@
+import logging
+
+import pytest
+
+from lib.utils.metrics import COUNT_BUCKETS, OVERFLOW_LABEL, MetricsRegistry, MetricsReporter
+
+
+def test_histogram_buckets():
+    metrics = MetricsRegistry()
+    histogram = metrics.histogram("test.duration_seconds", caller="a")
+    for value in (0.0005, 0.003, 0.2, 0.2, 20):
+        histogram.observe(value)
+
+    assert histogram.cumulative_buckets()[0] == (0.001, 1)
+    assert histogram.cumulative_buckets()[-1][1] == 5
+    # медиана внутри бакета (0.1, 0.25], хвост выше последней границы - максимум
+    assert 0.1 < histogram.quantile(0.5) <= 0.25
+    assert histogram.quantile(0.99) == 20
+
+    rows = metrics.histogram("test.rows", buckets=COUNT_BUCKETS)
+    rows.observe(0)
+    assert rows.quantile(0.5) == 0
+
+
+def test_labels_and_series_limit():
+    metrics = MetricsRegistry(max_series=2)
+    for n in range(5):
+        metrics.counter("test.requests", caller=f"caller-{n}").inc()
+
+    # метки не раздувают реестр: все сверх лимита - в одной серии
+    assert metrics.snapshot() == {
+        'test.requests{caller="caller-0"}': 1,
+        'test.requests{caller="caller-1"}': 1,
+        f'test.requests{{caller="{OVERFLOW_LABEL}"}}': 3,
+    }
+    with pytest.raises(TypeError):
+        metrics.gauge("test.requests")
+
+
+def test_render_prometheus():
+    metrics = MetricsRegistry()
+    metrics.gauge("db.pool.free").set(3)
+    metrics.histogram("db.pool.in_use_seconds", caller='say "hi"').observe(0.002)
+
+    text = metrics.render_prometheus()
+    assert "# TYPE db_pool_free gauge\ndb_pool_free 3\n" in text
+    assert 'db_pool_in_use_seconds_bucket{caller="say \\"hi\\"",le="0.0025"} 1' in text
+    assert 'db_pool_in_use_seconds_bucket{caller="say \\"hi\\"",le="+Inf"} 1' in text
+    assert 'db_pool_in_use_seconds_count{caller="say \\"hi\\""} 1' in text
+
+
+@pytest.mark.asyncio
+async def test_reporter(caplog):
+    metrics = MetricsRegistry()
+    metrics.counter("test.processed").inc()
+    reporter = MetricsReporter(interval=60, metrics=metrics)
+
+    with caplog.at_level(logging.INFO, logger="lib.utils.metrics"):
+        await reporter.start()
+        await reporter.stop()
+
+    assert '"test.processed":1' in caplog.text
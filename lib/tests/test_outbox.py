@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from lib.utils.events import event_sender
+from lib.utils.events.event_types import EventProcessingState, EventType
+from lib.utils.events.outbox import OutboxRelay, enqueue_event
+
+
+class FakeProducer:
+    """Продюсер без брокера: запоминает отправленные сообщения, доставка подтверждается сразу"""
+
+    def __init__(self):
+        self.sent: list[tuple[str, dict]] = []
+
+    async def send(self, topic: str, value: dict, key: str | None = None) -> asyncio.Future:
+        self.sent.append((topic, value))
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+
+@pytest.mark.asyncio
+async def test_relay_publishes_committed_events(db_connection, db, monkeypatch):
+    monkeypatch.setattr(db.config, "EVENTS_OUTBOX_BATCH_SIZE", 2)
+
+    async with db_connection.transaction():
+        committed = [await enqueue_event(db_connection, EventType.EVENT_1, {"n": n}) for n in range(3)]
+    with pytest.raises(RuntimeError):
+        async with db_connection.transaction():
+            await enqueue_event(db_connection, EventType.EVENT_2, {"n": "rolled back"})
+            raise RuntimeError
+
+    producer = FakeProducer()
+    relay = OutboxRelay(config=db.config, db=db, producer=producer)
+    try:
+        assert await relay.relay_once() == 2
+        assert await relay.relay_once() == 1
+        assert await relay.relay_once() == 0
+    finally:
+        await db.disconnect()
+
+    assert [value for _, value in producer.sent] == [message.model_dump(mode="json") for message in committed]
+    states = await db_connection.fetch("""SELECT DISTINCT state FROM event_log""")
+    assert [row["state"] for row in states] == [EventProcessingState.SENT]
+
+
+@pytest.mark.asyncio
+async def test_create_event_in_outbox_mode(db_connection, config, monkeypatch):
+    monkeypatch.setattr(config, "EVENTS_OUTBOX_ENABLED", True)
+
+    async with db_connection.transaction():
+        # события пишутся на соединении вызывающего, без Kafka
+        await event_sender.create_event(
+            event_type=EventType.EVENT_1,
+            payload={"user_id": 1},
+            config=config,
+            connection=db_connection,
+        )
+
+    row = await db_connection.fetchrow("""SELECT type, state, payload FROM event_log""")
+    assert dict(row) == {"type": EventType.EVENT_1, "state": EventProcessingState.PENDING, "payload": {"user_id": 1}}
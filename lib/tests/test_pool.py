@@ -0,0 +1,31 @@
+import pytest
+
+from lib.utils.db.pool import Database
+from lib.utils.metrics import registry
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics(setup_database, config, monkeypatch):
+    monkeypatch.setattr(config, "DB_POOL_MAX_SIZE", 1)
+    monkeypatch.setattr(config, "DB_POOL_ACQUIRE_TIMEOUT", 0.1)
+
+    db = Database(config)
+    await db.connect()
+    try:
+        async with db.transaction() as conn:
+            assert await conn.fetchval("SELECT 1") == 1
+            assert registry.gauge("db.pool.free").value == 0
+
+            # единственное соединение занято - ждем не дольше DB_POOL_ACQUIRE_TIMEOUT
+            with pytest.raises(TimeoutError):
+                async with db.connection(caller="waiting"):
+                    pass
+
+        assert registry.gauge("db.pool.size").value == 1
+        assert registry.gauge("db.pool.free").value == 1
+        assert registry.counter("db.pool.acquire_timeouts").value >= 1
+        caller = "lib.tests.test_pool.test_pool_metrics"
+        assert registry.histogram("db.pool.in_use_seconds", caller=caller).count == 1
+        assert 'db.pool.in_use_seconds{caller="waiting"}' not in registry.snapshot()
+    finally:
+        await db.disconnect()
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from lib.utils.db.pool import Database
+from lib.utils.metrics import registry
+
+
+def counters() -> tuple[int, int, int]:
+    return (
+        registry.counter("db.replica.reads").value,
+        registry.counter("db.replica.primary_fallbacks").value,
+        registry.counter("db.replica.sticky_reads").value,
+    )
+
+
+def delta(before: tuple[int, int, int]) -> tuple[int, int, int]:
+    return tuple(after - value for after, value in zip(counters(), before, strict=True))
+
+
+@pytest.mark.asyncio
+async def test_replica_routing(setup_database, config, monkeypatch):
+    # тот же инстанс под вторым DSN - не в recovery, отставание 0
+    monkeypatch.setattr(config, "DB_REPLICA_URLS", config.DB_URL.replace("localhost", "127.0.0.1"))
+
+    db = Database(config)
+    await db.connect()
+    try:
+        assert db.replicas.replicas[0].lag == 0
+
+        before = counters()
+        async with db.connection(readonly=True, user_id=1) as conn:
+            assert await conn.fetchval("SELECT 1") == 1
+        assert delta(before) == (1, 0, 0)
+
+        # после записи юзер читает с primary, остальные - с реплики
+        async with db.transaction(user_id=1) as conn:
+            await conn.execute("SELECT 1")
+        before = counters()
+        async with db.connection(readonly=True, user_id=1):
+            pass
+        async with db.connection(readonly=True, user_id=2):
+            pass
+        assert delta(before) == (1, 0, 1)
+
+        # реплика отстает - читаем с primary
+        db.replicas.replicas[0].lag = config.DB_REPLICA_MAX_LAG_SECONDS + 1
+        before = counters()
+        async with db.connection(readonly=True):
+            pass
+        assert delta(before) == (0, 1, 0)
+    finally:
+        await db.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_replica_unavailable(setup_database, config, monkeypatch):
+    monkeypatch.setattr(config, "DB_REPLICA_URLS", "postgresql://postgres@127.0.0.1:1/test_db")
+
+    db = Database(config)
+    await db.connect()
+    try:
+        assert db.replicas.replicas[0].lag is None
+
+        before = counters()
+        async with db.connection(readonly=True) as conn:
+            assert await conn.fetchval("SELECT 1") == 1
+        assert delta(before) == (0, 1, 0)
+    finally:
+        await db.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_replica_probe_pool_exhausted(setup_database, config, monkeypatch):
+    monkeypatch.setattr(config, "DB_REPLICA_URLS", config.DB_URL.replace("localhost", "127.0.0.1"))
+    monkeypatch.setattr(config, "DB_POOL_MAX_SIZE", 1)
+    monkeypatch.setattr(config, "DB_POOL_ACQUIRE_TIMEOUT", 0.1)
+
+    db = Database(config)
+    await db.connect()
+    replica = db.replicas.replicas[0]
+    try:
+        # все соединения реплики заняты - проверка отставания не висит, реплика временно недоступна
+        async with replica.pool.acquire():
+            await asyncio.wait_for(db.replicas.probe(), timeout=1)
+            assert replica.lag is None
+
+        await db.replicas.probe()
+        assert replica.lag == 0
+    finally:
+        await db.disconnect()
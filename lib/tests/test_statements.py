@@ -0,0 +1,75 @@
+import asyncpg
+import pytest
+
+from lib.utils.db.statements import StatementRegistry
+from lib.utils.metrics import registry
+
+
+@pytest.mark.asyncio
+async def test_statement_registry(setup_database, config):
+    statements = StatementRegistry()
+    add_one = statements.register("test.add_one", "SELECT $1::int + 1")
+    with pytest.raises(ValueError):
+        statements.register("test.add_one", "SELECT $1::int + 2")
+
+    conn = await asyncpg.connect(config.DB_URL)
+    try:
+        misses = registry.counter("db.statements.misses").value
+        assert await statements.fetchval(conn, add_one, 1) == 2
+        assert registry.counter("db.statements.misses").value == misses + 1
+
+        # соединение не отслеживается - повтор тоже промах
+        assert await statements.fetchval(conn, add_one, 1) == 2
+        assert registry.counter("db.statements.misses").value == misses + 2
+
+        hits = registry.counter("db.statements.hits").value
+        statements.track(conn)
+        assert await statements.fetchval(conn, add_one, 2) == 3
+        assert await statements.fetchval(conn, add_one, 2) == 3
+        assert registry.counter("db.statements.hits").value == hits + 1
+
+        # реестр не мешает транзакции с уровнем изоляции на соединении
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            assert await statements.fetchval(conn, add_one, 3) == 4
+    finally:
+        await conn.close()
+
+
+@pytest.mark.asyncio
+async def test_statement_registry_untracked(setup_database, config):
+    statements = StatementRegistry()
+    add_one = statements.register("test.add_one", "SELECT $1::int + 1")
+
+    # кеш asyncpg выключен, соединение не отслеживается - каждое обращение промах
+    conn = await asyncpg.connect(config.DB_URL, statement_cache_size=0)
+    try:
+        hits = registry.counter("db.statements.hits").value
+        misses = registry.counter("db.statements.misses").value
+        for n in range(3):
+            assert await statements.fetchval(conn, add_one, n) == n + 1
+        assert registry.counter("db.statements.hits").value == hits
+        assert registry.counter("db.statements.misses").value == misses + 3
+    finally:
+        await conn.close()
+
+
+@pytest.mark.asyncio
+async def test_statement_registry_pool(setup_database, config):
+    statements = StatementRegistry()
+    add_one = statements.register("test.add_one", "SELECT $1::int + 1")
+
+    async def init(conn):
+        statements.track(conn)
+
+    pool = await asyncpg.create_pool(config.DB_URL, min_size=1, max_size=1, init=init)
+    try:
+        misses = registry.counter("db.statements.misses").value
+        hits = registry.counter("db.statements.hits").value
+        # соединение одно: промах только на первой выдаче, дальше запрос в кеше asyncpg
+        for n in range(3):
+            async with pool.acquire() as conn:
+                assert await statements.fetchval(conn, add_one, n) == n + 1
+        assert registry.counter("db.statements.misses").value == misses + 1
+        assert registry.counter("db.statements.hits").value == hits + 2
+    finally:
+        await pool.close()
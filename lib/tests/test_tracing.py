@@ -0,0 +1,58 @@
+import logging
+
+import pytest
+
+from lib.utils.db.pool import Database
+from lib.utils.db.tracing import normalize_query, query_fingerprint
+from lib.utils.metrics import OVERFLOW_LABEL, registry
+
+
+def test_query_fingerprint():
+    assert normalize_query("SELECT *\n  FROM cards WHERE id = 15 AND name = 'it''s'") == (
+        "SELECT * FROM cards WHERE id = ? AND name = ?"
+    )
+    assert query_fingerprint("SELECT 1 WHERE $1 = 2") == query_fingerprint("SELECT 3   WHERE $1 = 4")
+
+
+@pytest.mark.asyncio
+async def test_traced_connection(setup_database, config, monkeypatch, caplog):
+    monkeypatch.setattr(config, "DB_QUERY_TRACING", True)
+    monkeypatch.setattr(config, "DB_SLOW_QUERY_SECONDS", 0)
+    monkeypatch.setattr(config, "DB_SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 1)
+
+    db = Database(config)
+    try:
+        with caplog.at_level(logging.WARNING, logger="lib.utils.db.tracing"):
+            async with db.connection(caller="test") as conn:
+                rows = await conn.fetch("SELECT generate_series(1, $1) AS n", 3)
+                status = await conn.execute("SELECT 1")
+    finally:
+        await db.disconnect()
+
+    assert [row["n"] for row in rows] == [1, 2, 3]
+    assert status == "SELECT 1"
+
+    fingerprint = query_fingerprint("SELECT generate_series(1, $1) AS n")
+    assert registry.histogram("db.query.duration_seconds", fingerprint=fingerprint).count >= 1
+    assert registry.histogram("db.query.rows", fingerprint=fingerprint).max == 3
+    assert db.tracer.statements[fingerprint] == "SELECT generate_series(?, $1) AS n"
+    assert f"Slow query {fingerprint} from test" in caplog.text
+    assert f"Plan of slow query {fingerprint}" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_fingerprints_limit(setup_database, config, monkeypatch):
+    monkeypatch.setattr(config, "DB_QUERY_TRACING", True)
+    monkeypatch.setattr(config, "DB_QUERY_TRACE_MAX_FINGERPRINTS", 2)
+
+    db = Database(config)
+    try:
+        async with db.connection(caller="test") as conn:
+            for n in range(5):
+                await conn.fetchval(f"SELECT 1 AS column_{n}")
+    finally:
+        await db.disconnect()
+
+    # динамический SQL не раздувает ни память трассировки, ни реестр метрик
+    assert len(db.tracer.statements) == 2
+    assert registry.histogram("db.query.duration_seconds", fingerprint=OVERFLOW_LABEL).count >= 3
@@ -23,6 +23,42 @@ class BaseConfig:
     DB_NAME: str = get_secret("DB_NAME")
     DB_URL: str = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+    # пул соединений asyncpg: размеры, кеш подготовленных запросов на соединение,
+    # через сколько секунд закрывать простаивающее соединение и сколько ждать свободное
+    DB_POOL_MIN_SIZE: int = get_secret("DB_POOL_MIN_SIZE", default=1, cast=int)
+    DB_POOL_MAX_SIZE: int = get_secret("DB_POOL_MAX_SIZE", default=10, cast=int)
+    DB_COMMAND_TIMEOUT: float = get_secret("DB_COMMAND_TIMEOUT", default=60.0, cast=float)
+    DB_STATEMENT_CACHE_SIZE: int = get_secret("DB_STATEMENT_CACHE_SIZE", default=100, cast=int)
+    DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME: float = get_secret(
+        "DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME",
+        default=300.0,
+        cast=float,
+    )
+    DB_POOL_ACQUIRE_TIMEOUT: float = get_secret("DB_POOL_ACQUIRE_TIMEOUT", default=10.0, cast=float)
+    # jsonb в бинарном формате протокола вместо текстового
+    DB_JSONB_BINARY: bool = get_secret("DB_JSONB_BINARY", default=False, cast=bool)
+    # трассировка запросов (метрики по каждому запросу и span в APM), порог медленного запроса в секундах
+    # и доля медленных запросов, для которых пишем в лог EXPLAIN (ANALYZE, BUFFERS)
+    DB_QUERY_TRACING: bool = get_secret("DB_QUERY_TRACING", default=False, cast=bool)
+    DB_SLOW_QUERY_SECONDS: float = get_secret("DB_SLOW_QUERY_SECONDS", default=0.5, cast=float)
+    DB_SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = get_secret("DB_SLOW_QUERY_EXPLAIN_SAMPLE_RATE", default=0.0, cast=float)
+    # сколько разных запросов (отпечатков) трассировка различает в метриках, остальные - одной серией.
+    # Больше lib.utils.metrics.MAX_SERIES ставить нет смысла - лишнее все равно свернет реестр
+    DB_QUERY_TRACE_MAX_FINGERPRINTS: int = get_secret("DB_QUERY_TRACE_MAX_FINGERPRINTS", default=200, cast=int)
+    # реплики для чтения через запятую (пусто - все идет в primary), допустимое отставание реплики,
+    # как часто его проверяем и сколько секунд после записи юзер читает только с primary
+    DB_REPLICA_URLS: str = get_secret("DB_REPLICA_URLS", default="")
+    DB_REPLICA_MAX_LAG_SECONDS: float = get_secret("DB_REPLICA_MAX_LAG_SECONDS", default=2.0, cast=float)
+    DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS: float = get_secret(
+        "DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS",
+        default=1.0,
+        cast=float,
+    )
+    DB_READ_YOUR_WRITES_SECONDS: float = get_secret("DB_READ_YOUR_WRITES_SECONDS", default=5.0, cast=float)
+
+    # как часто сервис пишет снимок метрик в лог (0 - не пишет), см. lib.utils.metrics
+    METRICS_REPORT_INTERVAL_SECONDS: float = get_secret("METRICS_REPORT_INTERVAL_SECONDS", default=60.0, cast=float)
+
     # Logging
     LOGGING_LEVEL: str = get_secret("LOGGING_LEVEL", default="INFO")
     LOGGING = {
@@ -53,6 +89,26 @@ class BaseConfig:
     # Kafka
     KAFKA_BOOTSTRAP_SERVERS: str = get_secret("KAFKA_BOOTSTRAP_SERVERS", default="localhost:9092")
     KAFKA_TOPIC: str = get_secret("KAFKA_TOPIC", default="events")
+    # продюсер: пачка на партицию до max batch size байт или linger мс, сжатие gzip/lz4/zstd/snappy.
+    # linger добавляется к каждому send_and_wait, поэтому по умолчанию 0 - имеет смысл с EVENTS_FIRE_AND_FORGET.
+    # Сжатие по умолчанию (пусто) - lz4 с EVENTS_FIRE_AND_FORGET, где пачки крупные, иначе без сжатия
+    KAFKA_PRODUCER_LINGER_MS: int = get_secret("KAFKA_PRODUCER_LINGER_MS", default=0, cast=int)
+    KAFKA_PRODUCER_MAX_BATCH_SIZE: int = get_secret("KAFKA_PRODUCER_MAX_BATCH_SIZE", default=65536, cast=int)
+    KAFKA_PRODUCER_COMPRESSION: str = get_secret("KAFKA_PRODUCER_COMPRESSION", default="")
+    # create_event не ждет подтверждения брокера - доставку отслеживают колбеки EventSender
+    EVENTS_FIRE_AND_FORGET: bool = get_secret("EVENTS_FIRE_AND_FORGET", default=False, cast=bool)
+    # консьюмер: до concurrency событий обрабатываются параллельно (события одного юзера - по порядку),
+    # сообщения забираются пачками до max records, ожидание новых - poll timeout.
+    # Забранных, но еще не обработанных сообщений не больше max pending - дальше чтение ждет обработки
+    EVENTS_CONSUMER_CONCURRENCY: int = get_secret("EVENTS_CONSUMER_CONCURRENCY", default=8, cast=int)
+    EVENTS_CONSUMER_MAX_RECORDS: int = get_secret("EVENTS_CONSUMER_MAX_RECORDS", default=100, cast=int)
+    EVENTS_CONSUMER_MAX_PENDING: int = get_secret("EVENTS_CONSUMER_MAX_PENDING", default=1000, cast=int)
+    EVENTS_CONSUMER_POLL_TIMEOUT_MS: int = get_secret("EVENTS_CONSUMER_POLL_TIMEOUT_MS", default=1000, cast=int)
+    # outbox: события пишутся в event_log (state pending) транзакцией вызывающего, в Kafka их отправляет
+    # OutboxRelay пачками по batch size; если outbox опустел, следующий опрос - через linger секунд
+    EVENTS_OUTBOX_ENABLED: bool = get_secret("EVENTS_OUTBOX_ENABLED", default=False, cast=bool)
+    EVENTS_OUTBOX_BATCH_SIZE: int = get_secret("EVENTS_OUTBOX_BATCH_SIZE", default=100, cast=int)
+    EVENTS_OUTBOX_LINGER_SECONDS: float = get_secret("EVENTS_OUTBOX_LINGER_SECONDS", default=0.5, cast=float)
 
     # Email
     SMTP_SERVER: str = get_secret("SMTP_SERVER", default="smtp.gmail.com")
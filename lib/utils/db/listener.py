@@ -0,0 +1,106 @@
+import asyncio
+from collections.abc import Callable
+import logging
+
+import asyncpg
+
+from lib.utils.config.base import BaseConfig
+
+
+logger = logging.getLogger(__name__)
+
+# колбек получает payload уведомления, либо None после переподключения (уведомления могли потеряться)
+NotificationCallback = Callable[[str | None], None]
+
+
+class NotificationListener:
+    """
+    Подписка на LISTEN/NOTIFY каналы постгреса.
+    Держит отдельное соединение вне пула, при обрыве переподключается и дергает все колбеки с None
+    """
+
+    def __init__(
+        self,
+        config: BaseConfig,
+        reconnect_delay: float = 1.0,
+    ):
+        self.config = config
+        self.reconnect_delay = reconnect_delay
+        self._callbacks: dict[str, list[NotificationCallback]] = {}
+        self._connection: asyncpg.Connection | None = None
+        self._reconnect_task: asyncio.Task | None = None
+        self._closed = False
+
+    def subscribe(
+        self,
+        channel: str,
+        callback: NotificationCallback,
+    ) -> None:
+        """Подписываться нужно до start()"""
+        self._callbacks.setdefault(channel, []).append(callback)
+
+    async def start(self) -> None:
+        self._closed = False
+        await self._connect()
+
+    async def stop(self) -> None:
+        self._closed = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._connection and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+        logger.info("Notification listener stopped")
+
+    async def _connect(self) -> None:
+        connection = await asyncpg.connect(dsn=self.config.DB_URL)
+        connection.add_termination_listener(self._on_termination)
+        for channel in self._callbacks:
+            await connection.add_listener(channel, self._on_notification)
+        self._connection = connection
+        logger.info("Listening to channels: %s", list(self._callbacks))
+
+    def _on_notification(
+        self,
+        connection: asyncpg.Connection,
+        pid: int,
+        channel: str,
+        payload: str,
+    ) -> None:
+        logger.debug("Got notification on channel %s: %s", channel, payload)
+        self._run_callbacks(channel, payload)
+
+    def _on_termination(
+        self,
+        connection: asyncpg.Connection,
+    ) -> None:
+        if self._closed:
+            return
+        logger.warning("Notification listener connection lost, reconnecting")
+        self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                await self._connect()
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.error("Notification listener failed to reconnect: %s", e)
+                continue
+
+            # пока соединения не было, уведомления терялись - сообщаем об этом всем подписчикам
+            for channel in self._callbacks:
+                self._run_callbacks(channel, None)
+            return
+
+    def _run_callbacks(
+        self,
+        channel: str,
+        payload: str | None,
+    ) -> None:
+        for callback in self._callbacks.get(channel, []):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("Notification callback failed on channel %s", channel)
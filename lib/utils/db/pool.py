@@ -1,59 +1,246 @@
-from contextlib import asynccontextmanager
-import json
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
 import logging
+import sys
+import time
 
 import asyncpg
 
 from lib.utils.config.base import BaseConfig
+from lib.utils.db.replicas import Replica, ReplicaSet
+from lib.utils.db.statements import statements
+from lib.utils.db.tracing import QueryTracer, TracedConnection
+from lib.utils.json import set_jsonb_codec
+from lib.utils.metrics import registry
 
 
 logger = logging.getLogger(__name__)
 
 
+def _caller_name(depth: int = 2) -> str:
+    """Имя функции, которая взяла соединение - для метрики времени удержания соединения"""
+    frame = sys._getframe(depth)  # noqa: SLF001
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"
+
+
 class Database:
     def __init__(self, config: BaseConfig):
         self.pool = None
         self.config = config
+        self.tracer = QueryTracer(config) if config.DB_QUERY_TRACING else None
+        self.replicas = (
+            ReplicaSet(
+                dsns=[dsn.strip() for dsn in config.DB_REPLICA_URLS.split(",") if dsn.strip()],
+                max_lag=config.DB_REPLICA_MAX_LAG_SECONDS,
+                check_interval=config.DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS,
+                sticky_seconds=config.DB_READ_YOUR_WRITES_SECONDS,
+                acquire_timeout=config.DB_POOL_ACQUIRE_TIMEOUT,
+            )
+            if config.DB_REPLICA_URLS
+            else None
+        )
+
+        self._size_gauge = registry.gauge("db.pool.size")
+        self._free_gauge = registry.gauge("db.pool.free")
+        self._acquire_wait_histogram = registry.histogram("db.pool.acquire_wait_seconds")
+        self._acquire_timeout_counter = registry.counter("db.pool.acquire_timeouts")
+        self._replica_reads_counter = registry.counter("db.replica.reads")
+        self._primary_fallback_counter = registry.counter("db.replica.primary_fallbacks")
+        self._sticky_reads_counter = registry.counter("db.replica.sticky_reads")
 
     async def init_connection(
         self,
         conn: asyncpg.Connection,
     ):
-        await conn.set_type_codec(
-            "jsonb",
-            encoder=lambda v: json.dumps(v),  # Python -> JSONB
-            decoder=lambda v: json.loads(v),  # JSONB -> Python
-            schema="pg_catalog",
-        )
+        await set_jsonb_codec(conn, binary=self.config.DB_JSONB_BINARY)
+        if self.config.DB_STATEMENT_CACHE_SIZE:
+            statements.track(conn)
+
+    def pool_options(self) -> dict:
+        """Параметры asyncpg.create_pool из конфига сервиса"""
+        return {
+            "dsn": self.config.DB_URL,
+            "min_size": self.config.DB_POOL_MIN_SIZE,
+            "max_size": self.config.DB_POOL_MAX_SIZE,
+            "command_timeout": self.config.DB_COMMAND_TIMEOUT,
+            "statement_cache_size": self.config.DB_STATEMENT_CACHE_SIZE,
+            "max_inactive_connection_lifetime": self.config.DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME,
+            "init": self.init_connection,
+        }
 
     async def connect(self) -> asyncpg.Pool:
         if not self.pool:
-            self.pool = await asyncpg.create_pool(
-                dsn=self.config.DB_URL,
-                min_size=1,
-                max_size=10,
-                command_timeout=60,
-                init=self.init_connection,
-            )
+            if 0 < self.config.DB_STATEMENT_CACHE_SIZE < len(statements):
+                logger.warning(
+                    "DB_STATEMENT_CACHE_SIZE=%s is less than %s registered statements",
+                    self.config.DB_STATEMENT_CACHE_SIZE,
+                    len(statements),
+                )
+            self.pool = await asyncpg.create_pool(**self.pool_options())
+            if self.replicas:
+                await self.replicas.start(self._create_replica_pool)
         logger.info("Connected to db")
         return self.pool
 
     async def disconnect(self) -> None:
+        if self.replicas:
+            await self.replicas.stop()
         if self.pool:
             await self.pool.close()
             self.pool = None
 
+    def connection(
+        self,
+        caller: str | None = None,
+        readonly: bool = False,
+        user_id: int | None = None,
+    ) -> AbstractAsyncContextManager[asyncpg.Connection]:
+        """
+        caller - метка для метрик db.pool.in_use_seconds.<caller> и трассировки запросов,
+        по умолчанию вызывающая функция. При DB_QUERY_TRACING отдаем TracedConnection.
+        readonly - только чтение, можно отдать реплике, если она не отстает и user_id недавно ничего не писал.
+        Без readonly соединение с user_id считается записью юзера и прилепляет его к primary
+        """
+        return self._connection(caller or _caller_name(), readonly=readonly, user_id=user_id)
+
+    def transaction(
+        self,
+        caller: str | None = None,
+        user_id: int | None = None,
+    ) -> AbstractAsyncContextManager[asyncpg.Connection]:
+        """Контекстный менеджер для транзакции, всегда на primary"""
+        return self._transaction(caller or _caller_name(), user_id=user_id)
+
+    def connections(
+        self,
+        count: int,
+        caller: str | None = None,
+        readonly: bool = False,
+        user_id: int | None = None,
+    ) -> AbstractAsyncContextManager[list[asyncpg.Connection]]:
+        """
+        Несколько соединений из одного пула (одна реплика или primary) - для параллельных запросов
+        в общем снимке pg_export_snapshot: импортировать снимок можно только на том же сервере.
+        Каждый вызов держит count соединений - DB_POOL_MAX_SIZE должен это учитывать
+        """
+        return self._connections(count, caller or _caller_name(), readonly=readonly, user_id=user_id)
+
+    async def _create_replica_pool(
+        self,
+        dsn: str,
+    ) -> asyncpg.Pool:
+        return await asyncpg.create_pool(**{**self.pool_options(), "dsn": dsn})
+
     @asynccontextmanager
-    async def connection(self):
+    async def _connection(
+        self,
+        caller: str,
+        readonly: bool = False,
+        user_id: int | None = None,
+    ):
+        async with self._connections(1, caller, readonly=readonly, user_id=user_id) as (conn,):
+            yield conn
+
+    @asynccontextmanager
+    async def _connections(
+        self,
+        count: int,
+        caller: str,
+        readonly: bool = False,
+        user_id: int | None = None,
+    ):
         if not self.pool:
             await self.connect()
 
-        async with self.pool.acquire() as conn:
-            yield conn
+        replica = self._choose_replica(user_id) if readonly else None
+        pool = replica.pool if replica else self.pool
+        conns = []
+        acquired_at = None
+        try:
+            if replica:
+                conns = await self._acquire_replica(replica, caller, count)
+                if conns is None:
+                    pool, conns = self.pool, []
+            while len(conns) < count:
+                conns.append(await self._acquire_primary(caller))
+            acquired_at = time.perf_counter()
+
+            yield [TracedConnection(conn, self.tracer, caller) if self.tracer else conn for conn in conns]
+        finally:
+            if acquired_at is not None:
+                registry.histogram("db.pool.in_use_seconds", caller=caller).observe(time.perf_counter() - acquired_at)
+            if self.replicas and user_id is not None and not readonly:
+                self.replicas.mark_write(user_id)
+            for conn in conns:
+                await pool.release(conn)
+            if pool is self.pool:
+                self._update_pool_gauges()
 
     @asynccontextmanager
-    async def transaction(self):
-        """Контекстный менеджер для транзакции"""
-        async with self.connection() as conn:
+    async def _transaction(
+        self,
+        caller: str,
+        user_id: int | None = None,
+    ):
+        async with self._connection(caller, user_id=user_id) as conn:
             async with conn.transaction():
                 yield conn
+
+    def _choose_replica(
+        self,
+        user_id: int | None,
+    ) -> Replica | None:
+        if not self.replicas:
+            return None
+        if user_id is not None and self.replicas.is_sticky(user_id):
+            self._sticky_reads_counter.inc()
+            return None
+        replica = self.replicas.choose()
+        if replica is None:
+            self._primary_fallback_counter.inc()
+        return replica
+
+    async def _acquire_replica(
+        self,
+        replica: Replica,
+        caller: str,
+        count: int,
+    ) -> list[asyncpg.Connection] | None:
+        """None - реплика не отдала соединения, читаем с primary"""
+        conns = []
+        try:
+            for _ in range(count):
+                conn = await replica.pool.acquire(timeout=self.config.DB_POOL_ACQUIRE_TIMEOUT)
+                conns.append(conn)
+        except (OSError, TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            logger.warning("Failed to acquire replica %s connection for %s: %s", replica.index, caller, e)
+            for conn in conns:
+                await replica.pool.release(conn)
+            self.replicas.mark_unavailable(replica)
+            self._primary_fallback_counter.inc()
+            return None
+        self._replica_reads_counter.inc()
+        return conns
+
+    async def _acquire_primary(
+        self,
+        caller: str,
+    ) -> asyncpg.Connection:
+        started_at = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=self.config.DB_POOL_ACQUIRE_TIMEOUT)
+        except TimeoutError:
+            self._acquire_timeout_counter.inc()
+            logger.warning(
+                "Timed out acquiring db connection for %s: pool size %s, free %s",
+                caller,
+                self.pool.get_size(),
+                self.pool.get_idle_size(),
+            )
+            raise
+        self._acquire_wait_histogram.observe(time.perf_counter() - started_at)
+        self._update_pool_gauges()
+        return conn
+
+    def _update_pool_gauges(self) -> None:
+        self._size_gauge.set(self.pool.get_size())
+        self._free_gauge.set(self.pool.get_idle_size())
@@ -0,0 +1,151 @@
+"""
+Реплики для чтения: пул на каждую реплику, фоновая проверка отставания и «читаю свои записи».
+После записи юзер на DB_READ_YOUR_WRITES_SECONDS прилипает к primary - иначе сразу после крафта
+он может прочитать с реплики старый прогресс. Прилипание хранится в памяти процесса: при нескольких воркерах
+API следующий запрос юзера может попасть в другой воркер, который о записи не знает, и прочитать с реплики
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+import itertools
+import logging
+import time
+
+import asyncpg
+
+from lib.utils.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+# отставание реплики в секундах: у простаивающего primary время последней транзакции старое,
+# поэтому если реплика на связи и все полученное WAL уже применено - отставания нет. Не реплика (тот же инстанс) - 0.
+# Без WAL receiver (строки в pg_stat_wal_receiver нет) полученное и примененное WAL тоже совпадают, но реплика
+# не знает, насколько отстала - считаем по времени последней примененной транзакции, без нее - бесконечность
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN
+            COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::float
+"""
+
+# чистим истекшие прилипания, когда их набралось столько
+STICKY_PURGE_SIZE = 10000
+
+
+@dataclass
+class Replica:
+    index: int
+    dsn: str
+    pool: asyncpg.Pool | None = None
+    # None - реплика недоступна или еще не проверена
+    lag: float | None = None
+
+
+class ReplicaSet:
+    def __init__(
+        self,
+        dsns: list[str],
+        max_lag: float,
+        check_interval: float,
+        sticky_seconds: float,
+        acquire_timeout: float,
+    ):
+        self.replicas = [Replica(index=index, dsn=dsn) for index, dsn in enumerate(dsns)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_seconds = sticky_seconds
+        self.acquire_timeout = acquire_timeout
+
+        self._round_robin = itertools.cycle(self.replicas)
+        self._sticky_until: dict[int, float] = {}
+        self._create_pool: Callable[[str], Awaitable[asyncpg.Pool]] | None = None
+        self._probe_task: asyncio.Task | None = None
+
+        self._lag_gauges = [
+            registry.gauge("db.replica.lag_seconds", replica=replica.index) for replica in self.replicas
+        ]
+
+    async def start(
+        self,
+        create_pool: Callable[[str], Awaitable[asyncpg.Pool]],
+    ) -> None:
+        self._create_pool = create_pool
+        await self.probe()
+        self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self) -> None:
+        if self._probe_task:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+        for replica in self.replicas:
+            if replica.pool:
+                await replica.pool.close()
+                replica.pool = None
+            replica.lag = None
+
+    def choose(self) -> Replica | None:
+        """Следующая по кругу реплика с допустимым отставанием, None - читаем с primary"""
+        for _ in range(len(self.replicas)):
+            replica = next(self._round_robin)
+            if replica.pool is not None and replica.lag is not None and replica.lag <= self.max_lag:
+                return replica
+        return None
+
+    def mark_unavailable(
+        self,
+        replica: Replica,
+    ) -> None:
+        """До следующей проверки отставания реплику не выбираем"""
+        replica.lag = None
+        self._lag_gauges[replica.index].set(-1)
+
+    def mark_write(
+        self,
+        user_id: int,
+    ) -> None:
+        """Юзер читает с primary sticky_seconds - только в этом процессе, другие воркеры о записи не знают"""
+        now = time.monotonic()
+        if len(self._sticky_until) >= STICKY_PURGE_SIZE:
+            self._sticky_until = {key: until for key, until in self._sticky_until.items() if until > now}
+        self._sticky_until[user_id] = now + self.sticky_seconds
+
+    def is_sticky(
+        self,
+        user_id: int,
+    ) -> bool:
+        until = self._sticky_until.get(user_id)
+        return until is not None and until > time.monotonic()
+
+    async def probe(self) -> None:
+        await asyncio.gather(*(self._probe_replica(replica) for replica in self.replicas))
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.probe()
+
+    async def _probe_replica(
+        self,
+        replica: Replica,
+    ) -> None:
+        try:
+            if replica.pool is None:
+                replica.pool = await self._create_pool(replica.dsn)
+            # занятый пул реплики не должен подвешивать проверку отставания
+            async with replica.pool.acquire(timeout=self.acquire_timeout) as conn:
+                replica.lag = await conn.fetchval(REPLICA_LAG_QUERY)
+        except (OSError, TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            if replica.lag is not None:
+                logger.warning("Replica %s is unavailable: %s", replica.index, e)
+            self.mark_unavailable(replica)
+            return
+
+        self._lag_gauges[replica.index].set(replica.lag)
+        if replica.lag > self.max_lag:
+            logger.warning("Replica %s lags %.1fs behind primary", replica.index, replica.lag)
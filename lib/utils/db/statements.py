@@ -0,0 +1,118 @@
+"""
+Реестр именованных запросов. Текст каждого запроса фиксирован, поэтому asyncpg готовит его на соединении
+при первом выполнении и дальше берет из своего кеша подготовленных запросов (statement_cache_size пула).
+Держать свои PreparedStatement (conn.prepare) на соединении нельзя: asyncpg запрещает пользоваться ими после
+возврата соединения в пул, пришлось бы готовить запросы заново на каждую выдачу соединения.
+Попадания и промахи считает сам реестр, метрики db.statements.*: промах - первое выполнение запроса на соединении
+(asyncpg его готовит) или кеш выключен (DB_STATEMENT_CACHE_SIZE=0, соединение не прошло через track).
+Попадание - запрос уже выполнялся на этом соединении и лежит в кеше asyncpg, если его не вытеснили другие
+запросы: поэтому кеш пула должен быть заметно больше числа запросов реестра (Database.connect предупреждает)
+"""
+
+import logging
+from typing import Any
+from weakref import WeakKeyDictionary
+
+import asyncpg
+
+from lib.utils.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+
+def _raw_connection(conn: asyncpg.Connection) -> asyncpg.Connection:
+    # из пула приходит PoolConnectionProxy (или TracedConnection поверх него), сам Connection - в _con.
+    # Прокси на каждую выдачу из пула новый, а кеш подготовленных запросов живет столько же, сколько соединение
+    return getattr(conn, "_con", conn)
+
+
+class StatementRegistry:
+    def __init__(self):
+        self._queries: dict[str, str] = {}
+        # соединение с включенным кешем asyncpg -> имена запросов, уже выполнявшихся на нем
+        self._executed: WeakKeyDictionary[asyncpg.Connection, set[str]] = WeakKeyDictionary()
+
+        self._hits_counter = registry.counter("db.statements.hits")
+        self._misses_counter = registry.counter("db.statements.misses")
+        self._hit_rate_gauge = registry.gauge("db.statements.hit_rate")
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def register(
+        self,
+        name: str,
+        query: str,
+    ) -> str:
+        """Регистрирует запрос при импорте модуля, возвращает имя для fetch/fetchrow/fetchval/execute"""
+        if self._queries.get(name, query) != query:
+            raise ValueError(f"Statement {name} is already registered with another query")
+        self._queries[name] = query
+        return name
+
+    def query(
+        self,
+        name: str,
+    ) -> str:
+        return self._queries[name]
+
+    def track(
+        self,
+        conn: asyncpg.Connection,
+    ) -> None:
+        """Соединение из пула с кешем подготовленных запросов - на нем реестр считает попадания"""
+        self._executed.setdefault(_raw_connection(conn), set())
+
+    async def fetch(
+        self,
+        conn: asyncpg.Connection,
+        name: str,
+        *args: Any,  # noqa: ANN401
+    ) -> list[asyncpg.Record]:
+        return await conn.fetch(self._lookup(conn, name), *args)
+
+    async def fetchrow(
+        self,
+        conn: asyncpg.Connection,
+        name: str,
+        *args: Any,  # noqa: ANN401
+    ) -> asyncpg.Record | None:
+        return await conn.fetchrow(self._lookup(conn, name), *args)
+
+    async def fetchval(
+        self,
+        conn: asyncpg.Connection,
+        name: str,
+        *args: Any,  # noqa: ANN401
+    ) -> Any:  # noqa: ANN401
+        return await conn.fetchval(self._lookup(conn, name), *args)
+
+    async def execute(
+        self,
+        conn: asyncpg.Connection,
+        name: str,
+        *args: Any,  # noqa: ANN401
+    ) -> str:
+        return await conn.execute(self._lookup(conn, name), *args)
+
+    def _lookup(
+        self,
+        conn: asyncpg.Connection,
+        name: str,
+    ) -> str:
+        executed = self._executed.get(_raw_connection(conn))
+        if executed is not None and name in executed:
+            self._hits_counter.inc()
+        else:
+            # кеш выключен или запрос впервые на этом соединении - asyncpg подготовит его сейчас
+            self._misses_counter.inc()
+            if executed is not None:
+                executed.add(name)
+        total = self._hits_counter.value + self._misses_counter.value
+        self._hit_rate_gauge.set(self._hits_counter.value / total)
+        return self._queries[name]
+
+
+# общий реестр процесса
+statements = StatementRegistry()
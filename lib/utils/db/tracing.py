@@ -0,0 +1,184 @@
+"""
+Трассировка запросов соединения из пула: время, число строк и вызывающая функция по каждому запросу.
+Метрики копятся по отпечатку запроса (текст без литералов и лишних пробелов) - это метка fingerprint гистограмм
+db.query.duration_seconds и db.query.rows. Отпечатков помним не больше DB_QUERY_TRACE_MAX_FINGERPRINTS,
+запросы сверх лимита (например, собранные динамически) идут под отпечатком OVERFLOW_LABEL. Медленные запросы пишем в лог
+и часть из них прогоняем через EXPLAIN (ANALYZE, BUFFERS). Каждый запрос - отдельный span в транзакции APM
+"""
+
+from functools import lru_cache
+from hashlib import blake2b
+import logging
+import random
+import re
+import time
+from typing import Any
+
+import asyncpg
+
+import elasticapm
+from lib.utils.config.base import BaseConfig
+from lib.utils.metrics import COUNT_BUCKETS, OVERFLOW_LABEL, registry
+
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<!\$)\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+# EXPLAIN ANALYZE выполняет запрос - прогоняем через него только чтение
+_READ_ONLY_QUERY = re.compile(r"^\s*(SELECT|WITH)\b(?!.*\b(INSERT|UPDATE|DELETE)\b)", re.IGNORECASE | re.DOTALL)
+
+
+@lru_cache(maxsize=1024)
+def normalize_query(query: str) -> str:
+    query = _STRING_LITERAL.sub("?", query)
+    query = _NUMBER_LITERAL.sub("?", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+@lru_cache(maxsize=1024)
+def query_fingerprint(query: str) -> str:
+    return blake2b(normalize_query(query).encode(), digest_size=6).hexdigest()
+
+
+def _rows_from_status(status: str) -> int:
+    """Число строк из статуса execute: 'UPDATE 3', 'INSERT 0 1', 'SELECT 5'"""
+    count = status.rsplit(" ", 1)[-1]
+    return int(count) if count.isdigit() else 0
+
+
+class QueryTracer:
+    def __init__(
+        self,
+        config: BaseConfig,
+    ):
+        self.slow_query_seconds = config.DB_SLOW_QUERY_SECONDS
+        self.explain_sample_rate = config.DB_SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+        self.max_fingerprints = config.DB_QUERY_TRACE_MAX_FINGERPRINTS
+        # отпечаток -> нормализованный текст, чтобы было понятно, к какому запросу относятся метрики
+        self.statements: dict[str, str] = {}
+
+    async def trace(
+        self,
+        conn: asyncpg.Connection,
+        caller: str,
+        method: str,
+        query: str,
+        *args: Any,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> Any:  # noqa: ANN401
+        fingerprint = self._fingerprint(query)
+
+        with elasticapm.capture_span(
+            name=normalize_query(query)[:100],
+            span_type="db",
+            span_subtype="postgresql",
+            span_action="query",
+            extra={"db": {"type": "sql", "statement": query}},
+            labels={"caller": caller, "fingerprint": fingerprint},
+            leaf=True,
+        ):
+            started_at = time.perf_counter()
+            result = await getattr(conn, method)(query, *args, **kwargs)
+            duration = time.perf_counter() - started_at
+
+        rows = self._count_rows(method, result)
+        registry.histogram("db.query.duration_seconds", fingerprint=fingerprint).observe(duration)
+        registry.histogram("db.query.rows", buckets=COUNT_BUCKETS, fingerprint=fingerprint).observe(rows)
+
+        if duration >= self.slow_query_seconds:
+            await self._on_slow_query(conn, caller, fingerprint, query, args, duration, rows)
+        return result
+
+    def _fingerprint(
+        self,
+        query: str,
+    ) -> str:
+        fingerprint = query_fingerprint(query)
+        if fingerprint not in self.statements:
+            if len(self.statements) >= self.max_fingerprints:
+                return OVERFLOW_LABEL
+            self.statements[fingerprint] = normalize_query(query)
+        return fingerprint
+
+    @staticmethod
+    def _count_rows(
+        method: str,
+        result: Any,  # noqa: ANN401
+    ) -> int:
+        if method == "fetch":
+            return len(result)
+        if method == "execute":
+            return _rows_from_status(result)
+        if method == "executemany":
+            return 0
+        return int(result is not None)
+
+    async def _on_slow_query(
+        self,
+        conn: asyncpg.Connection,
+        caller: str,
+        fingerprint: str,
+        query: str,
+        args: tuple,
+        duration: float,
+        rows: int,
+    ) -> None:
+        registry.counter("db.query.slow").inc()
+        logger.warning(
+            "Slow query %s from %s: %.3fs, %s rows: %s",
+            fingerprint,
+            caller,
+            duration,
+            rows,
+            normalize_query(query),
+        )
+
+        if not self.explain_sample_rate or random.random() >= self.explain_sample_rate:  # noqa: S311
+            return
+        if not _READ_ONLY_QUERY.match(query) or conn.is_in_transaction():
+            # в транзакции соединение может быть уже в ошибке, а лишний EXPLAIN держит блокировки
+            return
+
+        try:
+            plan = await conn.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {query}", *args)
+        except asyncpg.PostgresError as e:
+            logger.warning("Failed to explain slow query %s: %s", fingerprint, e)
+            return
+        logger.warning("Plan of slow query %s:\n%s", fingerprint, "\n".join(row[0] for row in plan))
+
+
+class TracedConnection:
+    """Прокси над asyncpg.Connection: запросы идут через QueryTracer, остальное - напрямую в соединение"""
+
+    def __init__(
+        self,
+        conn: asyncpg.Connection,
+        tracer: QueryTracer,
+        caller: str,
+    ):
+        self._conn = conn
+        self._tracer = tracer
+        self._caller = caller
+
+    def __getattr__(
+        self,
+        name: str,
+    ) -> Any:  # noqa: ANN401
+        return getattr(self._conn, name)
+
+    async def execute(self, query: str, *args: Any, **kwargs: Any) -> str:  # noqa: ANN401
+        return await self._tracer.trace(self._conn, self._caller, "execute", query, *args, **kwargs)
+
+    async def executemany(self, query: str, *args: Any, **kwargs: Any) -> None:  # noqa: ANN401
+        return await self._tracer.trace(self._conn, self._caller, "executemany", query, *args, **kwargs)
+
+    async def fetch(self, query: str, *args: Any, **kwargs: Any) -> list[asyncpg.Record]:  # noqa: ANN401
+        return await self._tracer.trace(self._conn, self._caller, "fetch", query, *args, **kwargs)
+
+    async def fetchrow(self, query: str, *args: Any, **kwargs: Any) -> asyncpg.Record | None:  # noqa: ANN401
+        return await self._tracer.trace(self._conn, self._caller, "fetchrow", query, *args, **kwargs)
+
+    async def fetchval(self, query: str, *args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+        return await self._tracer.trace(self._conn, self._caller, "fetchval", query, *args, **kwargs)
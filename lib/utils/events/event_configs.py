@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+from lib.utils.db.pool import Database
+from lib.utils.events.event_types import EventType
+from lib.utils.metrics import registry
+from lib.utils.schemas.events import ActionConfigData
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventConfigRegistry:
+    """
+    In-process кеш настроек обработки событий (таблица events), ключ - EventType.
+    Настройки меняются только из админки: триггер на events шлет NOTIFY, по нему кеш перечитывается
+    целиком при следующем обращении - см. on_events_notification. На обработку события запросов в базу нет
+    """
+
+    def __init__(
+        self,
+        db: Database,
+    ):
+        self.db = db
+        self._configs: dict[EventType, list[ActionConfigData]] | None = None
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+        self._loads_counter = registry.counter("events.configs.loads")
+
+    def invalidate(self) -> None:
+        """Помечаем кеш устаревшим, следующий запрос перечитает его из базы"""
+        self._stale = True
+
+    def on_events_notification(
+        self,
+        payload: str | None,
+    ) -> None:
+        """Колбек для NotificationListener (None - после переподключения, уведомления могли потеряться)"""
+        logger.info("Event configs changed, invalidating cache")
+        self.invalidate()
+
+    async def get(
+        self,
+        event_type: EventType,
+    ) -> list[ActionConfigData] | None:
+        """Действия для события, None - если события нет в таблице events"""
+        configs = await self.get_all()
+        return configs.get(event_type)
+
+    async def get_all(self) -> dict[EventType, list[ActionConfigData]]:
+        if self._configs is not None and not self._stale:
+            return self._configs
+
+        async with self._lock:
+            if self._configs is None or self._stale:
+                # сбрасываем флаг до загрузки, чтобы не потерять инвалидацию, пришедшую во время загрузки
+                self._stale = False
+                try:
+                    self._configs = await self._load()
+                except Exception:
+                    self._stale = True
+                    raise
+
+        return self._configs
+
+    async def _load(self) -> dict[EventType, list[ActionConfigData]]:
+        # читаем с primary: реплика сразу после NOTIFY может отдать старые настройки, и кеш останется устаревшим
+        async with self.db.connection() as conn:
+            rows = await conn.fetch("""SELECT type, processing FROM events""")
+
+        configs = {}
+        for row in rows:
+            try:
+                event_type = EventType(row["type"])
+            except ValueError:
+                logger.warning("Unknown event type %s in events table", row["type"])
+                continue
+            # processing - jsonb, кодек пула уже вернул список
+            configs[event_type] = [
+                ActionConfigData(
+                    type=item["type"],
+                    conditions=item["conditions"],
+                    receiver=item["receiver"],
+                )
+                for item in row["processing"]
+            ]
+
+        self._loads_counter.inc()
+        logger.info("Loaded event configs: %s", list(configs))
+        return configs
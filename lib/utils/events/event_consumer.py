@@ -1,17 +1,65 @@
-import json
+import asyncio
+from collections import deque
+from contextlib import suppress
 import logging
 
-from aiokafka import AIOKafkaConsumer
+from aiokafka import AIOKafkaConsumer, ConsumerRecord, TopicPartition
 from lib.utils.config.base import BaseConfig
+from lib.utils.db.listener import NotificationListener
 from lib.utils.db.pool import Database
+from lib.utils.events.event_configs import EventConfigRegistry
 from lib.utils.events.event_processor import EventProcessor
+from lib.utils.json import loads
+from lib.utils.metrics import registry
+from lib.utils.models import EVENTS_CHANGED_CHANNEL
 from lib.utils.schemas.events import EventMessage
 
 
 logger = logging.getLogger(__name__)
 
 
+def _deserialize_key(key: bytes | None) -> str | None:
+    return None if key is None else key.decode()
+
+
+class PartitionOffsets:
+    """
+    Оффсеты партиции, отданные в обработку. События разных ключей завершаются в любом порядке,
+    коммитить можно только до первого еще не обработанного
+    """
+
+    def __init__(self):
+        self._dispatched: deque[int] = deque()
+        self._done: set[int] = set()
+        # следующий оффсет после последнего непрерывно обработанного
+        self.committable: int | None = None
+
+    def add(
+        self,
+        offset: int,
+    ) -> None:
+        self._dispatched.append(offset)
+
+    def done(
+        self,
+        offset: int,
+    ) -> None:
+        self._done.add(offset)
+        while self._dispatched and self._dispatched[0] in self._done:
+            finished = self._dispatched.popleft()
+            self._done.discard(finished)
+            self.committable = finished + 1
+
+
 class EventConsumer:
+    """
+    Сообщения забираются пачками (getmany) и раскладываются по очередям ключей (ключ сообщения, иначе user_id
+    из payload): у каждого ключа свой воркер, события ключа идут строго по порядку, разные ключи - параллельно,
+    не больше EVENTS_CONSUMER_CONCURRENCY одновременно. Воркер живет, пока в его очереди есть события.
+    Чтение не ждет обработки пачки, медленный ключ не держит остальные. Оффсеты коммитим вручную
+    после каждого чтения: по каждой партиции - до первого необработанного события
+    """
+
     def __init__(
         self,
         config: BaseConfig,
@@ -21,49 +69,189 @@ class EventConsumer:
         self.consumer = None
         self.running = False
         self.db = None
+        self.event_configs: EventConfigRegistry | None = None
+        self.listener: NotificationListener | None = None
+
+        self._semaphore = asyncio.Semaphore(config.EVENTS_CONSUMER_CONCURRENCY)
+        self._queues: dict[str, deque[tuple[PartitionOffsets, int, EventMessage]]] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self._offsets: dict[TopicPartition, PartitionOffsets] = {}
+        self._committed: dict[TopicPartition, int] = {}
+        # забрано из Kafka, но еще не обработано
+        self._pending = 0
+        self._progress = asyncio.Event()
+
+        self._processed_counter = registry.counter("events.consumer.processed")
+        self._lag_gauge = registry.gauge("events.consumer.lag")
+        self._pending_gauge = registry.gauge("events.consumer.pending")
+        self._process_histogram = registry.histogram("events.consumer.process_seconds")
 
     async def start_consuming(self) -> None:
-        """Запуск потребителя событий"""
+        """Запуск потребителя событий. Пул соединений один на все время работы, закрывается в stop"""
         db = Database(self.config)
         await db.connect()
         self.db = db
 
+        # настройки событий держим в памяти, правки в админке сбрасывают кеш через NOTIFY.
+        # Подписываемся до первой загрузки, чтобы не пропустить изменения между ними
+        self.event_configs = EventConfigRegistry(db)
+        self.listener = NotificationListener(self.config)
+        self.listener.subscribe(EVENTS_CHANGED_CHANNEL, self.event_configs.on_events_notification)
+        await self.listener.start()
+        await self.event_configs.get_all()
+
         logger.info("Starting event consumer...")
 
         self.consumer = AIOKafkaConsumer(
             self.config.KAFKA_TOPIC,
             bootstrap_servers=self.config.KAFKA_BOOTSTRAP_SERVERS,
             group_id="event-processor",
-            value_deserializer=lambda m: json.loads(m.decode("utf-8")),
+            key_deserializer=_deserialize_key,
+            value_deserializer=loads,
             auto_offset_reset="earliest",
+            enable_auto_commit=False,
         )
 
         await self.consumer.start()
         self.running = True
 
         try:
-            async for message in self.consumer:
-                if not self.running:
-                    break
+            while self.running:
+                self._progress.clear()
+                if self._pending >= self.config.EVENTS_CONSUMER_MAX_PENDING:
+                    # воркеры не успевают - не читаем дальше, пока что-нибудь не обработается
+                    with suppress(TimeoutError):
+                        await asyncio.wait_for(
+                            self._progress.wait(),
+                            timeout=self.config.EVENTS_CONSUMER_POLL_TIMEOUT_MS / 1000,
+                        )
+                else:
+                    batches = await self.consumer.getmany(
+                        timeout_ms=self.config.EVENTS_CONSUMER_POLL_TIMEOUT_MS,
+                        max_records=self.config.EVENTS_CONSUMER_MAX_RECORDS,
+                    )
+                    if batches:
+                        self.dispatch_batch(batches)
+                await self.commit_offsets()
+                await self._report_lag()
+
+            # остановка: дообрабатываем уже забранное и коммитим
+            await self.drain()
+            await self.commit_offsets()
+
+        except Exception as e:
+            logger.error("Consumer error: %s", e)
+        finally:
+            await self.stop()
 
+    def dispatch_batch(
+        self,
+        batches: dict[TopicPartition, list[ConsumerRecord]],
+    ) -> None:
+        """Раскладывает пачку getmany по очередям ключей, не дожидаясь обработки"""
+        for tp, messages in batches.items():
+            partition = self._offsets.setdefault(tp, PartitionOffsets())
+            for message in messages:
+                partition.add(message.offset)
+                self._pending += 1
                 try:
                     message_value: dict = message.value
-                    print("STR51", type(message_value), message_value)
                     event_message = EventMessage(
                         id=message_value["id"],
                         event_type=message_value["event_type"],
                         payload=message_value["payload"],
                     )
-                    await self.process_message(event_message)
-                    logger.info("Processed event: %s", event_message.event_type)
-
                 except Exception as e:
                     logger.error("Error processing message: %s", e)
+                    self._complete(partition, message.offset)
+                    continue
+
+                key = self._ordering_key(message, event_message)
+                queue = self._queues.get(key)
+                if queue is None:
+                    queue = self._queues[key] = deque()
+                    self._workers[key] = asyncio.create_task(self._run_worker(key, queue))
+                queue.append((partition, message.offset, event_message))
+        self._pending_gauge.set(self._pending)
 
+    async def drain(self) -> None:
+        """Дожидается обработки всего, что уже разложено по очередям"""
+        while self._workers:
+            await asyncio.gather(*self._workers.values())
+
+    async def commit_offsets(self) -> None:
+        """Коммитит по каждой назначенной партиции оффсет до первого необработанного события"""
+        assignment = self.consumer.assignment()
+        offsets: dict[TopicPartition, int] = {}
+        for tp, partition in list(self._offsets.items()):
+            if tp not in assignment:
+                # партицию забрали при ребалансе - необработанное перечитает новый владелец
+                del self._offsets[tp]
+                self._committed.pop(tp, None)
+                continue
+            if partition.committable is not None and partition.committable != self._committed.get(tp):
+                offsets[tp] = partition.committable
+        if not offsets:
+            return
+        try:
+            await self.consumer.commit(offsets)
         except Exception as e:
-            logger.error("Consumer error: %s", e)
-        finally:
-            await self.stop()
+            # повторим при следующем чтении, события обработаны - в худшем случае их перечитают
+            logger.error("Failed to commit offsets: %s", e)
+            return
+        self._committed.update(offsets)
+
+    async def _run_worker(
+        self,
+        key: str,
+        queue: deque[tuple[PartitionOffsets, int, EventMessage]],
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        while queue:
+            partition, offset, event_message = queue.popleft()
+            async with self._semaphore:
+                started = loop.time()
+                await self.process_message(event_message)
+                self._process_histogram.observe(loop.time() - started)
+            self._processed_counter.inc()
+            logger.info("Processed event: %s", event_message.event_type)
+            self._complete(partition, offset)
+        # между проверкой очереди и удалением нет await - dispatch_batch не положит событие в удаленную очередь
+        del self._queues[key]
+        del self._workers[key]
+
+    def _complete(
+        self,
+        partition: PartitionOffsets,
+        offset: int,
+    ) -> None:
+        partition.done(offset)
+        self._pending -= 1
+        self._pending_gauge.set(self._pending)
+        self._progress.set()
+
+    @staticmethod
+    def _ordering_key(
+        message: ConsumerRecord,
+        event_message: EventMessage,
+    ) -> str:
+        if message.key is not None:
+            return f"key:{message.key}"
+        user_id = event_message.payload.get("user_id")
+        if user_id is not None:
+            return f"user:{user_id}"
+        # порядок не важен - каждое событие само по себе
+        return f"event:{event_message.id}"
+
+    async def _report_lag(self) -> None:
+        """Отставание группы: сколько сообщений в назначенных партициях еще не прочитано"""
+        lag = 0
+        for tp in self.consumer.assignment():
+            highwater = self.consumer.highwater(tp)
+            if highwater is not None:
+                lag += max(highwater - await self.consumer.position(tp), 0)
+        self._lag_gauge.set(lag)
+        logger.debug("Consumer lag: %s", lag)
 
     async def process_message(
         self,
@@ -73,6 +261,7 @@ class EventConsumer:
         processor = EventProcessor(
             db=self.db,
             config=self.config,
+            event_configs=self.event_configs,
         )
 
         try:
@@ -80,11 +269,21 @@ class EventConsumer:
 
         except Exception as e:
             logger.error("Error processing event: %s", e)
-        finally:
-            await self.db.disconnect()
+
+    def request_stop(self) -> None:
+        """Просит цикл чтения завершиться: уже забранные события дообрабатываются и коммитятся, затем stop"""
+        logger.info("Event consumer stop requested")
+        self.running = False
 
     async def stop(self):
         """Остановка потребителя"""
         self.running = False
         if self.consumer:
             await self.consumer.stop()
+            self.consumer = None
+        if self.listener:
+            await self.listener.stop()
+            self.listener = None
+        if self.db:
+            await self.db.disconnect()
+            self.db = None
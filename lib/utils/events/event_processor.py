@@ -1,10 +1,9 @@
-import json
 import logging
-from uuid import UUID
 
 from lib.utils.config.base import BaseConfig
 from lib.utils.db.pool import Database
 from lib.utils.events.actions import ACTION_REGISTRY
+from lib.utils.events.event_configs import EventConfigRegistry
 from lib.utils.events.event_types import EventProcessingState, EventType
 from lib.utils.schemas.events import ActionConfigData, EventMessage
 
@@ -17,9 +16,11 @@ class EventProcessor:
         self,
         db: Database,
         config: BaseConfig,
+        event_configs: EventConfigRegistry,
     ):
         self.db = db
         self.config = config
+        self.event_configs = event_configs
 
     async def process_event(
         self,
@@ -30,26 +31,13 @@ class EventProcessor:
         print("STR24", event_type, payload)
 
         await self._update_processing_state(
-            event_id=event_message.id,
+            event_message=event_message,
             state=EventProcessingState.IN_PROGRESS,
         )
 
-        async with self.db.connection() as conn:
-            event_config = await conn.fetchrow(
-                """select processing::jsonb from events where type = $1""",
-                event_type,
-            )
-
-            processing: list[ActionConfigData] = [
-                ActionConfigData(
-                    type=item["type"],
-                    conditions=item["conditions"],
-                    receiver=item["receiver"],
-                )
-                for item in json.loads(event_config["processing"])
-            ]
-
-        if not event_config:
+        # настройки события берем из кеша, в базу не ходим
+        processing: list[ActionConfigData] | None = await self.event_configs.get(event_type)
+        if processing is None:
             raise ValueError(f"Event config not found for {event_type}")
 
         try:
@@ -62,13 +50,13 @@ class EventProcessor:
         except Exception:
             logger.error("Failed to process %s", event_type)
             await self._update_processing_state(
-                event_id=event_message.id,
+                event_message=event_message,
                 state=EventProcessingState.FAILED,
             )
             return
 
         await self._update_processing_state(
-            event_id=event_message.id,
+            event_message=event_message,
             state=EventProcessingState.SUCCESS,
         )
 
@@ -98,16 +86,23 @@ class EventProcessor:
 
     async def _update_processing_state(
         self,
-        event_id: UUID,
+        event_message: EventMessage,
         state: EventProcessingState,
     ) -> None:
+        """
+        Сендер пишет event_log после отправки в Kafka, строки может еще не быть - тогда создаем ее сами,
+        поздний INSERT сендера ее не перезапишет
+        """
         async with self.db.connection() as connection:
             await connection.execute(
                 """
-                UPDATE event_log
-                SET state = $2
-                WHERE id = $1
+                INSERT INTO event_log
+                (id, type, state, payload)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (id) DO UPDATE SET state = EXCLUDED.state
                 """,
-                event_id,
+                event_message.id,
+                event_message.event_type,
                 state,
+                event_message.payload,
             )
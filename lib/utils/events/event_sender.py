@@ -1,31 +1,53 @@
-import json
+import asyncio
+from collections.abc import Callable
+import logging
+import time
+
+import asyncpg
 
 from aiokafka import AIOKafkaProducer
 from lib.utils.config.base import BaseConfig
 from lib.utils.db.pool import Database
 from lib.utils.events.event_types import EventProcessingState, EventType
+from lib.utils.events.outbox import enqueue_event
+from lib.utils.events.producer import create_producer, message_key
+from lib.utils.metrics import registry
 from lib.utils.schemas.events import EventMessage
 
 
+logger = logging.getLogger(__name__)
+
+# колбек доставки: сообщение и ошибка (None - брокер подтвердил запись)
+DeliveryCallback = Callable[[EventMessage, BaseException | None], None]
+
+
 class EventSender:
     def __init__(
         self,
         config: BaseConfig,
         db: Database,
+        producer: AIOKafkaProducer | None = None,
     ):
+        """producer - уже запущенный продюсер, по умолчанию создается при первой отправке"""
         self.config = config
         self.db = db
 
-        self._producer = None
-        self._initialized = False
+        self._producer = producer
+        self._initialized = producer is not None
+        # отправлено без ожидания, подтверждения брокера еще нет
+        self.in_flight = 0
+        # записи event_log после send_event_nowait, еще не дошедшие до базы
+        self._log_tasks: set[asyncio.Task] = set()
+
+        self._in_flight_gauge = registry.gauge("events.producer.in_flight")
+        self._delivered_counter = registry.counter("events.producer.delivered")
+        self._failed_counter = registry.counter("events.producer.failed")
+        self._delivery_histogram = registry.histogram("events.producer.delivery_seconds")
 
     async def _ensure_initialized(self) -> None:
         """Инициализирует producer если еще не инициализирован"""
         if not self._initialized:
-            self._producer = AIOKafkaProducer(
-                bootstrap_servers=self.config.KAFKA_BOOTSTRAP_SERVERS,
-                value_serializer=lambda v: json.dumps(v).encode("utf-8"),
-            )
+            self._producer = create_producer(self.config)
             await self._producer.start()
             self._initialized = True
 
@@ -34,7 +56,12 @@ class EventSender:
         event_type: EventType,
         payload: dict,
     ) -> None:
-        """Отправка события в Kafka"""
+        """Отправка события в Kafka, в режиме outbox - запись в event_log для OutboxRelay"""
+        if self.config.EVENTS_OUTBOX_ENABLED:
+            async with self.db.connection() as connection:
+                await enqueue_event(connection=connection, event_type=event_type, payload=payload)
+            return
+
         await self._ensure_initialized()
 
         message = EventMessage(
@@ -44,34 +71,123 @@ class EventSender:
         topic = self.config.KAFKA_TOPIC
 
         try:
-            await self._producer.send_and_wait(topic, message.model_dump(mode="json"))
+            await self._producer.send_and_wait(topic, message.model_dump(mode="json"), key=message_key(payload))
             await self._log_event(message=message, payload=payload)
         except Exception as e:
-            # При ошибке сбрасываем состояние и пробуем переинициализировать при следующем вызове
-            self._initialized = False
-            if self._producer:
-                await self._producer.stop()
-                self._producer = None
+            await self._reset_producer()
+            raise Exception(f"Failed to send event to Kafka: {e}") from e
+
+    async def send_event_nowait(
+        self,
+        event_type: EventType,
+        payload: dict,
+        on_delivery: DeliveryCallback | None = None,
+    ) -> asyncio.Future:
+        """
+        Отправка без ожидания брокера и базы: сообщение уходит в буфер продюсера и отправляется пачкой
+        (linger/max batch size из конфига). Возвращает future подтверждения записи, результат доставки
+        также получает on_delivery. Строка event_log пишется фоновой задачей после send, вызывающий ее
+        не ждет; консьюмер может успеть обработать событие раньше - его состояние INSERT не перетирает.
+        Если send упал сразу (буфер полон, нет метаданных топика), event_log не пишется, продюсер
+        пересоздается при следующей отправке. Ошибки доставки после возврата только логируются
+        и приходят в future/on_delivery, flush дожидается и отправки, и записей event_log
+        """
+        await self._ensure_initialized()
+
+        message = EventMessage(
+            event_type=event_type,
+            payload=payload,
+        )
+
+        try:
+            # send ждет, только если буфер продюсера заполнен
+            future: asyncio.Future = await self._producer.send(
+                self.config.KAFKA_TOPIC,
+                message.model_dump(mode="json"),
+                key=message_key(payload),
+            )
+        except Exception as e:
+            self._failed_counter.inc()
+            await self._reset_producer()
             raise Exception(f"Failed to send event to Kafka: {e}") from e
+        self._schedule_log_event(message=message, payload=payload)
+        self._set_in_flight(self.in_flight + 1)
+        sent_at = time.perf_counter()
+
+        def delivered(done: asyncio.Future) -> None:
+            self._set_in_flight(self.in_flight - 1)
+            error: BaseException | None = asyncio.CancelledError() if done.cancelled() else done.exception()
+            if error is None:
+                self._delivered_counter.inc()
+                self._delivery_histogram.observe(time.perf_counter() - sent_at)
+            else:
+                self._failed_counter.inc()
+                logger.error("Failed to deliver event %s to Kafka: %s", message.id, error)
+            if on_delivery is not None:
+                on_delivery(message, error)
+
+        future.add_done_callback(delivered)
+        return future
+
+    async def flush(self) -> None:
+        """Дожидается отправки всего, что лежит в буфере продюсера, и записи этих событий в event_log"""
+        if self._initialized:
+            await self._producer.flush()
+        if self._log_tasks:
+            await asyncio.gather(*self._log_tasks, return_exceptions=True)
+
+    async def _reset_producer(self) -> None:
+        """При ошибке сбрасываем состояние и пробуем переинициализировать при следующем вызове"""
+        self._initialized = False
+        if self._producer:
+            await self._producer.stop()
+            self._producer = None
+
+    def _set_in_flight(
+        self,
+        value: int,
+    ) -> None:
+        self.in_flight = value
+        self._in_flight_gauge.set(value)
 
     async def _log_event(
         self,
         message: EventMessage,
         payload: dict,
     ) -> None:
+        """Пишется после отправки: строку мог уже создать консьюмер, обработавший событие"""
         async with self.db.connection() as connection:
             await connection.execute(
                 """
                 INSERT INTO event_log
                 (id, type, state, payload)
                 VALUES ($1, $2, $3, $4)
+                ON CONFLICT (id) DO NOTHING
                 """,
                 message.id,
                 message.event_type,
                 EventProcessingState.SENT,
-                json.dumps(payload),
+                # кодек jsonb пула сам сериализует словарь, json.dumps здесь писал в базу json-строку
+                payload,
             )
 
+    def _schedule_log_event(
+        self,
+        message: EventMessage,
+        payload: dict,
+    ) -> None:
+        task = asyncio.create_task(self._log_event(message=message, payload=payload))
+        self._log_tasks.add(task)
+        task.add_done_callback(self._log_event_done)
+
+    def _log_event_done(
+        self,
+        task: asyncio.Task,
+    ) -> None:
+        self._log_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Failed to write event_log: %s", task.exception())
+
 
 # глобальный инстанс сендера
 _event_sender: EventSender | None = None
@@ -95,6 +211,18 @@ async def create_event(
     event_type: EventType,
     payload: dict,
     config: BaseConfig,
+    connection: asyncpg.Connection | None = None,
 ) -> None:
+    """
+    connection - соединение вызывающего: в режиме outbox событие пишется на нем, в его транзакции.
+    Без outbox игнорируется
+    """
+    if config.EVENTS_OUTBOX_ENABLED and connection is not None:
+        await enqueue_event(connection=connection, event_type=event_type, payload=payload)
+        return
+
     sender: EventSender = await get_event_sender(config)
+    if config.EVENTS_FIRE_AND_FORGET and not config.EVENTS_OUTBOX_ENABLED:
+        await sender.send_event_nowait(event_type=event_type, payload=payload)
+        return
     await sender.send_event(event_type=event_type, payload=payload)
@@ -13,6 +13,8 @@ class EventType(StrEnumChoices):
 
 
 class EventProcessingState(StrEnum):
+    # в outbox, еще не отправлено в Kafka
+    PENDING = "pending"
     SENT = "sent"
     IN_PROGRESS = "in_progress"
     SUCCESS = "success"
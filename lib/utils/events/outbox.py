@@ -0,0 +1,153 @@
+"""
+Transactional outbox для событий.
+Продюсер пишет событие в event_log (state pending) на своем соединении - в одной транзакции с бизнес-изменениями,
+вместо похода в Kafka. OutboxRelay в фоне забирает pending-события пачками (FOR UPDATE SKIP LOCKED - несколько
+релеев не отправят одно событие дважды), отправляет их в Kafka и переводит в sent.
+Доставка at-least-once: если упасть между отправкой и коммитом, пачка уйдет повторно
+"""
+
+import asyncio
+import logging
+
+import asyncpg
+
+from aiokafka import AIOKafkaProducer
+from lib.utils.config.base import BaseConfig
+from lib.utils.db.pool import Database
+from lib.utils.events.event_types import EventProcessingState, EventType
+from lib.utils.events.producer import create_producer, message_key
+from lib.utils.metrics import COUNT_BUCKETS, registry
+from lib.utils.schemas.events import EventMessage
+
+
+logger = logging.getLogger(__name__)
+
+# created_at по clock_timestamp: у событий одной транзакции NOW() одинаковый, а релей отправляет по порядку
+INSERT_EVENT_LOG = """
+    INSERT INTO event_log
+    (id, type, state, payload, created_at)
+    VALUES ($1, $2, $3, $4, clock_timestamp())
+"""
+
+SELECT_PENDING_EVENTS = """
+    SELECT id, type, payload
+    FROM event_log
+    WHERE state = $1
+    ORDER BY created_at
+    LIMIT $2
+    FOR UPDATE SKIP LOCKED
+"""
+
+MARK_EVENTS_SENT = """
+    UPDATE event_log
+    SET state = $2
+    WHERE id = ANY($1::uuid[])
+"""
+
+
+async def enqueue_event(
+    connection: asyncpg.Connection,
+    event_type: EventType,
+    payload: dict,
+) -> EventMessage:
+    """Кладет событие в outbox на соединении вызывающего: если его транзакция откатится, события не будет"""
+    message = EventMessage(
+        event_type=event_type,
+        payload=payload,
+    )
+    await connection.execute(
+        INSERT_EVENT_LOG,
+        message.id,
+        message.event_type,
+        EventProcessingState.PENDING,
+        message.payload,
+    )
+    return message
+
+
+class OutboxRelay:
+    def __init__(
+        self,
+        config: BaseConfig,
+        db: Database,
+        producer: AIOKafkaProducer | None = None,
+    ):
+        """producer - уже запущенный продюсер; по умолчанию релей создает и останавливает свой"""
+        self.config = config
+        self.db = db
+        self.batch_size: int = config.EVENTS_OUTBOX_BATCH_SIZE
+        self.linger: float = config.EVENTS_OUTBOX_LINGER_SECONDS
+
+        self._producer = producer
+        self._owns_producer = producer is None
+        self._task: asyncio.Task | None = None
+
+        self._published_counter = registry.counter("events.outbox.published")
+        self._errors_counter = registry.counter("events.outbox.errors")
+        self._batch_histogram = registry.histogram("events.outbox.batch_size", buckets=COUNT_BUCKETS)
+
+    async def start(self) -> None:
+        if self._producer is None:
+            self._producer = create_producer(self.config)
+        if self._owns_producer:
+            await self._producer.start()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Outbox relay started, batch size %s, linger %s s", self.batch_size, self.linger)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._owns_producer and self._producer is not None:
+            await self._producer.stop()
+            self._producer = None
+        logger.info("Outbox relay stopped")
+
+    async def relay_once(self) -> int:
+        """Отправляет одну пачку pending-событий, возвращает их число"""
+        async with self.db.transaction() as connection:
+            rows = await connection.fetch(
+                SELECT_PENDING_EVENTS,
+                EventProcessingState.PENDING,
+                self.batch_size,
+            )
+            if not rows:
+                return 0
+
+            # send только кладет сообщение в буфер продюсера, ждем подтверждения всей пачки разом
+            futures = [
+                await self._producer.send(
+                    self.config.KAFKA_TOPIC,
+                    EventMessage(id=row["id"], event_type=row["type"], payload=row["payload"]).model_dump(mode="json"),
+                    key=message_key(row["payload"]),
+                )
+                for row in rows
+            ]
+            await asyncio.gather(*futures)
+
+            await connection.execute(
+                MARK_EVENTS_SENT,
+                [row["id"] for row in rows],
+                EventProcessingState.SENT,
+            )
+
+        self._published_counter.inc(len(rows))
+        self._batch_histogram.observe(len(rows))
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                published = await self.relay_once()
+            except Exception as e:
+                self._errors_counter.inc()
+                logger.error("Outbox relay error: %s", e)
+                published = 0
+
+            # полная пачка - в outbox, скорее всего, есть еще, забираем сразу
+            if published < self.batch_size:
+                await asyncio.sleep(self.linger)
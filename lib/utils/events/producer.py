@@ -0,0 +1,67 @@
+import logging
+
+from aiokafka import AIOKafkaProducer, codec
+from lib.utils.config.base import BaseConfig
+from lib.utils.json import dumps_bytes
+
+
+logger = logging.getLogger(__name__)
+
+# сжатие по умолчанию в режиме fire-and-forget: без ожидания брокера сообщения копятся в пачки
+FIRE_AND_FORGET_COMPRESSION = "lz4"
+
+# кодек aiokafka есть, только если установлена его библиотека (lz4, zstandard, python-snappy)
+COMPRESSION_CODECS = {
+    "gzip": codec.has_gzip,
+    "lz4": codec.has_lz4,
+    "zstd": codec.has_zstd,
+    "snappy": codec.has_snappy,
+}
+
+
+def message_key(payload: dict) -> str | None:
+    """
+    Ключ сообщения - id юзера: события юзера попадают в одну партицию, и консьюмер обрабатывает их по порядку.
+    Без user_id ключа нет - партицию выбирает продюсер, порядок не важен
+    """
+    user_id = payload.get("user_id")
+    return None if user_id is None else str(user_id)
+
+
+def _serialize_key(key: str) -> bytes:
+    return key.encode()
+
+
+def compression_type(config: BaseConfig) -> str | None:
+    """
+    Сжатие из конфига, по умолчанию lz4 только в режиме fire-and-forget: с send_and_wait пачка - одно
+    сообщение, сжимать его - лишняя работа на каждой отправке.
+    Если библиотеки кодека нет - без сжатия, а не падение продюсера на старте
+    """
+    compression: str = config.KAFKA_PRODUCER_COMPRESSION
+    if not compression and config.EVENTS_FIRE_AND_FORGET:
+        compression = FIRE_AND_FORGET_COMPRESSION
+    if not compression:
+        return None
+    has_codec = COMPRESSION_CODECS.get(compression)
+    if has_codec is None:
+        raise ValueError(f"Unknown Kafka compression type: {compression}")
+    if not has_codec():
+        logger.warning("Kafka compression %s is not available, sending uncompressed", compression)
+        return None
+    return compression
+
+
+def create_producer(config: BaseConfig) -> AIOKafkaProducer:
+    """
+    Продюсер событий: сообщения копятся в пачки по партициям до max_batch_size байт
+    или linger_ms миллисекунд, пачка сжимается целиком
+    """
+    return AIOKafkaProducer(
+        bootstrap_servers=config.KAFKA_BOOTSTRAP_SERVERS,
+        key_serializer=_serialize_key,
+        value_serializer=dumps_bytes,
+        linger_ms=config.KAFKA_PRODUCER_LINGER_MS,
+        max_batch_size=config.KAFKA_PRODUCER_MAX_BATCH_SIZE,
+        compression_type=compression_type(config),
+    )
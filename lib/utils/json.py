@@ -0,0 +1,88 @@
+"""
+JSON для кодека jsonb пула и сериализации событий.
+Если установлен orjson - используем его (в разы быстрее на dumps/loads), иначе stdlib json.
+Поведение совпадает со stdlib в том, что нам важно: не-строковые ключи словарей превращаются в строки
+"""
+
+import json
+import logging
+
+import asyncpg
+
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# версия бинарного формата jsonb в протоколе Postgres - первый байт перед текстом json
+JSONB_BINARY_VERSION = b"\x01"
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps_bytes(value: object) -> bytes:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps(value: object) -> str:
+        return dumps_bytes(value).decode()
+
+    loads = orjson.loads
+
+else:
+    BACKEND = "json"
+
+    def dumps_bytes(value: object) -> bytes:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def dumps(value: object) -> str:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+    loads = json.loads
+
+
+def _encode_jsonb_binary(value: object) -> bytes:
+    return JSONB_BINARY_VERSION + dumps_bytes(value)
+
+
+def _decode_jsonb_binary(data: bytes) -> object:
+    if data[:1] != JSONB_BINARY_VERSION:
+        raise ValueError(f"Unsupported jsonb binary format version: {data[:1]!r}")
+    return loads(data[1:])
+
+
+async def set_jsonb_codec(
+    conn: asyncpg.Connection,
+    binary: bool = False,
+) -> None:
+    """
+    Кодек jsonb для соединения asyncpg: Python-объекты на входе и на выходе.
+    binary - бинарный формат протокола: без текстового экранирования, orjson сразу отдает bytes
+    """
+    if binary:
+        await conn.set_type_codec(
+            "jsonb",
+            encoder=_encode_jsonb_binary,
+            decoder=_decode_jsonb_binary,
+            schema="pg_catalog",
+            format="binary",
+        )
+    else:
+        await conn.set_type_codec(
+            "jsonb",
+            encoder=dumps,
+            decoder=loads,
+            schema="pg_catalog",
+        )
+
+
+__all__ = [
+    "BACKEND",
+    "dumps",
+    "dumps_bytes",
+    "loads",
+    "set_jsonb_codec",
+]
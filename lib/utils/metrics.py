@@ -0,0 +1,244 @@
+"""
+Простой in-process реестр метрик сервиса: счетчики, текущие значения и гистограммы с бакетами.
+У метрики могут быть метки (registry.histogram("db.pool.in_use_seconds", caller=caller)) - изменчивое
+значение кладем в метку, а не в имя. Число наборов меток на одну метрику ограничено MAX_SERIES,
+все сверх лимита попадают в одну серию со значениями меток OVERFLOW_LABEL.
+Снимок всех метрик - registry.snapshot(), текстовый формат Prometheus - registry.render_prometheus().
+API отдает его ручкой /metrics, все сервисы пишут снимок в лог раз в METRICS_REPORT_INTERVAL_SECONDS (MetricsReporter)
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+import re
+import threading
+
+from lib.utils.json import dumps
+
+
+logger = logging.getLogger(__name__)
+
+# границы бакетов для времени в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# для количеств: строк, сообщений в пачке
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+MAX_SERIES = 200
+OVERFLOW_LABEL = "_other"
+
+Labels = tuple[tuple[str, str], ...]
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_:]")
+
+
+class Counter:
+    def __init__(self, name: str, labels: Labels = ()):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> int:
+        return self.value
+
+
+class Gauge:
+    def __init__(self, name: str, labels: Labels = ()):
+        self.name = name
+        self.labels = labels
+        self.value: float = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Histogram:
+    """Число наблюдений по бакетам (верхняя граница включительно, последний - +Inf), сумма и максимум"""
+
+    def __init__(self, name: str, labels: Labels = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum: float = 0
+        self.max: float = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри бакета, как histogram_quantile в Prometheus"""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.bucket_counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    # выше последней границы знаем только максимум
+                    return self.max
+                lower = self.buckets[index - 1] if index else min(self.buckets[0], 0)
+                upper = min(self.buckets[index], self.max)
+                return lower + (upper - lower) * max(rank - seen, 0) / count
+            seen += count
+        return self.max
+
+    def cumulative_buckets(self) -> list[tuple[float, int]]:
+        total = 0
+        result = []
+        for bound, count in zip((*self.buckets, math.inf), self.bucket_counts, strict=True):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "avg": self.sum / self.count if self.count else 0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+Metric = Counter | Gauge | Histogram
+
+
+class MetricsRegistry:
+    def __init__(self, max_series: int = MAX_SERIES):
+        self.max_series = max_series
+        self._metrics: dict[tuple[str, Labels], Metric] = {}
+        self._types: dict[str, type[Metric]] = {}
+        self._series: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, **labels: object) -> Counter:
+        return self._get_or_create(name, Counter, labels)
+
+    def gauge(self, name: str, **labels: object) -> Gauge:
+        return self._get_or_create(name, Gauge, labels)
+
+    def histogram(self, name: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: object) -> Histogram:
+        return self._get_or_create(name, Histogram, labels, buckets=buckets)
+
+    def snapshot(self) -> dict:
+        """Имя метрики (с метками в фигурных скобках) -> значение"""
+        return {_series_name(name, labels): metric.snapshot() for (name, labels), metric in self._sorted_metrics()}
+
+    def render_prometheus(self) -> str:
+        lines = []
+        previous = None
+        for (name, labels), metric in self._sorted_metrics():
+            prom_name = _INVALID_NAME_CHARS.sub("_", name)
+            if name != previous:
+                lines.append(f"# TYPE {prom_name} {type(metric).__name__.lower()}")
+                previous = name
+            if isinstance(metric, Histogram):
+                for bound, count in metric.cumulative_buckets():
+                    le = "+Inf" if bound == math.inf else repr(float(bound))
+                    lines.append(f"{prom_name}_bucket{_render_labels((*labels, ('le', le)))} {count}")
+                lines.append(f"{prom_name}_sum{_render_labels(labels)} {metric.sum}")
+                lines.append(f"{prom_name}_count{_render_labels(labels)} {metric.count}")
+            else:
+                lines.append(f"{prom_name}{_render_labels(labels)} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def _sorted_metrics(self) -> list[tuple[tuple[str, Labels], Metric]]:
+        with self._lock:
+            return sorted(self._metrics.items(), key=lambda item: item[0])
+
+    def _get_or_create(
+        self,
+        name: str,
+        metric_class: type[Metric],
+        labels: dict[str, object],
+        **kwargs: tuple[float, ...],
+    ) -> Metric:
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        with self._lock:
+            metric_type = self._types.setdefault(name, metric_class)
+            if metric_type is not metric_class:
+                raise TypeError(f"Metric {name} is already registered as {metric_type.__name__}")
+
+            metric = self._metrics.get(key)
+            if metric is None:
+                if self._series.get(name, 0) >= self.max_series:
+                    # не даем неограниченным меткам раздувать память - все новое в одну серию
+                    key = (name, tuple((label, OVERFLOW_LABEL) for label, _ in key[1]))
+                    metric = self._metrics.get(key)
+                if metric is None:
+                    metric = metric_class(name, key[1], **kwargs)
+                    self._metrics[key] = metric
+                    self._series[name] = self._series.get(name, 0) + 1
+            return metric
+
+
+def _render_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    rendered = ",".join(f'{label}="{_escape_label(value)}"' for label, value in labels)
+    return f"{{{rendered}}}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series_name(name: str, labels: Labels) -> str:
+    return name + _render_labels(labels)
+
+
+class MetricsReporter:
+    """Раз в interval секунд пишет снимок метрик в лог (оттуда - в ELK), для сервисов без HTTP"""
+
+    def __init__(
+        self,
+        interval: float,
+        metrics: MetricsRegistry | None = None,
+    ):
+        self.interval = interval
+        self.metrics = metrics or registry
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            # последний снимок при остановке, чтобы не потерять хвост
+            self.report()
+
+    def report(self) -> None:
+        logger.info("Metrics: %s", dumps(self.metrics.snapshot()))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.report()
+            except Exception as e:
+                logger.error("Failed to report metrics: %s", e)
+
+
+# общий реестр процесса
+registry = MetricsRegistry()
@@ -1,21 +1,46 @@
 from .base import Base, BaseModel, TimestampMixin
 from .events import Event, EventLog
 from .game.cards import Ability, Card, CardDeck, Deck, Leader, PassiveAbility, Type
-from .game.core import Color, Faction, GameConstants
+from .game.core import CatalogVersion, Color, Faction, GameConstants
 from .game.enemies import Deathwish, Enemy, EnemyLeader, EnemyLeaderAbility, EnemyPassiveAbility, Move
-from .game.progress import UserCard, UserDeck, UserLeader, UserLevel, UserResource
+from .game.progress import (
+    UserCard,
+    UserDeck,
+    UserLeader,
+    UserLevel,
+    UserProgressRevision,
+    UserResource,
+    UserResourceLedger,
+)
 from .game.seasons import Level, LevelEnemy, LevelRelatedLevels, Season
 from .news import News
 from .tasks import CronTask
+from .triggers import (
+    CATALOG_VERSION_CHANNEL,
+    CATALOG_VERSION_TABLES,
+    EVENTS_CHANGED_CHANNEL,
+    UPDATED_AT_TABLES,
+    USER_CHANGED_CHANNEL,
+    USER_PROGRESS_REVISION_TABLES,
+)
 from .users import User
+from .views import USER_BALANCES_VIEW
 
 
 __all__ = [
+    "CATALOG_VERSION_CHANNEL",
+    "CATALOG_VERSION_TABLES",
+    "EVENTS_CHANGED_CHANNEL",
+    "UPDATED_AT_TABLES",
+    "USER_BALANCES_VIEW",
+    "USER_CHANGED_CHANNEL",
+    "USER_PROGRESS_REVISION_TABLES",
     "Ability",
     "Base",
     "BaseModel",
     "Card",
     "CardDeck",
+    "CatalogVersion",
     "Color",
     "CronTask",
     "Deathwish",
@@ -43,5 +68,7 @@ __all__ = [
     "UserDeck",
     "UserLeader",
     "UserLevel",
+    "UserProgressRevision",
     "UserResource",
+    "UserResourceLedger",
 ]
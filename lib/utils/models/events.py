@@ -2,7 +2,7 @@ from typing import Any
 from uuid import UUID
 
 from lib.utils.models import BaseModel, TimestampMixin
-from sqlalchemy import Integer, String, text
+from sqlalchemy import Index, Integer, String, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
 from sqlalchemy.orm import Mapped, mapped_column
@@ -22,6 +22,14 @@ class Event(BaseModel):
 
 class EventLog(BaseModel, TimestampMixin):
     __tablename__ = "event_log"
+    __table_args__ = (
+        # OutboxRelay выбирает неотправленные события в порядке создания
+        Index(
+            "ix_event_log_pending",
+            "created_at",
+            postgresql_where=text("state = 'pending'"),
+        ),
+    )
 
     id: Mapped[UUID] = mapped_column(
         PGUUID(as_uuid=True),
@@ -1,7 +1,8 @@
+from datetime import datetime
 from typing import Any
 
 from lib.utils.models import BaseModel
-from sqlalchemy import Integer, String, UniqueConstraint
+from sqlalchemy import BigInteger, DateTime, Integer, String, UniqueConstraint, func
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -49,3 +50,27 @@ class GameConstants(BaseModel):
         server_default="{}",
         nullable=False,
     )
+
+
+class CatalogVersion(BaseModel):
+    """
+    Версия статического контента игры (карты, враги, сезоны, константы).
+    Одна строка, версию поднимают триггеры на статических таблицах, см. lib/utils/models/triggers.py
+    """
+
+    __tablename__ = "catalog_version"
+
+    id: Mapped[int] = mapped_column(
+        Integer,
+        primary_key=True,
+    )
+    version: Mapped[int] = mapped_column(
+        BigInteger,
+        server_default="0",
+        nullable=False,
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
@@ -1,5 +1,7 @@
+from datetime import datetime
+
 from lib.utils.models import BaseModel, TimestampMixin
-from sqlalchemy import Boolean, ForeignKey, Integer, UniqueConstraint
+from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint, func, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 
@@ -164,3 +166,104 @@ class UserLevel(BaseModel, TimestampMixin):
         nullable=False,
         server_default="false",
     )
+
+
+class UserResourceLedger(BaseModel):
+    """
+    Журнал изменений ресурсов юзера: строки только добавляются, баланс - user_resources плюс сумма
+    несвернутых строк (вьюха user_balances). Крон compact_resource_ledger сворачивает старые строки
+    в user_resources и проставляет им folded_at
+    """
+
+    __tablename__ = "user_resource_ledger"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id",
+            "idempotency_key",
+            name="uq_user_resource_ledger_idempotency_key",
+        ),
+        Index(
+            "ix_user_resource_ledger_unfolded",
+            "user_id",
+            postgresql_where=text("folded_at IS NULL"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=True,
+    )
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="RESTRICT"),
+        nullable=False,
+    )
+    reason: Mapped[str] = mapped_column(
+        String(64),
+        nullable=False,
+    )
+    idempotency_key: Mapped[str | None] = mapped_column(
+        String(128),
+        nullable=True,
+    )
+    scraps: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        server_default="0",
+    )
+    wood: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        server_default="0",
+    )
+    kegs: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        server_default="0",
+    )
+    big_kegs: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        server_default="0",
+    )
+    chests: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        server_default="0",
+    )
+    keys: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        server_default="0",
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+    folded_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+    )
+
+
+class UserProgressRevision(BaseModel):
+    """
+    Ревизия прогресса юзера: триггер на таблицах прогресса поднимает ее при любом изменении в транзакции,
+    которая это изменение и коммитит. В отличие от updated_at (время начала транзакции) не отстает
+    при пересекающихся транзакциях - по ней ETag прогресса
+    """
+
+    __tablename__ = "user_progress_revisions"
+
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    revision: Mapped[int] = mapped_column(
+        BigInteger,
+        nullable=False,
+        server_default="0",
+    )
@@ -0,0 +1,196 @@
+from lib.utils.models.base import Base
+from sqlalchemy import DDL, event
+
+
+# канал LISTEN/NOTIFY, в payload приходит новая версия каталога
+CATALOG_VERSION_CHANNEL = "catalog_version"
+
+# канал LISTEN/NOTIFY, в payload приходит id юзера, которого деактивировали/удалили или сменили почту/пароль
+USER_CHANGED_CHANNEL = "user_changed"
+
+# канал LISTEN/NOTIFY, без payload: поменялись настройки обработки событий (таблица events)
+EVENTS_CHANGED_CHANNEL = "events_changed"
+
+# статические таблицы, любое изменение которых (в том числе из django-админки) поднимает версию каталога
+CATALOG_VERSION_TABLES = (
+    "factions",
+    "colors",
+    "types",
+    "abilities",
+    "passive_abilities",
+    "cards",
+    "leaders",
+    "moves",
+    "enemy_passive_abilities",
+    "enemy_leader_abilities",
+    "deathwishes",
+    "enemies",
+    "enemy_leaders",
+    "seasons",
+    "levels",
+    "level_enemies",
+    "level_related_levels",
+    "game_constants",
+)
+
+# таблицы прогресса юзера: updated_at на них ставит триггер при любом UPDATE (не только через ORM),
+# по нему работает дельта-синхронизация прогресса
+UPDATED_AT_TABLES = (
+    "user_resources",
+    "user_cards",
+    "user_leaders",
+    "user_decks",
+    "user_levels",
+    "decks",
+    "card_decks",
+)
+
+# таблицы прогресса юзера: любое изменение строки поднимает ревизию прогресса юзера (user_progress_revisions).
+# Значение - колонка с id юзера и как по ней найти юзера: user - это сам id юзера, deck - id колоды,
+# юзеров колоды ищем через user_decks
+USER_PROGRESS_REVISION_TABLES = {
+    "user_resources": ("id", "user"),
+    "user_resource_ledger": ("user_id", "user"),
+    "user_cards": ("user_id", "user"),
+    "user_leaders": ("user_id", "user"),
+    "user_decks": ("user_id", "user"),
+    "user_levels": ("user_id", "user"),
+    "decks": ("id", "deck"),
+    "card_decks": ("deck_id", "deck"),
+}
+
+BUMP_CATALOG_VERSION_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+    DECLARE
+        new_version BIGINT;
+    BEGIN
+        INSERT INTO catalog_version (id, version, updated_at)
+        VALUES (1, 1, NOW())
+        ON CONFLICT (id) DO UPDATE
+        SET
+            version = catalog_version.version + 1,
+            updated_at = NOW()
+        RETURNING version INTO new_version;
+
+        PERFORM pg_notify('{CATALOG_VERSION_CHANNEL}', new_version::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""  # noqa: S608
+
+
+def catalog_version_trigger(table: str) -> str:
+    return f"""
+        CREATE TRIGGER {table}_bump_catalog_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version()
+    """
+
+
+SET_UPDATED_AT_FUNCTION = """
+    CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at = NOW();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+
+def updated_at_trigger(table: str) -> str:
+    return f"""
+        CREATE TRIGGER {table}_set_updated_at
+        BEFORE UPDATE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION set_updated_at()
+    """
+
+
+BUMP_USER_PROGRESS_REVISION_FUNCTION = """
+    CREATE OR REPLACE FUNCTION bump_user_progress_revision() RETURNS trigger AS $$
+    DECLARE
+        row_data JSONB;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            row_data := to_jsonb(OLD);
+        ELSE
+            row_data := to_jsonb(NEW);
+        END IF;
+
+        IF TG_ARGV[1] = 'deck' THEN
+            INSERT INTO user_progress_revisions (user_id, revision)
+            SELECT user_id, 1
+            FROM user_decks
+            WHERE deck_id = (row_data ->> TG_ARGV[0])::int
+            ON CONFLICT (user_id) DO UPDATE
+            SET revision = user_progress_revisions.revision + 1;
+        ELSE
+            INSERT INTO user_progress_revisions (user_id, revision)
+            VALUES ((row_data ->> TG_ARGV[0])::int, 1)
+            ON CONFLICT (user_id) DO UPDATE
+            SET revision = user_progress_revisions.revision + 1;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+
+def user_progress_revision_trigger(table: str) -> str:
+    column, kind = USER_PROGRESS_REVISION_TABLES[table]
+    return f"""
+        CREATE TRIGGER {table}_bump_user_progress_revision
+        AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION bump_user_progress_revision('{column}', '{kind}')
+    """
+
+
+NOTIFY_USER_CHANGED_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION notify_user_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{USER_CHANGED_CHANNEL}', OLD.id::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+USER_CHANGED_TRIGGER = """
+    CREATE TRIGGER users_notify_user_changed
+    AFTER UPDATE OF is_active, email, password OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_user_changed()
+"""
+
+NOTIFY_EVENTS_CHANGED_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION notify_events_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{EVENTS_CHANGED_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+EVENTS_CHANGED_TRIGGER = """
+    CREATE TRIGGER events_notify_events_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON events
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_events_changed()
+"""
+
+
+# в проде триггеры создает миграция, а тут вешаем их на create_all, чтобы они были и в тестовой базе.
+# asyncpg не умеет несколько команд в одном запросе, поэтому по одному DDL на команду
+event.listen(Base.metadata, "after_create", DDL(BUMP_CATALOG_VERSION_FUNCTION))
+for _table in CATALOG_VERSION_TABLES:
+    event.listen(Base.metadata, "after_create", DDL(catalog_version_trigger(_table)))
+
+event.listen(Base.metadata, "after_create", DDL(SET_UPDATED_AT_FUNCTION))
+for _table in UPDATED_AT_TABLES:
+    event.listen(Base.metadata, "after_create", DDL(updated_at_trigger(_table)))
+
+event.listen(Base.metadata, "after_create", DDL(BUMP_USER_PROGRESS_REVISION_FUNCTION))
+for _table in USER_PROGRESS_REVISION_TABLES:
+    event.listen(Base.metadata, "after_create", DDL(user_progress_revision_trigger(_table)))
+
+event.listen(Base.metadata, "after_create", DDL(NOTIFY_USER_CHANGED_FUNCTION))
+event.listen(Base.metadata, "after_create", DDL(USER_CHANGED_TRIGGER))
+
+event.listen(Base.metadata, "after_create", DDL(NOTIFY_EVENTS_CHANGED_FUNCTION))
+event.listen(Base.metadata, "after_create", DDL(EVENTS_CHANGED_TRIGGER))
@@ -0,0 +1,41 @@
+from lib.utils.models.base import Base
+from sqlalchemy import DDL, event
+
+
+# текущий баланс юзера: свернутая часть из user_resources плюс еще не свернутые строки журнала.
+# updated_at - время последнего изменения баланса, по нему работает дельта-синхронизация
+USER_BALANCES_VIEW = "user_balances"
+
+CREATE_USER_BALANCES_VIEW = f"""
+    CREATE OR REPLACE VIEW {USER_BALANCES_VIEW} AS
+    SELECT
+        user_resources.id,
+        user_resources.scraps + COALESCE(ledger.scraps, 0) AS scraps,
+        user_resources.kegs + COALESCE(ledger.kegs, 0) AS kegs,
+        user_resources.big_kegs + COALESCE(ledger.big_kegs, 0) AS big_kegs,
+        user_resources.chests + COALESCE(ledger.chests, 0) AS chests,
+        user_resources.wood + COALESCE(ledger.wood, 0) AS wood,
+        user_resources.keys + COALESCE(ledger.keys, 0) AS keys,
+        GREATEST(user_resources.updated_at, ledger.updated_at) AS updated_at
+    FROM user_resources
+    LEFT JOIN LATERAL (
+        SELECT
+            SUM(scraps)::int AS scraps,
+            SUM(kegs)::int AS kegs,
+            SUM(big_kegs)::int AS big_kegs,
+            SUM(chests)::int AS chests,
+            SUM(wood)::int AS wood,
+            SUM(keys)::int AS keys,
+            MAX(created_at) AS updated_at
+        FROM user_resource_ledger
+        WHERE user_resource_ledger.user_id = user_resources.id AND user_resource_ledger.folded_at IS NULL
+    ) AS ledger ON TRUE
+"""  # noqa: S608
+
+DROP_USER_BALANCES_VIEW = f"DROP VIEW IF EXISTS {USER_BALANCES_VIEW}"
+
+
+# в проде вьюху создает миграция, в тестовой базе - create_all. drop_all про вьюху не знает,
+# а без нее не удалить таблицы, на которые она ссылается
+event.listen(Base.metadata, "after_create", DDL(CREATE_USER_BALANCES_VIEW))
+event.listen(Base.metadata, "before_drop", DDL(DROP_USER_BALANCES_VIEW))
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    email: str
+    expires_at: float
+
+
+class AuthUserCache:
+    """
+    In-process LRU-кеш активных юзеров для проверки токена без запроса в users.
+    Ключ - id юзера из claim uid токена. Запись живет не дольше ttl секунд, при деактивации
+    или смене почты/пароля триггер на users шлет NOTIFY с id юзера - см. on_user_notification
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 60.0,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users: OrderedDict[int, CachedUser] = OrderedDict()
+        # растет на каждую инвалидацию - чтобы не положить в кеш юзера, прочитанного до нее
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(
+        self,
+        user_id: int,
+    ) -> CachedUser | None:
+        user = self._users.get(user_id)
+        if user is None:
+            return None
+        if user.expires_at <= time.monotonic():
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return user
+
+    def set(
+        self,
+        user_id: int,
+        email: str,
+        generation: int,
+    ) -> None:
+        """generation - значение self.generation до чтения юзера из базы"""
+        if generation != self._generation:
+            return
+        self._users[user_id] = CachedUser(id=user_id, email=email, expires_at=time.monotonic() + self.ttl)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+    def invalidate(
+        self,
+        user_id: int | None = None,
+    ) -> None:
+        """Сбрасываем одного юзера, либо весь кеш"""
+        self._generation += 1
+        if user_id is None:
+            self._users.clear()
+        else:
+            self._users.pop(user_id, None)
+
+    def on_user_notification(
+        self,
+        payload: str | None,
+    ) -> None:
+        """Колбек для NotificationListener, payload - id юзера (None - после переподключения, сбрасываем все)"""
+        logger.info("User %s changed, invalidating auth cache", payload)
+        self.invalidate(int(payload) if payload is not None else None)
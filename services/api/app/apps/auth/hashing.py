@@ -0,0 +1,106 @@
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+from typing import TypeVar
+
+from lib.utils.metrics import registry
+from services.api.app.apps.auth.lib import get_password_hash, verify_password
+from services.api.app.exceptions.exceptions import PasswordHasherOverloadedError
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PasswordHasher:
+    """
+    PBKDF2 на 100000 итераций занимает десятки миллисекунд CPU - считаем его в отдельном пуле потоков
+    (hashlib отпускает GIL), чтобы не блокировать event loop.
+    Пул ограничен: если в работе и в очереди уже max_workers + max_queue задач, сразу отказываем (503)
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_queue: int = 64,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hasher")
+        self._in_flight = 0
+
+        self._in_flight_gauge = registry.gauge("auth.password_hasher.in_flight")
+        self._queue_depth_gauge = registry.gauge("auth.password_hasher.queue_depth")
+        self._rejected_counter = registry.counter("auth.password_hasher.rejected")
+        self._wait_histogram = registry.histogram("auth.password_hasher.wait_seconds")
+        self._duration_histogram = registry.histogram("auth.password_hasher.duration_seconds")
+
+    async def hash(
+        self,
+        password: str,
+    ) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(
+        self,
+        plain_password: str,
+        hashed_password: str,
+    ) -> None:
+        """Как и verify_password, кидает UserIncorrectPasswordError при неверном пароле"""
+        await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(
+        self,
+        func: Callable[..., T],
+        *args: str,
+    ) -> T:
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self._rejected_counter.inc()
+            logger.warning("Password hasher is overloaded: %s tasks in flight", self._in_flight)
+            raise PasswordHasherOverloadedError(self._in_flight)
+
+        loop = asyncio.get_running_loop()
+        self._set_in_flight(self._in_flight + 1)
+        future = self._executor.submit(self._timed, time.perf_counter(), func, *args)
+        # задача занимает пул, пока не завершится в executor: если клиент отключился, await отменяется,
+        # но запущенный хеш досчитается - поэтому счетчик уменьшаем по завершении future, а не после await
+        future.add_done_callback(lambda _: self._release(loop))
+        return await asyncio.wrap_future(future)
+
+    def _release(
+        self,
+        loop: asyncio.AbstractEventLoop,
+    ) -> None:
+        # колбек вызывается в потоке пула (или там, где future отменили) - счетчик меняем в потоке event loop
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._task_done)
+
+    def _task_done(self) -> None:
+        self._set_in_flight(self._in_flight - 1)
+
+    def _timed(
+        self,
+        submitted_at: float,
+        func: Callable[..., T],
+        *args: str,
+    ) -> T:
+        started_at = time.perf_counter()
+        self._wait_histogram.observe(started_at - submitted_at)
+        try:
+            return func(*args)
+        finally:
+            self._duration_histogram.observe(time.perf_counter() - started_at)
+
+    def _set_in_flight(
+        self,
+        value: int,
+    ) -> None:
+        self._in_flight = value
+        self._in_flight_gauge.set(value)
+        self._queue_depth_gauge.set(max(value - self.max_workers, 0))
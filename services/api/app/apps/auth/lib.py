@@ -1,6 +1,9 @@
+from collections import OrderedDict
 from datetime import UTC, datetime, timedelta
 import hashlib
 import secrets
+import threading
+import time
 
 from jose import ExpiredSignatureError, JWTError, jwt
 from services.api.app.config import Config
@@ -54,25 +57,94 @@ def create_access_token(
     return encoded_jwt
 
 
-def decode_token(
+class VerifiedTokenCache:
+    """
+    LRU-кеш уже проверенных токенов: один и тот же токен приходит сотни раз за сессию,
+    повторная проверка подписи и разбор claims сводятся к поиску в словаре.
+    Запись живет до exp самого токена, токены без exp и невалидные токены не кешируем
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+    ):
+        self.max_size = max_size
+        self._tokens: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        token: str,
+    ) -> dict | None:
+        with self._lock:
+            payload = self._tokens.get(token)
+            if payload is None:
+                return None
+            if payload["exp"] <= time.time():
+                del self._tokens[token]
+                return None
+            self._tokens.move_to_end(token)
+            return payload
+
+    def set(
+        self,
+        token: str,
+        payload: dict,
+    ) -> None:
+        if not isinstance(payload.get("exp"), int | float):
+            return
+        with self._lock:
+            self._tokens[token] = payload
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+
+
+verified_tokens = VerifiedTokenCache(max_size=Config.VERIFIED_TOKEN_CACHE_SIZE)
+
+
+def verify_token(
     config: Config,
     token: str,
-) -> str | None:
+) -> dict | None:
+    """Полная проверка подписи и exp, без кеша"""
     try:
-        payload = jwt.decode(
+        return jwt.decode(
             token,
             config.USER_PASSWORD_SECRET_KEY,
             algorithms=[config.ALGORITHM],
             options={"verify_exp": True},
         )
-
-        email: str = payload.get("sub")
-
-        if email is None:
-            return None
-        return email
-
     except ExpiredSignatureError:
         return None
     except JWTError:
         return None
+
+
+def decode_token_payload(
+    config: Config,
+    token: str,
+) -> dict | None:
+    """Проверенные claims токена, None - если токен битый или просрочен. Результат общий, его нельзя мутировать"""
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        return payload
+
+    payload = verify_token(config=config, token=token)
+    if payload is not None:
+        verified_tokens.set(token, payload)
+    return payload
+
+
+def decode_token(
+    config: Config,
+    token: str,
+) -> str | None:
+    payload = decode_token_payload(config=config, token=token)
+    if payload is None:
+        return None
+    return payload.get("sub")
@@ -5,7 +5,9 @@ from asyncpg import UniqueViolationError
 from fastapi import HTTPException, status
 from lib.utils.db.pool import Database
 from lib.utils.schemas.users import UserRole
-from services.api.app.apps.auth.lib import create_access_token, decode_token, get_password_hash, verify_password
+from services.api.app.apps.auth.cache import AuthUserCache, CachedUser
+from services.api.app.apps.auth.hashing import PasswordHasher
+from services.api.app.apps.auth.lib import create_access_token, decode_token, decode_token_payload
 from services.api.app.apps.auth.schemas import (
     Token,
     UserCheckTokenResponse,
@@ -27,9 +29,13 @@ class AuthService:
         self,
         db_pool: Database,
         config: Config,
+        user_cache: AuthUserCache,
+        password_hasher: PasswordHasher,
     ):
         self.db_pool = db_pool
         self.config = config
+        self.user_cache = user_cache
+        self.password_hasher = password_hasher
 
     # async def get_users(self) -> list[User]:
     #     print("STR28!!!!!!!!!!!!!!!!!!!!", self.config.AAA)
@@ -65,6 +71,9 @@ class AuthService:
         self,
         user_data: UserRegisterRequest,
     ) -> UserRegisterResponse:
+        # хешируем до транзакции, чтобы не держать соединение, пока считается PBKDF2
+        password_hash: str = await self.password_hasher.hash(user_data.password)
+
         async with self.db_pool.transaction() as connection:
             try:
                 user_id = await connection.fetchval(
@@ -76,7 +85,7 @@ class AuthService:
                     """,
                     user_data.email,
                     user_data.username,
-                    get_password_hash(user_data.password),
+                    password_hash,
                 )
             except UniqueViolationError as e:
                 raise UserAlreadyExistsError(e) from e
@@ -104,7 +113,8 @@ class AuthService:
 
         access_token = create_access_token(
             config=self.config,
-            data={"sub": user_data.email},
+            # uid позволяет проверять токен по кешу юзеров, без запроса в базу
+            data={"sub": user_data.email, "uid": user["id"]},
             # expires_delta_minutes=1,
         )
 
@@ -148,7 +158,7 @@ class AuthService:
         password: str,
     ) -> dict:
         user: dict = await self._get_user_by_email(email=email)
-        verify_password(password, user["password"])
+        await self.password_hasher.verify(password, user["password"])
         return user
 
     async def get_current_user(
@@ -202,10 +212,11 @@ class AuthService:
         self,
         token: str,
     ) -> UserCheckTokenResponse:
-        email = decode_token(
+        payload: dict | None = decode_token_payload(
             config=self.config,
             token=token,
         )
+        email: str | None = payload.get("sub") if payload else None
 
         if email is None:
             raise HTTPException(
@@ -214,7 +225,24 @@ class AuthService:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
+        # основной путь - юзер уже в кеше, в базу не ходим. Токены без uid (выданные раньше) - всегда через базу
+        user_id: int | None = payload.get("uid")
+        cached_user: CachedUser | None = self.user_cache.get(user_id) if user_id is not None else None
+        if cached_user is not None and cached_user.email == email:
+            return UserCheckTokenResponse(
+                id=cached_user.id,
+                email=cached_user.email,
+            )
+
+        generation = self.user_cache.generation
         user = await self._get_user_by_email(email=email)
+        if user_id is not None and user["id"] != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        self.user_cache.set(user_id=user["id"], email=user["email"], generation=generation)
 
         return UserCheckTokenResponse(
             id=user["id"],
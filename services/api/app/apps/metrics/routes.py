@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from lib.utils.metrics import registry
+from starlette.responses import PlainTextResponse
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """Метрики процесса в текстовом формате Prometheus. Реестр свой у каждого воркера"""
+    return PlainTextResponse(registry.render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -2,12 +2,19 @@ from fastapi import APIRouter, Depends
 from services.api.app.apps.news.schemas import News
 from services.api.app.apps.news.service import NewsService
 from services.api.app.dependencies import get_news_service
+from services.api.app.middlewares.etag import etag_dependency
 
 
 router = APIRouter()
 
 
-@router.get("/list-news")
+async def news_version(
+    service: NewsService = Depends(get_news_service),
+) -> str:
+    return await service.get_news_version()
+
+
+@router.get("/list-news", dependencies=[Depends(etag_dependency(news_version))])
 async def register(
     service: NewsService = Depends(get_news_service),
 ) -> list[News]:
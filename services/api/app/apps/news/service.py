@@ -12,8 +12,14 @@ class NewsService:
         self.db_pool = db_pool
         self.config = config
 
+    async def get_news_version(self) -> str:
+        """Версия списка новостей для ETag: админка проставляет updated_at, удаление ловим по числу новостей"""
+        async with self.db_pool.connection(readonly=True) as connection:
+            row = await connection.fetchrow("""SELECT MAX(updated_at) AS updated_at, COUNT(*) AS count FROM news""")
+        return f"{row['updated_at']}:{row['count']}"
+
     async def list_news(self) -> list[News]:
-        async with self.db_pool.connection() as connection:
+        async with self.db_pool.connection(readonly=True) as connection:
             news = await connection.fetch(
                 """
                     SELECT
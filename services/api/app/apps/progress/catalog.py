@@ -0,0 +1,594 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from hashlib import blake2b
+import logging
+
+import asyncpg
+
+from lib.utils.db.pool import Database
+from pydantic_core import to_json
+from services.api.app.apps.cards.schemas import Card, Enemy, EnemyLeader, Leader
+from services.api.app.apps.progress.schemas import GameConstants, Level, LevelRelatedLevel
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatalogSeason:
+    id: int
+    name: str
+    description: str
+    unlocked: bool
+    level_ids: tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class CatalogJson:
+    """Статические части ответа прогресса, заранее сериализованные в json"""
+
+    cards: dict[int, bytes]
+    leaders: dict[int, bytes]
+    levels: dict[int, bytes]
+    # начало объекта сезона (все поля до levels) и id его уровней
+    seasons: tuple[tuple[bytes, tuple[int, ...]], ...]
+    enemies: bytes
+    enemy_leaders: bytes
+
+
+@dataclass(frozen=True)
+class CatalogView:
+    """
+    Статический контент игры, собранный в pydantic-модели под конкретный base_url
+    (от него зависят ссылки на картинки). Объекты общие для всех запросов - их нельзя мутировать!
+    """
+
+    version: int
+    cards: dict[int, Card]
+    leaders: dict[int, Leader]
+    enemies: dict[int, Enemy]
+    enemy_leaders: dict[int, EnemyLeader]
+    levels: dict[int, Level]
+    seasons: tuple[CatalogSeason, ...]
+
+    @cached_property
+    def json(self) -> CatalogJson:
+        # сериализуем один раз на версию каталога и base_url, дальше только склеиваем байты
+        return CatalogJson(
+            cards={card_id: to_json(card) for card_id, card in self.cards.items()},
+            leaders={leader_id: to_json(leader) for leader_id, leader in self.leaders.items()},
+            levels={level_id: to_json(level) for level_id, level in self.levels.items()},
+            seasons=tuple(
+                (
+                    to_json(
+                        {
+                            "id": season.id,
+                            "name": season.name,
+                            "description": season.description,
+                            "unlocked": season.unlocked,
+                        },
+                    )[:-1]
+                    + b',"levels":',
+                    season.level_ids,
+                )
+                for season in self.seasons
+            ),
+            enemies=to_json(list(self.enemies.values())),
+            enemy_leaders=to_json(list(self.enemy_leaders.values())),
+        )
+
+
+@dataclass(frozen=True)
+class CatalogFingerprints:
+    """
+    Хеши сущностей каталога одной версии - по ним дельта-синхронизация понимает, что поменялось между версиями.
+    Хеш сезона включает его уровни (а значит и их врагов), хеши не зависят от base_url
+    """
+
+    cards: dict[int, bytes]
+    leaders: dict[int, bytes]
+    enemies: dict[int, bytes]
+    enemy_leaders: dict[int, bytes]
+    seasons: dict[int, bytes]
+    game_constants: bytes
+
+
+def _fingerprint(data: bytes) -> bytes:
+    return blake2b(data, digest_size=16).digest()
+
+
+class Catalog:
+    """Снимок статических таблиц (карты, лидеры, враги, сезоны, уровни и константы) на момент загрузки"""
+
+    def __init__(
+        self,
+        version: int,
+        game_constants: dict,
+        cards: list[asyncpg.Record],
+        leaders: list[asyncpg.Record],
+        enemies: list[asyncpg.Record],
+        enemy_leaders: list[asyncpg.Record],
+        seasons: list[asyncpg.Record],
+        related_levels: list[asyncpg.Record],
+        views_size: int = 4,
+    ):
+        self.version = version
+        # сырой json отдаем на фронт как есть
+        self.game_constants_data = game_constants
+        self._cards = cards
+        self._leaders = leaders
+        self._enemies = enemies
+        self._enemy_leaders = enemy_leaders
+        self._seasons = seasons
+        self._related_levels = related_levels
+        # base_url берется из заголовка Host, поэтому представлений держим не больше views_size (LRU)
+        self.views_size = views_size
+        self._views: OrderedDict[str, CatalogView] = OrderedDict()
+
+        # справочники, не зависящие от base_url - для расчета стоимости крафта/милла и игры уровня
+        self.card_colors: dict[int, str] = {row["id"]: row["color_name"] for row in cards}
+        # открытые по умолчанию карты/лидеры нельзя миллить до нуля
+        self.card_unlocked: dict[int, bool] = {row["id"]: row["unlocked"] for row in cards}
+        self.leader_unlocked: dict[int, bool] = {row["id"]: row["unlocked"] for row in leaders}
+        self.level_difficulties: dict[int, str] = {row["level_id"]: row["difficulty"] for row in seasons}
+
+    @cached_property
+    def game_constants_json(self) -> bytes:
+        return to_json(self.game_constants_data)
+
+    @cached_property
+    def game_constants(self) -> GameConstants:
+        # парсим один раз на снимок и только при первом обращении
+        return GameConstants.model_validate(self.game_constants_data)
+
+    @cached_property
+    def fingerprints(self) -> CatalogFingerprints:
+        catalog_view = self.view("")
+        static = catalog_view.json
+        return CatalogFingerprints(
+            cards={card_id: _fingerprint(card) for card_id, card in static.cards.items()},
+            leaders={leader_id: _fingerprint(leader) for leader_id, leader in static.leaders.items()},
+            enemies={enemy_id: _fingerprint(to_json(enemy)) for enemy_id, enemy in catalog_view.enemies.items()},
+            enemy_leaders={
+                enemy_leader_id: _fingerprint(to_json(enemy_leader))
+                for enemy_leader_id, enemy_leader in catalog_view.enemy_leaders.items()
+            },
+            seasons={
+                season.id: _fingerprint(season_head + b"".join(static.levels[level_id] for level_id in level_ids))
+                for season, (season_head, level_ids) in zip(catalog_view.seasons, static.seasons, strict=True)
+            },
+            game_constants=_fingerprint(self.game_constants_json),
+        )
+
+    def view(
+        self,
+        base_url: str,
+    ) -> CatalogView:
+        catalog_view = self._views.get(base_url)
+        if catalog_view is None:
+            catalog_view = self._build_view(base_url)
+            self._views[base_url] = catalog_view
+            while len(self._views) > self.views_size:
+                self._views.popitem(last=False)
+        else:
+            self._views.move_to_end(base_url)
+        return catalog_view
+
+    def _build_view(
+        self,
+        base_url: str,
+    ) -> CatalogView:
+        enemies = {row["id"]: Enemy.get_one(row, base_url) for row in self._enemies}
+        enemy_leaders = {row["id"]: EnemyLeader.get_one(row, base_url) for row in self._enemy_leaders}
+
+        # у каждого уровня всегда есть хотя бы одна запись о связях (LEFT JOIN), даже если связей нет
+        children: dict[int, list[LevelRelatedLevel]] = {}
+        for row in self._related_levels:
+            children.setdefault(row["id"], []).append(
+                LevelRelatedLevel(
+                    related_level_id=row["related_level_id"],
+                    line=row["line"],
+                    connection=row["connection"],
+                ),
+            )
+
+        levels: dict[int, Level] = {}
+        seasons: dict[int, dict] = {}
+        for row in self._seasons:
+            level_id = row["level_id"]
+            enemy = enemies[row["enemy_id"]]
+
+            if level_id not in levels:
+                levels[level_id] = Level(
+                    id=level_id,
+                    name=row["level_name"],
+                    difficulty=row["difficulty"],
+                    starting_enemies_number=row["starting_enemies_number"],
+                    x=row["x"],
+                    y=row["y"],
+                    enemy_leader=enemy_leaders[row["enemy_leader_id"]],
+                    enemies=[enemy],
+                    children=children.get(level_id, []),
+                )
+            else:
+                levels[level_id].enemies.append(enemy)
+
+            season = seasons.setdefault(
+                row["season_id"],
+                {
+                    "id": row["season_id"],
+                    "name": row["season_name"],
+                    "description": row["season_description"],
+                    "unlocked": row["season_unlocked"],
+                    "level_ids": [],
+                },
+            )
+            if level_id not in season["level_ids"]:
+                season["level_ids"].append(level_id)
+
+        return CatalogView(
+            version=self.version,
+            cards={row["id"]: Card.get_one(row, base_url) for row in self._cards},
+            leaders={row["id"]: Leader.get_one(row, base_url) for row in self._leaders},
+            enemies=enemies,
+            enemy_leaders=enemy_leaders,
+            levels=levels,
+            seasons=tuple(
+                CatalogSeason(
+                    id=season["id"],
+                    name=season["name"],
+                    description=season["description"],
+                    unlocked=season["unlocked"],
+                    level_ids=tuple(season["level_ids"]),
+                )
+                for season in seasons.values()
+            ),
+        )
+
+
+class CatalogCache:
+    """
+    In-process кеш статического контента игры.
+    Грузится один раз при старте API и перечитывается лениво, после того как его пометили устаревшим.
+    Версия берется из таблицы catalog_version, ее поднимают триггеры на статических таблицах и
+    рассылают через NOTIFY - см. on_version_notification.
+    Для дельта-синхронизации помним хеши сущностей последних history_size загруженных версий
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        history_size: int = 16,
+        views_size: int = 4,
+    ):
+        self.db = db
+        self.history_size = history_size
+        self.views_size = views_size
+        self._catalog: Catalog | None = None
+        self._history: OrderedDict[int, CatalogFingerprints] = OrderedDict()
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._catalog.version if self._catalog else 0
+
+    def get_fingerprints(
+        self,
+        version: int,
+    ) -> CatalogFingerprints | None:
+        """Хеши сущностей старой версии каталога, None - если версия уже вытеснена из истории"""
+        return self._history.get(version)
+
+    def invalidate(self) -> None:
+        """Помечаем кеш устаревшим, следующий запрос перечитает его из базы"""
+        self._stale = True
+
+    def on_version_notification(
+        self,
+        payload: str | None,
+    ) -> None:
+        """Колбек для NotificationListener, payload - новая версия каталога (None - после переподключения)"""
+        if payload is not None and self._catalog is not None and int(payload) <= self._catalog.version:
+            return
+        logger.info("Catalog version changed (%s), invalidating cache", payload)
+        self.invalidate()
+
+    async def get(self) -> Catalog:
+        if self._catalog is not None and not self._stale:
+            return self._catalog
+
+        async with self._lock:
+            if self._catalog is None or self._stale:
+                # сбрасываем флаг до загрузки, чтобы не потерять инвалидацию, пришедшую во время загрузки
+                self._stale = False
+                try:
+                    self._catalog = await self._load()
+                except Exception:
+                    self._stale = True
+                    raise
+                self._remember(self._catalog)
+
+        return self._catalog
+
+    def _remember(
+        self,
+        catalog: Catalog,
+    ) -> None:
+        self._history[catalog.version] = catalog.fingerprints
+        self._history.move_to_end(catalog.version)
+        while len(self._history) > self.history_size:
+            self._history.popitem(last=False)
+
+    async def _load(self) -> Catalog:
+        async with self.db.connection() as connection:
+            # все таблицы читаем из одного снимка базы
+            async with connection.transaction(isolation="repeatable_read", readonly=True):
+                version = await get_catalog_version(connection=connection)
+                game_constants = await get_game_constants(connection=connection)
+                cards = await get_cards(connection=connection)
+                leaders = await get_leaders(connection=connection)
+                enemies = await get_enemies(connection=connection)
+                enemy_leaders = await get_enemy_leaders(connection=connection)
+                seasons = await get_seasons(connection=connection)
+                related_levels = await get_level_related_levels(connection=connection)
+
+        logger.info(
+            "Loaded catalog version %s: %s cards, %s leaders, %s enemies, %s enemy leaders",
+            version,
+            len(cards),
+            len(leaders),
+            len(enemies),
+            len(enemy_leaders),
+        )
+
+        return Catalog(
+            version=version,
+            game_constants=game_constants,
+            cards=cards,
+            leaders=leaders,
+            enemies=enemies,
+            enemy_leaders=enemy_leaders,
+            seasons=seasons,
+            related_levels=related_levels,
+            views_size=self.views_size,
+        )
+
+
+async def get_catalog_version(
+    connection: asyncpg.Connection,
+) -> int:
+    version = await connection.fetchval("""SELECT version FROM catalog_version WHERE id = 1""")
+    return version or 0
+
+
+async def get_game_constants(
+    connection: asyncpg.Connection,
+) -> dict:
+    game_constants: dict | None = await connection.fetchval("""SELECT data::jsonb FROM game_constants""")
+    return game_constants or {}
+
+
+async def get_cards(
+    connection: asyncpg.Connection,
+) -> list[asyncpg.Record]:
+    return await connection.fetch(
+        """
+            SELECT
+                cards.id,
+                cards.name,
+                cards.image_phone AS image,
+                cards.unlocked,
+                factions.name AS faction_name,
+                colors.name AS color_name,
+                types.name AS type_name,
+                abilities.name AS ability_name,
+                abilities.description AS ability_description,
+                cards.damage,
+                cards.charges,
+                cards.hp,
+                cards.heal,
+                cards.has_passive,
+                cards.has_passive_in_hand,
+                cards.has_passive_in_deck,
+                cards.has_passive_in_grave,
+                passive_abilities.name AS passive_ability_name,
+                passive_abilities.description AS passive_ability_description,
+                cards.value,
+                cards.timer,
+                cards.default_timer,
+                cards.reset_timer,
+                cards.each_tick
+            FROM
+                cards
+            JOIN
+                factions ON cards.faction_id = factions.id
+            JOIN
+                colors ON cards.color_id = colors.id
+            JOIN
+                types ON cards.type_id = types.id
+            JOIN
+                abilities ON cards.ability_id = abilities.id
+            LEFT JOIN
+                passive_abilities ON cards.passive_ability_id = passive_abilities.id
+            ORDER BY
+                cards.color_id DESC,
+                cards.damage DESC,
+                cards.hp DESC,
+                cards.charges DESC,
+                cards.id
+        """,
+    )
+
+
+async def get_leaders(
+    connection: asyncpg.Connection,
+) -> list[asyncpg.Record]:
+    return await connection.fetch(
+        """
+            SELECT
+                leaders.id,
+                leaders.name,
+                leaders.image_phone AS image,
+                leaders.unlocked,
+                factions.name AS faction_name,
+                abilities.name AS ability_name,
+                abilities.description AS ability_description,
+                leaders.damage,
+                leaders.charges,
+                leaders.heal,
+                leaders.has_passive,
+                passive_abilities.name AS passive_ability_name,
+                passive_abilities.description AS passive_ability_description,
+                leaders.value,
+                leaders.timer,
+                leaders.default_timer,
+                leaders.reset_timer
+            FROM
+                leaders
+            JOIN
+                factions ON leaders.faction_id = factions.id
+            JOIN
+                abilities ON leaders.ability_id = abilities.id
+            LEFT JOIN
+                passive_abilities ON leaders.passive_ability_id = passive_abilities.id
+            ORDER BY
+                leaders.id
+        """,
+    )
+
+
+async def get_enemies(
+    connection: asyncpg.Connection,
+) -> list[asyncpg.Record]:
+    return await connection.fetch(
+        """
+            SELECT
+                enemies.id,
+                enemies.name,
+                enemies.image_phone AS image,
+                factions.name AS faction_name,
+                colors.name AS color_name,
+                moves.name AS move_name,
+                moves.description AS move_description,
+                enemies.damage,
+                enemies.hp,
+                enemies.base_hp,
+                enemies.shield,
+                enemies.has_passive,
+                enemies.has_passive_in_field,
+                enemies.has_passive_in_grave,
+                enemies.has_passive_in_deck,
+                enemy_passive_abilities.name AS passive_ability_name,
+                enemy_passive_abilities.description AS passive_ability_description,
+                enemies.value,
+                enemies.timer,
+                enemies.default_timer,
+                enemies.reset_timer,
+                enemies.each_tick,
+                enemies.has_deathwish,
+                deathwishes.name AS deathwish_name,
+                deathwishes.description AS deathwish_description,
+                enemies.deathwish_value
+            FROM
+                enemies
+            JOIN
+                factions ON enemies.faction_id = factions.id
+            JOIN
+                colors ON enemies.color_id = colors.id
+            JOIN
+                moves ON enemies.move_id = moves.id
+            LEFT JOIN
+                deathwishes ON enemies.deathwish_id = deathwishes.id
+            LEFT JOIN
+                enemy_passive_abilities ON enemies.passive_ability_id = enemy_passive_abilities.id
+            ORDER BY
+                enemies.id
+        """,
+    )
+
+
+async def get_enemy_leaders(
+    connection: asyncpg.Connection,
+) -> list[asyncpg.Record]:
+    return await connection.fetch(
+        """
+            SELECT
+                enemy_leaders.id,
+                enemy_leaders.name,
+                enemy_leaders.image_phone AS image,
+                factions.name AS faction_name,
+                enemy_leaders.hp,
+                enemy_leaders.base_hp,
+                enemy_leader_abilities.name AS ability_name,
+                enemy_leader_abilities.description AS ability_description,
+                enemy_leaders.has_passive,
+                enemy_passive_abilities.name AS passive_ability_name,
+                enemy_passive_abilities.description AS passive_ability_description,
+                enemy_leaders.value,
+                enemy_leaders.timer,
+                enemy_leaders.default_timer,
+                enemy_leaders.reset_timer,
+                enemy_leaders.each_tick
+            FROM
+                enemy_leaders
+            JOIN
+                factions ON enemy_leaders.faction_id = factions.id
+            LEFT JOIN
+                enemy_leader_abilities ON enemy_leaders.ability_id = enemy_leader_abilities.id
+            LEFT JOIN
+                enemy_passive_abilities ON enemy_leaders.passive_ability_id = enemy_passive_abilities.id
+            ORDER BY
+                enemy_leaders.id
+        """,
+    )
+
+
+async def get_seasons(
+    connection: asyncpg.Connection,
+) -> list[asyncpg.Record]:
+    return await connection.fetch(
+        """
+            SELECT
+                seasons.id AS season_id,
+                seasons.name AS season_name,
+                seasons.description AS season_description,
+                seasons.unlocked AS season_unlocked,
+                levels.id AS level_id,
+                levels.name AS level_name,
+                levels.difficulty,
+                levels.starting_enemies_number,
+                levels.x,
+                levels.y,
+                levels.enemy_leader_id AS enemy_leader_id,
+                level_enemies.enemy_id AS enemy_id
+            FROM seasons
+            JOIN levels ON seasons.id = levels.season_id
+            JOIN level_enemies ON levels.id = level_enemies.level_id
+            ORDER BY
+                seasons.id,
+                levels.id,
+                level_enemies.id
+        """,
+    )
+
+
+async def get_level_related_levels(
+    connection: asyncpg.Connection,
+) -> list[asyncpg.Record]:
+    return await connection.fetch(
+        """
+            SELECT
+                levels.id,
+                level_related_levels.related_level_id,
+                level_related_levels.line,
+                level_related_levels.connection
+            FROM levels
+            LEFT JOIN level_related_levels ON levels.id = level_related_levels.level_id
+            ORDER BY
+                levels.id,
+                level_related_levels.id
+        """,
+    )
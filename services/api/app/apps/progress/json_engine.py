@@ -0,0 +1,331 @@
+"""
+Альтернативный движок прогресса юзера (USER_PROGRESS_ENGINE=sql):
+весь UserProgressResponse собирается одним запросом через json_build_object/json_agg.
+Форма и порядок элементов совпадают с движком на кеше каталога.
+$1 - id юзера, $2 - префикс ссылок на картинки (build_image_url(base_url, "")), к нему просто дописываем путь
+"""
+
+import json
+
+import asyncpg
+
+
+USER_PROGRESS_QUERY = """
+    WITH
+    card_json AS (
+        SELECT
+            cards.id,
+            cards.color_id,
+            cards.damage,
+            cards.hp,
+            cards.charges,
+            json_build_object(
+                'id', cards.id,
+                'name', cards.name,
+                'unlocked', cards.unlocked,
+                'image', $2 || cards.image_phone,
+                'faction', factions.name,
+                'color', colors.name,
+                'type', types.name,
+                'ability', json_build_object('name', abilities.name, 'description', abilities.description),
+                'damage', cards.damage,
+                'charges', cards.charges,
+                'hp', cards.hp,
+                'heal', cards.heal,
+                'has_passive', cards.has_passive,
+                'has_passive_in_hand', cards.has_passive_in_hand,
+                'has_passive_in_deck', cards.has_passive_in_deck,
+                'has_passive_in_grave', cards.has_passive_in_grave,
+                'passive_ability', json_build_object(
+                    'name', passive_abilities.name,
+                    'description', passive_abilities.description
+                ),
+                'value', cards.value,
+                'timer', cards.timer,
+                'default_timer', cards.default_timer,
+                'reset_timer', cards.reset_timer,
+                'each_tick', cards.each_tick
+            ) AS card
+        FROM cards
+        JOIN factions ON cards.faction_id = factions.id
+        JOIN colors ON cards.color_id = colors.id
+        JOIN types ON cards.type_id = types.id
+        JOIN abilities ON cards.ability_id = abilities.id
+        LEFT JOIN passive_abilities ON cards.passive_ability_id = passive_abilities.id
+    ),
+    leader_json AS (
+        SELECT
+            leaders.id,
+            json_build_object(
+                'id', leaders.id,
+                'name', leaders.name,
+                'image', $2 || leaders.image_phone,
+                'unlocked', leaders.unlocked,
+                'faction', factions.name,
+                'ability', json_build_object('name', abilities.name, 'description', abilities.description),
+                'damage', leaders.damage,
+                'charges', leaders.charges,
+                'heal', leaders.heal,
+                'has_passive', leaders.has_passive,
+                'passive_ability', json_build_object(
+                    'name', passive_abilities.name,
+                    'description', passive_abilities.description
+                ),
+                'value', leaders.value,
+                'timer', leaders.timer,
+                'default_timer', leaders.default_timer,
+                'reset_timer', leaders.reset_timer
+            ) AS leader
+        FROM leaders
+        JOIN factions ON leaders.faction_id = factions.id
+        JOIN abilities ON leaders.ability_id = abilities.id
+        LEFT JOIN passive_abilities ON leaders.passive_ability_id = passive_abilities.id
+    ),
+    enemy_json AS (
+        SELECT
+            enemies.id,
+            json_build_object(
+                'id', enemies.id,
+                'name', enemies.name,
+                'image', $2 || enemies.image_phone,
+                'faction', factions.name,
+                'color', colors.name,
+                'move', json_build_object('name', moves.name, 'description', moves.description),
+                'damage', enemies.damage,
+                'hp', enemies.hp,
+                'base_hp', enemies.base_hp,
+                'shield', enemies.shield,
+                'has_passive', enemies.has_passive,
+                'has_passive_in_field', enemies.has_passive_in_field,
+                'has_passive_in_grave', enemies.has_passive_in_grave,
+                'has_passive_in_deck', enemies.has_passive_in_deck,
+                'passive_ability', json_build_object(
+                    'name', enemy_passive_abilities.name,
+                    'description', enemy_passive_abilities.description
+                ),
+                'value', enemies.value,
+                'timer', enemies.timer,
+                'default_timer', enemies.default_timer,
+                'reset_timer', enemies.reset_timer,
+                'each_tick', enemies.each_tick,
+                'has_deathwish', enemies.has_deathwish,
+                'deathwish', json_build_object('name', deathwishes.name, 'description', deathwishes.description),
+                'deathwish_value', enemies.deathwish_value
+            ) AS enemy
+        FROM enemies
+        JOIN factions ON enemies.faction_id = factions.id
+        JOIN colors ON enemies.color_id = colors.id
+        JOIN moves ON enemies.move_id = moves.id
+        LEFT JOIN deathwishes ON enemies.deathwish_id = deathwishes.id
+        LEFT JOIN enemy_passive_abilities ON enemies.passive_ability_id = enemy_passive_abilities.id
+    ),
+    enemy_leader_json AS (
+        SELECT
+            enemy_leaders.id,
+            json_build_object(
+                'id', enemy_leaders.id,
+                'name', enemy_leaders.name,
+                'image', $2 || enemy_leaders.image_phone,
+                'faction', factions.name,
+                'hp', enemy_leaders.hp,
+                'base_hp', enemy_leaders.base_hp,
+                'ability', json_build_object(
+                    'name', enemy_leader_abilities.name,
+                    'description', enemy_leader_abilities.description
+                ),
+                'has_passive', enemy_leaders.has_passive,
+                'passive_ability', json_build_object(
+                    'name', enemy_passive_abilities.name,
+                    'description', enemy_passive_abilities.description
+                ),
+                'value', enemy_leaders.value,
+                'timer', enemy_leaders.timer,
+                'default_timer', enemy_leaders.default_timer,
+                'reset_timer', enemy_leaders.reset_timer,
+                'each_tick', enemy_leaders.each_tick
+            ) AS enemy_leader
+        FROM enemy_leaders
+        JOIN factions ON enemy_leaders.faction_id = factions.id
+        LEFT JOIN enemy_leader_abilities ON enemy_leaders.ability_id = enemy_leader_abilities.id
+        LEFT JOIN enemy_passive_abilities ON enemy_leaders.passive_ability_id = enemy_passive_abilities.id
+    ),
+    level_json AS (
+        -- уровни без врагов не отдаем, у уровня без связей одна пустая связь (как в LEFT JOIN)
+        SELECT
+            levels.id,
+            levels.season_id,
+            json_build_object(
+                'id', levels.id,
+                'name', levels.name,
+                'starting_enemies_number', levels.starting_enemies_number,
+                'difficulty', levels.difficulty,
+                'x', levels.x,
+                'y', levels.y,
+                'enemy_leader', enemy_leader_json.enemy_leader,
+                'enemies', level_enemies_agg.enemies,
+                'children', children_agg.children
+            ) AS level
+        FROM levels
+        JOIN enemy_leader_json ON levels.enemy_leader_id = enemy_leader_json.id
+        JOIN LATERAL (
+            SELECT json_agg(enemy_json.enemy ORDER BY level_enemies.id) AS enemies
+            FROM level_enemies
+            JOIN enemy_json ON level_enemies.enemy_id = enemy_json.id
+            WHERE level_enemies.level_id = levels.id
+        ) AS level_enemies_agg ON level_enemies_agg.enemies IS NOT NULL
+        CROSS JOIN LATERAL (
+            SELECT json_agg(
+                json_build_object(
+                    'related_level_id', level_related_levels.related_level_id,
+                    'line', level_related_levels.line,
+                    'connection', level_related_levels.connection
+                )
+                ORDER BY level_related_levels.id
+            ) AS children
+            FROM (SELECT 1) AS one
+            LEFT JOIN level_related_levels ON level_related_levels.level_id = levels.id
+        ) AS children_agg
+    )
+    SELECT json_build_object(
+        'user_database', json_build_object(
+            'cards', COALESCE(
+                (
+                    SELECT json_agg(
+                        json_build_object(
+                            'id', user_cards.id,
+                            'count', COALESCE(user_cards.count, 0),
+                            'card', card_json.card
+                        )
+                        ORDER BY
+                            card_json.color_id DESC,
+                            card_json.damage DESC,
+                            card_json.hp DESC,
+                            card_json.charges DESC,
+                            card_json.id
+                    )
+                    FROM card_json
+                    LEFT JOIN user_cards ON card_json.id = user_cards.card_id AND user_cards.user_id = $1
+                ),
+                '[]'::json
+            ),
+            'leaders', COALESCE(
+                (
+                    SELECT json_agg(
+                        json_build_object(
+                            'id', user_leaders.id,
+                            'count', COALESCE(user_leaders.count, 0),
+                            'card', leader_json.leader
+                        )
+                        ORDER BY leader_json.id
+                    )
+                    FROM leader_json
+                    LEFT JOIN user_leaders ON leader_json.id = user_leaders.leader_id AND user_leaders.user_id = $1
+                ),
+                '[]'::json
+            ),
+            'decks', COALESCE(
+                (
+                    SELECT json_agg(
+                        json_build_object(
+                            'id', user_decks.id,
+                            'deck', json_build_object(
+                                'id', decks.id,
+                                'name', decks.name,
+                                'leader', leader_json.leader,
+                                'cards', deck_cards.cards,
+                                'health', deck_cards.health
+                            )
+                        )
+                        ORDER BY user_decks.id
+                    )
+                    FROM user_decks
+                    JOIN decks ON user_decks.deck_id = decks.id
+                    JOIN leader_json ON decks.leader_id = leader_json.id
+                    JOIN LATERAL (
+                        SELECT
+                            json_agg(
+                                json_build_object('card', card_json.card, 'count', 1)
+                                ORDER BY card_decks.id
+                            ) AS cards,
+                            SUM(card_json.hp) AS health
+                        FROM card_decks
+                        JOIN card_json ON card_decks.card_id = card_json.id
+                        WHERE card_decks.deck_id = decks.id
+                    ) AS deck_cards ON deck_cards.cards IS NOT NULL
+                    WHERE user_decks.user_id = $1
+                ),
+                '[]'::json
+            )
+        ),
+        'seasons', COALESCE(
+            (
+                SELECT json_agg(
+                    json_build_object(
+                        'id', seasons.id,
+                        'name', seasons.name,
+                        'description', seasons.description,
+                        'unlocked', seasons.unlocked,
+                        'levels', season_levels.levels
+                    )
+                    ORDER BY seasons.id
+                )
+                FROM seasons
+                JOIN LATERAL (
+                    SELECT json_agg(
+                        json_build_object(
+                            'id', user_levels.id,
+                            'unlocked', user_levels.id IS NOT NULL,
+                            'finished', user_levels.finished,
+                            'level', level_json.level
+                        )
+                        ORDER BY level_json.id
+                    ) AS levels
+                    FROM level_json
+                    LEFT JOIN user_levels ON level_json.id = user_levels.level_id AND user_levels.user_id = $1
+                    WHERE level_json.season_id = seasons.id
+                ) AS season_levels ON season_levels.levels IS NOT NULL
+            ),
+            '[]'::json
+        ),
+        'resources', (
+            SELECT json_build_object(
+                'scraps', user_balances.scraps,
+                'kegs', user_balances.kegs,
+                'big_kegs', user_balances.big_kegs,
+                'chests', user_balances.chests,
+                'wood', user_balances.wood,
+                'keys', user_balances.keys
+            )
+            FROM user_balances
+            WHERE user_balances.id = $1
+        ),
+        'enemies', COALESCE((SELECT json_agg(enemy_json.enemy ORDER BY enemy_json.id) FROM enemy_json), '[]'::json),
+        'enemy_leaders', COALESCE(
+            (SELECT json_agg(enemy_leader_json.enemy_leader ORDER BY enemy_leader_json.id) FROM enemy_leader_json),
+            '[]'::json
+        ),
+        'game_const', COALESCE((SELECT game_constants.data FROM game_constants LIMIT 1), '{}'::jsonb)
+    )
+"""
+
+
+async def get_user_progress_raw(
+    connection: asyncpg.Connection,
+    user_id: int,
+    media_url: str,
+) -> str:
+    # json (не jsonb) сохраняет порядок ключей и не требует кодека, текст можно сразу отдавать на фронт
+    return await connection.fetchval(USER_PROGRESS_QUERY, user_id, media_url)
+
+
+async def get_user_progress_json(
+    connection: asyncpg.Connection,
+    user_id: int,
+    media_url: str,
+) -> dict:
+    result: str = await get_user_progress_raw(
+        connection=connection,
+        user_id=user_id,
+        media_url=media_url,
+    )
+    return json.loads(result)
@@ -2,10 +2,12 @@ import logging
 
 import asyncpg
 
-from services.api.app.apps.cards.schemas import Card, CardForDeck, Deck, Enemy, EnemyLeader, Leader
+from lib.utils.db.statements import statements
+from lib.utils.schemas.game import ResourceType
+from pydantic_core import to_json
+from services.api.app.apps.cards.schemas import CardForDeck, Deck, Enemy, EnemyLeader
+from services.api.app.apps.progress.catalog import CatalogView
 from services.api.app.apps.progress.schemas import (
-    Level,
-    LevelRelatedLevel,
     Season,
     UserCard,
     UserDeck,
@@ -21,462 +23,243 @@ logger = logging.getLogger(__name__)
 async def process_enemies(
     connection: asyncpg.Connection,
     user_id: int,
-    base_url: str,
+    catalog: CatalogView,
 ) -> tuple[list[Enemy], list[EnemyLeader], list[Season]]:
-    # собираем список врагов
-    enemies: list[Enemy] = await get_enemies(
-        connection=connection,
-        base_url=base_url,
-    )
-
-    enemies_dict = {}
-    for enemy in enemies:
-        enemies_dict[enemy.id] = enemy
-
-    # собираем список лидеров врагов
-    enemy_leaders: list[EnemyLeader] = await get_enemy_leaders(
-        connection=connection,
-        base_url=base_url,
-    )
-
-    enemy_leaders_dict = {}
-    for enemy_leader in enemy_leaders:
-        enemy_leaders_dict[enemy_leader.id] = enemy_leader
-
-    # список всех сезонов с уровнями
-    seasons: list = await get_seasons(
+    # враги и уровни берутся из кеша, из базы читаем только уровни юзера
+    user_levels: dict[int, asyncpg.Record] = await get_user_levels(
         connection=connection,
         user_id=user_id,
     )
 
-    # из него выбираем список уникальных id уровней
-    level_ids = {row["level_id"] for row in seasons}
-    # print("STR164", level_ids)
-
-    level_related_levels: dict[int, list[LevelRelatedLevel]] = await get_level_related_levels(
-        connection=connection,
-        level_ids=level_ids,
+    user_seasons: list[Season] = construct_seasons(
+        catalog=catalog,
+        user_levels=user_levels,
     )
 
-    user_seasons: list[Season] = await construct_seasons(
-        seasons=seasons,
-        enemies_dict=enemies_dict,
-        enemy_leaders_dict=enemy_leaders_dict,
-        level_related_levels=level_related_levels,
-    )
-
-    return enemies, enemy_leaders, user_seasons
+    return list(catalog.enemies.values()), list(catalog.enemy_leaders.values()), user_seasons
+
+
+GET_USER_COLLECTION = statements.register(
+    "progress.get_user_collection",
+    """
+        SELECT 'card' AS kind, id, card_id AS item_id, count, NULL::boolean AS finished, updated_at
+        FROM user_cards
+        WHERE user_id = $1
+        UNION ALL
+        SELECT 'leader' AS kind, id, leader_id AS item_id, count, NULL::boolean AS finished, updated_at
+        FROM user_leaders
+        WHERE user_id = $1
+        UNION ALL
+        SELECT 'level' AS kind, id, level_id AS item_id, NULL::int AS count, finished, updated_at
+        FROM user_levels
+        WHERE user_id = $1
+    """,
+)
 
 
-async def get_enemies(
+async def get_user_collection(
     connection: asyncpg.Connection,
-    base_url: str,
-) -> list[Enemy]:
-    enemies = await connection.fetch(
-        """
-            SELECT
-                enemies.id,
-                enemies.name,
-                enemies.image_phone AS image,
-                factions.name AS faction_name,
-                colors.name AS color_name,
-                moves.name AS move_name,
-                moves.description AS move_description,
-                enemies.damage,
-                enemies.hp,
-                enemies.base_hp,
-                enemies.shield,
-                enemies.has_passive,
-                enemies.has_passive_in_field,
-                enemies.has_passive_in_grave,
-                enemies.has_passive_in_deck,
-                enemy_passive_abilities.name AS passive_ability_name,
-                enemy_passive_abilities.description AS passive_ability_description,
-                enemies.value,
-                enemies.timer,
-                enemies.default_timer,
-                enemies.reset_timer,
-                enemies.each_tick,
-                enemies.has_deathwish,
-                deathwishes.name AS deathwish_name,
-                deathwishes.description AS deathwish_description,
-                enemies.deathwish_value
-            FROM
-                enemies
-            JOIN
-                factions ON enemies.faction_id = factions.id
-            JOIN
-                colors ON enemies.color_id = colors.id
-            JOIN
-                moves ON enemies.move_id = moves.id
-            LEFT JOIN
-                deathwishes ON enemies.deathwish_id = deathwishes.id
-            LEFT JOIN
-                enemy_passive_abilities ON enemies.passive_ability_id = enemy_passive_abilities.id
-        """,
+    user_id: int,
+) -> tuple[dict[int, asyncpg.Record], dict[int, asyncpg.Record], dict[int, asyncpg.Record]]:
+    # одним запросом достаем карты, лидеров и уровни юзера, ключ словарей - id карты/лидера/уровня.
+    # updated_at (его ставит триггер set_updated_at) нужен дельта-синхронизации
+    rows = await statements.fetch(
+        connection,
+        GET_USER_COLLECTION,
+        user_id,
     )
-    return [Enemy.get_one(row, base_url) for row in enemies]
 
+    collection = {"card": {}, "leader": {}, "level": {}}
+    for row in rows:
+        collection[row["kind"]][row["item_id"]] = row
 
-async def get_enemy_leaders(
-    connection: asyncpg.Connection,
-    base_url: str,
-) -> list[EnemyLeader]:
-    enemy_leaders = await connection.fetch(
-        """
-            SELECT
-                enemy_leaders.id,
-                enemy_leaders.name,
-                enemy_leaders.image_phone AS image,
-                factions.name AS faction_name,
-                enemy_leaders.hp,
-                enemy_leaders.base_hp,
-                enemy_leader_abilities.name AS ability_name,
-                enemy_leader_abilities.description AS ability_description,
-                enemy_leaders.has_passive,
-                enemy_passive_abilities.name AS passive_ability_name,
-                enemy_passive_abilities.description AS passive_ability_description,
-                enemy_leaders.value,
-                enemy_leaders.timer,
-                enemy_leaders.default_timer,
-                enemy_leaders.reset_timer,
-                enemy_leaders.each_tick
-            FROM
-                enemy_leaders
-            JOIN
-                factions ON enemy_leaders.faction_id = factions.id
-            LEFT JOIN
-                enemy_leader_abilities ON enemy_leaders.ability_id = enemy_leader_abilities.id
-            LEFT JOIN
-                enemy_passive_abilities ON enemy_leaders.passive_ability_id = enemy_passive_abilities.id
-        """,
-    )
-    return [EnemyLeader.get_one(row, base_url) for row in enemy_leaders]
+    return collection["card"], collection["leader"], collection["level"]
 
 
-async def get_seasons(
+async def get_user_levels(
     connection: asyncpg.Connection,
     user_id: int,
-) -> list:
-    return await connection.fetch(
+) -> dict[int, asyncpg.Record]:
+    rows = await connection.fetch(
         """
-            SELECT
-                seasons.id AS season_id,
-                seasons.name AS season_name,
-                seasons.description AS season_description,
-                seasons.unlocked AS season_unlocked,
-                levels.id AS level_id,
-                levels.name AS level_name,
-                levels.difficulty,
-                levels.starting_enemies_number,
-                levels.x,
-                levels.y,
-                user_levels.id AS user_level_id,
-                user_levels.finished AS user_level_finished,
-                levels.enemy_leader_id AS enemy_leader_id,
-                level_enemies.enemy_id AS enemy_id
-            FROM seasons
-            JOIN levels ON seasons.id = levels.season_id
-            JOIN level_enemies ON levels.id = level_enemies.level_id
-            LEFT JOIN user_levels ON levels.id = user_levels.level_id AND user_levels.user_id = $1;
+            SELECT id, level_id, finished
+            FROM user_levels
+            WHERE user_id = $1
         """,
         user_id,
     )
+    return {row["level_id"]: row for row in rows}
 
 
-async def get_level_related_levels(
-    connection: asyncpg.Connection,
-    level_ids: set[int],
-) -> dict[int, list[LevelRelatedLevel]]:
-    # возвращает словарь, где ключ это id уровня, значение - список его связей (даже если связей нет)
-    all_related_levels = await connection.fetch(
-        """
-            SELECT
-                levels.id,
-                level_related_levels.related_level_id,
-                level_related_levels.line,
-                level_related_levels.connection
-            FROM levels
-            LEFT JOIN level_related_levels ON levels.id = level_related_levels.level_id
-            WHERE levels.id = ANY ($1)
-        """,
-        level_ids,
-    )
-
-    level_ids_dict = {}
-    for row in all_related_levels:
-        level_id = row["id"]
-        level_related_level = LevelRelatedLevel(
-            line=row["line"],
-            connection=row["connection"],
-            related_level_id=row["related_level_id"],
-        )
-        if level_id not in level_ids_dict:
-            level_ids_dict[level_id] = [level_related_level]
-        else:
-            level_ids_dict[level_id].append(level_related_level)
-
-    return level_ids_dict
-
-
-async def construct_seasons(
-    seasons: list,
-    enemies_dict: dict,
-    enemy_leaders_dict: dict,
-    level_related_levels: dict[int, list[LevelRelatedLevel]],
+def construct_seasons(
+    catalog: CatalogView,
+    user_levels: dict[int, asyncpg.Record],
+    season_ids: set[int] | None = None,
 ) -> list[Season]:
-    user_seasons_dict = {}
-    levels_dict = {}
-
-    for row in seasons:
-        # print()
-        # season_id = row["season_id"]
-        # print("STR170 season_id", season_id)
-
-        # user_level_id = row["user_level_id"]
-
-        enemy_id: int = row["enemy_id"]
-        enemy: Enemy = enemies_dict[enemy_id]
-
-        level_id = row["level_id"]
-        if level_id not in levels_dict:
-            # print("STR182 level_id", level_id)
-            enemy_leader_id: int = row["enemy_leader_id"]
-            enemy_leader: EnemyLeader = enemy_leaders_dict[enemy_leader_id]
-
-            level = Level(
-                id=row["level_id"],
-                name=row["level_name"],
-                difficulty=row["difficulty"],
-                starting_enemies_number=row["starting_enemies_number"],
-                x=row["x"],
-                y=row["y"],
-                enemy_leader=enemy_leader,
-                enemies=[enemy],
-                children=level_related_levels[level_id],
-            )
-            levels_dict[level_id] = level
-        else:
-            level: Level = levels_dict[level_id]
-            # print("STR198 level_id", level.id)
-            # print("STR200, appending enemy_id", enemy_id)
-            level.enemies.append(enemy)
-
-    for row in seasons:
-        season_id = row["season_id"]
-
-        level_id = row["level_id"]
-        level: Level = levels_dict[level_id]
-
-        user_level = UserLevel(
-            id=row["user_level_id"],
-            level=level,
-            finished=row["user_level_finished"],
-            unlocked=True if row["user_level_id"] else False,
-        )
-
-        if season_id not in user_seasons_dict:
-            # print("STR203 season_id", season_id)
-
-            season = Season(
-                id=season_id,
-                name=row["season_name"],
-                description=row["season_description"],
-                unlocked=row["season_unlocked"],
-                levels=[user_level],
+    user_seasons = []
+    for season in catalog.seasons:
+        if season_ids is not None and season.id not in season_ids:
+            continue
+        levels = []
+        for level_id in season.level_ids:
+            user_level = user_levels.get(level_id)
+            levels.append(
+                UserLevel(
+                    id=user_level["id"] if user_level else None,
+                    level=catalog.levels[level_id],
+                    finished=user_level["finished"] if user_level else None,
+                    unlocked=user_level is not None,
+                ),
             )
-            user_seasons_dict[season_id] = season
-        else:
-            season: Season = user_seasons_dict[season_id]
-            # print("STR214 season_id", season_id)
-            if user_level not in season.levels:
-                # print("STR215 appending level", level.id)
-                season.levels.append(user_level)
-
-    # levels_dict_keys = list(levels_dict.keys())
-    # print("STR203 levels_dict_keys", levels_dict_keys)
-
-    # user_seasons_model = [user_season for user_season in user_seasons_dict.values()]
-    # for user_season in user_seasons_dict.values():
-    #     user_seasons_model.append(user_season)
-
-    return list(user_seasons_dict.values())
 
+        user_seasons.append(
+            Season(
+                id=season.id,
+                name=season.name,
+                description=season.description,
+                unlocked=season.unlocked,
+                levels=levels,
+            ),
+        )
 
-async def process_cards(
-    connection: asyncpg.Connection,
-    user_id: int,
-    base_url: str,
-) -> tuple[list[UserCard], list[UserLeader], list[UserDeck]]:
-    user_cards: list[UserCard] = await get_user_cards(
-        connection=connection,
-        user_id=user_id,
-        base_url=base_url,
-    )
-
-    users_card_dict = {}
-    for card in user_cards:
-        users_card_dict[card.card.id] = card.card
-
-    user_leaders: list[UserLeader] = await get_user_leaders(
-        connection=connection,
-        user_id=user_id,
-        base_url=base_url,
-    )
-
-    users_leaders_dict = {}
-    for leader in user_leaders:
-        users_leaders_dict[leader.card.id] = leader.card
+    return user_seasons
 
-    user_decks: list[UserDeck] = await construct_user_decks(
-        connection=connection,
-        user_id=user_id,
-        users_card_dict=users_card_dict,
-        users_leaders_dict=users_leaders_dict,
-    )
 
-    return user_cards, user_leaders, user_decks
+GET_USER_CARDS = statements.register(
+    "progress.get_user_cards",
+    """
+        SELECT id, card_id, count
+        FROM user_cards
+        WHERE user_id = $1 AND ($2::int[] IS NULL OR card_id = ANY($2::int[]))
+    """,
+)
 
 
 async def get_user_cards(
     connection: asyncpg.Connection,
     user_id: int,
-    base_url: str,
+    catalog: CatalogView,
+    card_ids: set[int] | None = None,
 ) -> list[UserCard]:
-    user_cards: list[dict] = await connection.fetch(
-        """
-            SELECT
-                cards.id,
-                cards.name,
-                cards.image_phone AS image,
-                cards.unlocked,
-                factions.name AS faction_name,
-                colors.name AS color_name,
-                types.name AS type_name,
-                abilities.name AS ability_name,
-                abilities.description AS ability_description,
-                cards.damage,
-                cards.charges,
-                cards.hp,
-                cards.heal,
-                cards.has_passive,
-                cards.has_passive_in_hand,
-                cards.has_passive_in_deck,
-                cards.has_passive_in_grave,
-                passive_abilities.name AS passive_ability_name,
-                passive_abilities.description AS passive_ability_description,
-                cards.value,
-                cards.timer,
-                cards.default_timer,
-                cards.reset_timer,
-                cards.each_tick,
-                COALESCE(user_cards.count, 0) AS user_card_count,
-                user_cards.id AS user_card_id
-            FROM
-                cards
-            LEFT JOIN
-                user_cards ON cards.id = user_cards.card_id AND user_cards.user_id = $1
-            JOIN
-                factions ON cards.faction_id = factions.id
-            JOIN
-                colors ON cards.color_id = colors.id
-            JOIN
-                types ON cards.type_id = types.id
-            JOIN
-                abilities ON cards.ability_id = abilities.id
-            LEFT JOIN
-                passive_abilities ON cards.passive_ability_id = passive_abilities.id
-            ORDER BY
-                cards.color_id DESC,
-                cards.damage DESC,
-                cards.hp DESC,
-                cards.charges DESC
-        """,
+    """Все карты юзера, либо только card_ids - для компактных ответов ручек крафта"""
+    rows = await statements.fetch(
+        connection,
+        GET_USER_CARDS,
         user_id,
+        list(card_ids) if card_ids is not None else None,
+    )
+    return construct_user_cards(
+        catalog=catalog,
+        user_cards={row["card_id"]: row for row in rows},
+        card_ids=card_ids,
     )
 
-    return [
-        UserCard(
-            id=user_card["user_card_id"],
-            count=user_card["user_card_count"],
-            card=Card.get_one(user_card, base_url),
+
+def construct_user_cards(
+    catalog: CatalogView,
+    user_cards: dict[int, asyncpg.Record],
+    card_ids: set[int] | None = None,
+) -> list[UserCard]:
+    # все карты игры (или только card_ids) в порядке каталога, для отсутствующих у юзера count = 0
+    result = []
+    for card_id, card in catalog.cards.items():
+        if card_ids is not None and card_id not in card_ids:
+            continue
+        user_card = user_cards.get(card_id)
+        result.append(
+            UserCard(
+                id=user_card["id"] if user_card else None,
+                count=user_card["count"] if user_card else 0,
+                card=card,
+            ),
         )
-        for user_card in user_cards
-    ]
+    return result
+
+
+GET_USER_LEADERS = statements.register(
+    "progress.get_user_leaders",
+    """
+        SELECT id, leader_id, count
+        FROM user_leaders
+        WHERE user_id = $1 AND ($2::int[] IS NULL OR leader_id = ANY($2::int[]))
+    """,
+)
 
 
 async def get_user_leaders(
     connection: asyncpg.Connection,
     user_id: int,
-    base_url: str,
+    catalog: CatalogView,
+    leader_ids: set[int] | None = None,
 ) -> list[UserLeader]:
-    user_leaders: list[dict] = await connection.fetch(
-        """
-            SELECT
-                leaders.id,
-                leaders.name,
-                leaders.image_phone AS image,
-                leaders.unlocked,
-                factions.name AS faction_name,
-                abilities.name AS ability_name,
-                abilities.description AS ability_description,
-                leaders.damage,
-                leaders.charges,
-                leaders.heal,
-                leaders.has_passive,
-                passive_abilities.name AS passive_ability_name,
-                passive_abilities.description AS passive_ability_description,
-                leaders.value,
-                leaders.timer,
-                leaders.default_timer,
-                leaders.reset_timer,
-                COALESCE(user_leaders.count, 0) AS user_leader_count,
-                user_leaders.id AS user_leader_id
-            FROM
-                leaders
-            LEFT JOIN
-                user_leaders ON leaders.id = user_leaders.leader_id AND user_leaders.user_id = $1
-            JOIN
-                factions ON leaders.faction_id = factions.id
-            JOIN
-                abilities ON leaders.ability_id = abilities.id
-            LEFT JOIN
-                passive_abilities ON leaders.passive_ability_id = passive_abilities.id
-        """,
+    rows = await statements.fetch(
+        connection,
+        GET_USER_LEADERS,
         user_id,
+        list(leader_ids) if leader_ids is not None else None,
     )
-    return [
-        UserLeader(
-            id=user_leader["user_leader_id"],
-            count=user_leader["user_leader_count"],
-            card=Leader.get_one(user_leader, base_url),
+    return construct_user_leaders(
+        catalog=catalog,
+        user_leaders={row["leader_id"]: row for row in rows},
+        leader_ids=leader_ids,
+    )
+
+
+def construct_user_leaders(
+    catalog: CatalogView,
+    user_leaders: dict[int, asyncpg.Record],
+    leader_ids: set[int] | None = None,
+) -> list[UserLeader]:
+    result = []
+    for leader_id, leader in catalog.leaders.items():
+        if leader_ids is not None and leader_id not in leader_ids:
+            continue
+        user_leader = user_leaders.get(leader_id)
+        result.append(
+            UserLeader(
+                id=user_leader["id"] if user_leader else None,
+                count=user_leader["count"] if user_leader else 0,
+                card=leader,
+            ),
         )
-        for user_leader in user_leaders
-    ]
+    return result
+
+
+GET_USER_DECKS = statements.register(
+    "progress.get_user_decks",
+    """
+        SELECT
+            user_decks.id AS user_deck_id,
+            decks.id AS deck_id,
+            decks.name AS deck_name,
+            decks.leader_id AS leader_id,
+            card_decks.card_id AS card_id
+        FROM
+            user_decks
+        JOIN decks ON user_decks.deck_id = decks.id
+        JOIN card_decks ON decks.id = card_decks.deck_id
+        WHERE
+            user_decks.user_id = $1
+            AND ($2::int IS NULL OR decks.id = $2)
+        ORDER BY
+            user_decks.id,
+            card_decks.id
+    """,
+)
 
 
 async def construct_user_decks(
     connection: asyncpg.Connection,
     user_id: int,
-    users_card_dict: dict,
-    users_leaders_dict: dict,
+    catalog: CatalogView,
+    deck_id: int | None = None,
 ) -> list[UserDeck]:
-    user_decks: list[dict] = await connection.fetch(
-        """
-            SELECT
-                user_decks.id AS user_deck_id,
-                decks.id AS deck_id,
-                decks.name AS deck_name,
-                decks.leader_id AS leader_id,
-                card_decks.card_id AS card_id
-            FROM
-                user_decks
-            JOIN decks ON user_decks.deck_id = decks.id
-            JOIN card_decks ON decks.id = card_decks.deck_id
-            WHERE
-                user_decks.user_id = $1;
-        """,
+    """Все колоды юзера, либо только колода deck_id"""
+    user_decks: list[dict] = await statements.fetch(
+        connection,
+        GET_USER_DECKS,
         user_id,
+        deck_id,
     )
 
     user_decs_dict = {}
@@ -484,49 +267,349 @@ async def construct_user_decks(
     for row in user_decks:
         user_deck_id = row["user_deck_id"]
 
-        card_id: int = row["card_id"]
-        card: Card = users_card_dict[card_id]
-        hp = card.hp
+        card = catalog.cards[row["card_id"]]
         card_for_deck = CardForDeck(card=card)
 
         if user_deck_id not in user_decs_dict:
-            deck_id: int = row["deck_id"]
-            deck_name: str = row["deck_name"]
-            leader_id: int = row["leader_id"]
-            leader: Leader = users_leaders_dict[leader_id]
-
             user_decs_dict[user_deck_id] = UserDeck(
                 id=user_deck_id,
                 deck=Deck(
-                    id=deck_id,
-                    name=deck_name,
-                    leader=leader,
-                    health=hp,
+                    id=row["deck_id"],
+                    name=row["deck_name"],
+                    leader=catalog.leaders[row["leader_id"]],
+                    health=card.hp,
                     cards=[card_for_deck],
                 ),
             )
         else:
             user_deck: UserDeck = user_decs_dict[user_deck_id]
             user_deck.deck.cards.append(card_for_deck)
-            user_deck.deck.health += hp
-
-    # user_decks_model = []
-    # for _, user_deck in user_decs_dict.items():
-    #     user_decks_model.append(user_deck)
+            user_deck.deck.health += card.hp
 
     return list(user_decs_dict.values())
 
 
-async def get_user_resources(
+def dump_user_progress(
+    catalog: CatalogView,
+    game_constants_json: bytes,
+    user_cards: dict[int, asyncpg.Record],
+    user_leaders: dict[int, asyncpg.Record],
+    user_levels: dict[int, asyncpg.Record],
+    user_decks: list[UserDeck],
+    user_resources: UserResources,
+) -> bytes:
+    """
+    Собирает json UserProgressResponse без построения моделей:
+    статические части берем готовыми байтами из каталога, вокруг них дописываем данные юзера.
+    Порядок полей такой же, как в схемах, ответ совпадает с UserProgressResponse.model_dump_json()
+    """
+    static = catalog.json
+
+    cards = b",".join(
+        b'{"id":%b,"count":%d,"card":%b}' % (_dump_id(user_cards.get(card_id)), _count(user_cards.get(card_id)), card)
+        for card_id, card in static.cards.items()
+    )
+    leaders = b",".join(
+        b'{"id":%b,"count":%d,"card":%b}'
+        % (_dump_id(user_leaders.get(leader_id)), _count(user_leaders.get(leader_id)), leader)
+        for leader_id, leader in static.leaders.items()
+    )
+
+    seasons = []
+    for season_head, level_ids in static.seasons:
+        levels = []
+        for level_id in level_ids:
+            user_level = user_levels.get(level_id)
+            levels.append(
+                b'{"id":%b,"unlocked":%b,"finished":%b,"level":%b}'
+                % (
+                    _dump_id(user_level),
+                    b"true" if user_level else b"false",
+                    to_json(user_level["finished"] if user_level else None),
+                    static.levels[level_id],
+                ),
+            )
+        seasons.append(season_head + b"[" + b",".join(levels) + b"]}")
+
+    return (
+        b'{"user_database":{"cards":[%b],"leaders":[%b],"decks":%b},"seasons":[%b],'
+        b'"resources":%b,"enemies":%b,"enemy_leaders":%b,"game_const":%b}'
+        % (
+            cards,
+            leaders,
+            to_json(user_decks),
+            b",".join(seasons),
+            to_json(user_resources),
+            static.enemies,
+            static.enemy_leaders,
+            game_constants_json,
+        )
+    )
+
+
+def _dump_id(
+    row: asyncpg.Record | None,
+) -> bytes:
+    return b"%d" % row["id"] if row else b"null"
+
+
+def _count(
+    row: asyncpg.Record | None,
+) -> int:
+    return row["count"] if row else 0
+
+
+# таблица коллекции юзера и колонка с id карты/лидера
+USER_ITEM_TABLES = {
+    "card": ("user_cards", "card_id"),
+    "leader": ("user_leaders", "leader_id"),
+}
+
+
+def _craft_user_item_query(
+    table: str,
+    column: str,
+) -> str:
+    return f"""
+        WITH balance AS (
+            SELECT scraps, kegs, big_kegs, chests, wood, keys
+            FROM user_balances
+            WHERE id = $1 AND scraps + $3 >= 0
+        ),
+        paid AS (
+            INSERT INTO user_resource_ledger
+            (user_id, reason, scraps)
+            SELECT $1, $4, $3
+            FROM balance
+            RETURNING scraps
+        ),
+        crafted AS (
+            INSERT INTO {table}
+            (user_id, {column}, count)
+            SELECT $1, $2, 1
+            FROM paid
+            ON CONFLICT (user_id, {column})
+            DO UPDATE
+            SET
+                count = {table}.count + 1,
+                updated_at = NOW()
+            RETURNING id, count
+        )
+        SELECT
+            crafted.id,
+            crafted.count,
+            balance.scraps + paid.scraps AS scraps,
+            balance.kegs,
+            balance.big_kegs,
+            balance.chests,
+            balance.wood,
+            balance.keys
+        FROM crafted
+        CROSS JOIN paid
+        CROSS JOIN balance
+    """  # noqa: S608
+
+
+def _mill_user_item_query(
+    table: str,
+    column: str,
+) -> str:
+    return f"""
+        WITH milled AS (
+            UPDATE {table}
+            SET
+                count = {table}.count - 1,
+                updated_at = NOW()
+            WHERE {table}.user_id = $1 AND {table}.{column} = $2 AND {table}.count > $4
+            RETURNING id, count
+        ),
+        paid AS (
+            INSERT INTO user_resource_ledger
+            (user_id, reason, scraps)
+            SELECT $1, $5, $3
+            FROM milled
+            RETURNING scraps
+        )
+        SELECT
+            milled.id,
+            milled.count,
+            user_balances.scraps + paid.scraps AS scraps,
+            user_balances.kegs,
+            user_balances.big_kegs,
+            user_balances.chests,
+            user_balances.wood,
+            user_balances.keys
+        FROM milled
+        CROSS JOIN paid
+        JOIN user_balances ON user_balances.id = $1
+    """  # noqa: S608
+
+
+# по отдельному запросу на карты и лидеров
+CRAFT_USER_ITEM = {
+    kind: statements.register(f"progress.craft_user_{kind}", _craft_user_item_query(table, column))
+    for kind, (table, column) in USER_ITEM_TABLES.items()
+}
+MILL_USER_ITEM = {
+    kind: statements.register(f"progress.mill_user_{kind}", _mill_user_item_query(table, column))
+    for kind, (table, column) in USER_ITEM_TABLES.items()
+}
+
+
+async def craft_user_item(
+    connection: asyncpg.Connection,
     user_id: int,
+    kind: str,
+    item_id: int,
+    cost: int,
+    reason: str,
+) -> asyncpg.Record | None:
+    """
+    Крафт карты/лидера одним запросом: пишем в журнал списание scraps (cost отрицательный) и делаем count += 1.
+    Если scraps не хватает, ничего не меняется и возвращается None.
+    Вызывать в транзакции после lock_user_resources - иначе два крафта могут списать одни и те же scraps
+    """
+    return await statements.fetchrow(
+        connection,
+        CRAFT_USER_ITEM[kind],
+        user_id,
+        item_id,
+        cost,
+        reason,
+    )
+
+
+async def mill_user_item(
     connection: asyncpg.Connection,
-) -> UserResources:
-    user_resources = await connection.fetchrow(
-        """
+    user_id: int,
+    kind: str,
+    item_id: int,
+    reward: int,
+    min_count: int,
+    reason: str,
+) -> asyncpg.Record | None:
+    """
+    Милл карты/лидера одним запросом: count -= 1 (только если у юзера больше min_count) и начисляем scraps
+    записью в журнал. Если миллить нечего, ничего не меняется и возвращается None
+    """
+    return await statements.fetchrow(
+        connection,
+        MILL_USER_ITEM[kind],
+        user_id,
+        item_id,
+        reward,
+        min_count,
+        reason,
+    )
+
+
+APPLY_CRAFT_MILL_BATCH = statements.register(
+    "progress.apply_craft_mill_batch",
+    """
+        WITH
+        cards AS (
+            INSERT INTO user_cards
+            (user_id, card_id, count)
+            SELECT $1, deltas.card_id, deltas.delta
+            FROM unnest($2::int[], $3::int[]) AS deltas(card_id, delta)
+            ON CONFLICT (user_id, card_id)
+            DO UPDATE
+            SET
+                count = user_cards.count + EXCLUDED.count,
+                updated_at = NOW()
+            RETURNING id, card_id, count
+        ),
+        leaders AS (
+            INSERT INTO user_leaders
+            (user_id, leader_id, count)
+            SELECT $1, deltas.leader_id, deltas.delta
+            FROM unnest($4::int[], $5::int[]) AS deltas(leader_id, delta)
+            ON CONFLICT (user_id, leader_id)
+            DO UPDATE
+            SET
+                count = user_leaders.count + EXCLUDED.count,
+                updated_at = NOW()
+            RETURNING id, leader_id, count
+        ),
+        balance AS (
             SELECT scraps, kegs, big_kegs, chests, wood, keys
-            FROM user_resources
+            FROM user_balances
             WHERE id = $1
-        """,
+        ),
+        paid AS (
+            INSERT INTO user_resource_ledger
+            (user_id, reason, scraps)
+            SELECT $1, $7, $6
+            FROM balance
+            WHERE $6 <> 0
+            RETURNING scraps
+        ),
+        items AS (
+            SELECT 'card' AS kind, id, card_id AS item_id, count FROM cards
+            UNION ALL
+            SELECT 'leader' AS kind, id, leader_id AS item_id, count FROM leaders
+        )
+        SELECT
+            items.kind,
+            items.id,
+            items.item_id,
+            items.count,
+            balance.scraps + COALESCE((SELECT scraps FROM paid), 0) AS scraps,
+            balance.kegs,
+            balance.big_kegs,
+            balance.chests,
+            balance.wood,
+            balance.keys
+        FROM balance
+        LEFT JOIN items ON TRUE
+    """,
+)
+
+
+async def apply_craft_mill_batch(
+    connection: asyncpg.Connection,
+    user_id: int,
+    card_deltas: dict[int, int],
+    leader_deltas: dict[int, int],
+    scraps_delta: int,
+    reason: str,
+) -> list[asyncpg.Record]:
+    """
+    Применяет итоговые изменения count карт/лидеров одним запросом, изменение scraps - одной строкой журнала.
+    В каждой строке ресурсы юзера после изменения, плюс новая строка коллекции (kind, id, item_id, count).
+    Если изменились только ресурсы, строка одна с kind/item_id = NULL. Проверки - на вызывающей стороне,
+    внутри транзакции (при списании scraps - после lock_user_resources)
+    """
+    return await statements.fetch(
+        connection,
+        APPLY_CRAFT_MILL_BATCH,
+        user_id,
+        list(card_deltas),
+        list(card_deltas.values()),
+        list(leader_deltas),
+        list(leader_deltas.values()),
+        scraps_delta,
+        reason,
+    )
+
+
+GET_USER_RESOURCES = statements.register(
+    "progress.get_user_resources",
+    """
+        SELECT scraps, kegs, big_kegs, chests, wood, keys
+        FROM user_balances
+        WHERE id = $1
+    """,
+)
+
+
+async def get_user_resources(
+    user_id: int,
+    connection: asyncpg.Connection,
+) -> UserResources:
+    user_resources = await statements.fetchrow(
+        connection,
+        GET_USER_RESOURCES,
         user_id,
     )
     return UserResources(
@@ -539,11 +622,154 @@ async def get_user_resources(
     )
 
 
-async def get_game_constants(
+# первый ключ advisory-блокировки ресурсов юзера, второй - id юзера
+USER_RESOURCES_LOCK_CLASS = 1
+
+LOCK_USER_RESOURCES = statements.register(
+    "progress.lock_user_resources",
+    """
+        SELECT pg_advisory_xact_lock($1, $2)
+    """,
+)
+
+
+async def lock_user_resources(
     connection: asyncpg.Connection,
-) -> dict:
-    game_constants: dict = await connection.fetchval("""SELECT data::jsonb FROM game_constants""")
-    return game_constants
+    user_id: int,
+) -> None:
+    """
+    Сериализует списания ресурсов юзера до конца транзакции. Отдельной командой, а не внутри запроса списания:
+    в read committed снимок берется на старте команды, и баланс нужно читать уже после получения блокировки.
+    Начисления журнал пишет без блокировки - они не могут увести баланс в минус
+    """
+    await statements.execute(
+        connection,
+        LOCK_USER_RESOURCES,
+        USER_RESOURCES_LOCK_CLASS,
+        user_id,
+    )
+
+
+# дельты всех ресурсов сразу (нулевые для неизменных) - текст запроса один на любой набор ресурсов.
+# $10 - проверять, что списания не уводят баланс в минус; запись с уже известным idempotency_key не добавляется
+APPEND_USER_RESOURCES = statements.register(
+    "progress.append_user_resources",
+    """
+        WITH balance AS (
+            SELECT scraps, kegs, big_kegs, chests, wood, keys
+            FROM user_balances
+            WHERE id = $1
+        ),
+        appended AS (
+            INSERT INTO user_resource_ledger
+            (user_id, reason, idempotency_key, scraps, kegs, big_kegs, chests, wood, keys)
+            SELECT $1, $2, $3, $4, $5, $6, $7, $8, $9
+            FROM balance
+            WHERE
+                NOT $10
+                OR (
+                    ($4 >= 0 OR balance.scraps + $4 >= 0)
+                    AND ($5 >= 0 OR balance.kegs + $5 >= 0)
+                    AND ($6 >= 0 OR balance.big_kegs + $6 >= 0)
+                    AND ($7 >= 0 OR balance.chests + $7 >= 0)
+                    AND ($8 >= 0 OR balance.wood + $8 >= 0)
+                    AND ($9 >= 0 OR balance.keys + $9 >= 0)
+                )
+            ON CONFLICT (user_id, idempotency_key) DO NOTHING
+            RETURNING scraps, kegs, big_kegs, chests, wood, keys
+        )
+        SELECT
+            appended.scraps IS NOT NULL AS appended,
+            EXISTS (
+                SELECT 1
+                FROM user_resource_ledger
+                WHERE user_id = $1 AND idempotency_key = $3
+            ) AS duplicate,
+            balance.scraps + COALESCE(appended.scraps, 0) AS scraps,
+            balance.kegs + COALESCE(appended.kegs, 0) AS kegs,
+            balance.big_kegs + COALESCE(appended.big_kegs, 0) AS big_kegs,
+            balance.chests + COALESCE(appended.chests, 0) AS chests,
+            balance.wood + COALESCE(appended.wood, 0) AS wood,
+            balance.keys + COALESCE(appended.keys, 0) AS keys
+        FROM balance
+        LEFT JOIN appended ON TRUE
+    """,
+)
+
+
+async def append_user_resources(
+    connection: asyncpg.Connection,
+    user_id: int,
+    reason: str,
+    resources_to_change: dict[ResourceType, int],
+    idempotency_key: str | None = None,
+    check_negative: bool = False,
+) -> asyncpg.Record:
+    """
+    Пишет изменение ресурсов строкой журнала и возвращает баланс после него.
+    appended = false, если запись не добавлена: либо списание увело бы баланс в минус (check_negative),
+    либо запись с таким idempotency_key уже есть (duplicate = true) - тогда баланс текущий.
+    check_negative без lock_user_resources в той же транзакции от гонки двух списаний не защищает
+    """
+    return await statements.fetchrow(
+        connection,
+        APPEND_USER_RESOURCES,
+        user_id,
+        reason,
+        idempotency_key,
+        resources_to_change.get(ResourceType.SCRAPS, 0),
+        resources_to_change.get(ResourceType.KEGS, 0),
+        resources_to_change.get(ResourceType.BIG_KEGS, 0),
+        resources_to_change.get(ResourceType.CHESTS, 0),
+        resources_to_change.get(ResourceType.WOOD, 0),
+        resources_to_change.get(ResourceType.KEYS, 0),
+        check_negative,
+    )
+
+
+GET_USER_PROGRESS_REVISION = statements.register(
+    "progress.get_user_progress_revision",
+    """
+        SELECT COALESCE((SELECT revision FROM user_progress_revisions WHERE user_id = $1), 0)
+    """,
+)
+
+
+async def get_user_progress_revision(
+    connection: asyncpg.Connection,
+    user_id: int,
+) -> int:
+    """
+    Дешевая версия прогресса юзера для ETag: ревизию поднимает триггер при любом изменении строк прогресса,
+    включая удаление. max updated_at для этого не годится - это время начала транзакции, и транзакция,
+    закоммиченная позже, может оставить его прежним
+    """
+    return await statements.fetchval(
+        connection,
+        GET_USER_PROGRESS_REVISION,
+        user_id,
+    )
+
+
+GET_USER_RESOURCES_ROW = statements.register(
+    "progress.get_user_resources_row",
+    """
+        SELECT scraps, kegs, big_kegs, chests, wood, keys, updated_at
+        FROM user_balances
+        WHERE id = $1
+    """,
+)
+
+
+async def get_user_resources_row(
+    connection: asyncpg.Connection,
+    user_id: int,
+) -> asyncpg.Record:
+    return await statements.fetchrow(
+        connection,
+        GET_USER_RESOURCES_ROW,
+        user_id,
+    )
 
 
 async def open_default_content(
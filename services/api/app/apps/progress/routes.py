@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, Path, Request
+from fastapi import APIRouter, Depends, Header, Path, Query, Request, Response, status
 from services.api.app.apps.auth import dependencies as auth_dependencies
 from services.api.app.apps.progress.schemas import (
     CardCraftBonusRequest,
     CardCraftBonusResponse,
+    CardCraftMillBatchRequest,
+    CardCraftMillBatchResponse,
     CardCraftMillRequest,
     CardCraftMillResponse,
     CreateDeckRequest,
@@ -10,26 +12,60 @@ from services.api.app.apps.progress.schemas import (
     OpenRelatedLevelsResponse,
     ResourcesRequest,
     UserProgressResponse,
+    UserProgressSyncResponse,
     UserResources,
 )
 from services.api.app.apps.progress.service import UserProgressService
 from services.api.app.dependencies import get_user_progress_service
+from services.api.app.middlewares.etag import etag_dependency
 
 
 router = APIRouter()
 
 
-@router.get("/{user_id}")
+async def user_progress_version(
+    request: Request,
+    user_progress_service: UserProgressService = Depends(get_user_progress_service),
+    user_id: int = Path(..., gt=0),
+) -> str:
+    return await user_progress_service.get_user_progress_version(
+        user_id=user_id,
+        base_url=str(request.base_url),
+    )
+
+
+@router.get("/{user_id}", response_model=UserProgressResponse)
 async def get_user_progress(
+    request: Request,
+    _=Depends(auth_dependencies.validate_user),
+    etag: str = Depends(etag_dependency(user_progress_version)),
+    user_progress_service: UserProgressService = Depends(get_user_progress_service),
+    user_id: int = Path(..., gt=0),
+) -> Response:
+    # ответ большой, поэтому отдаем уже готовый json, без повторной валидации и сериализации моделей
+    content: bytes = await user_progress_service.get_user_progress_json(
+        user_id=user_id,
+        base_url=str(request.base_url),
+    )
+    return Response(content=content, media_type="application/json", headers={"ETag": etag})
+
+
+@router.get("/{user_id}/sync", response_model=UserProgressSyncResponse)
+async def sync_user_progress(
     request: Request,
     _=Depends(auth_dependencies.validate_user),
     user_progress_service: UserProgressService = Depends(get_user_progress_service),
     user_id: int = Path(..., gt=0),
-) -> UserProgressResponse:
-    return await user_progress_service.get_user_progress(
+    since: str | None = Query(None, description="token из предыдущего ответа sync"),
+) -> UserProgressSyncResponse | Response:
+    sync_response: UserProgressSyncResponse | None = await user_progress_service.sync_user_progress(
         user_id=user_id,
         base_url=str(request.base_url),
+        token=since,
     )
+    if sync_response is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    return sync_response
 
 
 @router.post("/{user_id}/create-deck")
@@ -39,11 +75,13 @@ async def create_user_deck(
     _=Depends(auth_dependencies.validate_user),
     user_progress_service: UserProgressService = Depends(get_user_progress_service),
     user_id: int = Path(..., gt=0),
+    compact: bool = Query(False, description="вернуть только измененные данные"),
 ) -> ListDecksResponse:
     return await user_progress_service.create_user_deck(
         user_id=user_id,
         deck=deck,
         base_url=str(request.base_url),
+        compact=compact,
     )
 
 
@@ -54,11 +92,13 @@ async def delete_user_deck(
     user_progress_service: UserProgressService = Depends(get_user_progress_service),
     user_id: int = Path(..., gt=0),
     deck_id: int = Path(..., gt=0),
+    compact: bool = Query(False, description="вернуть только измененные данные"),
 ) -> ListDecksResponse:
     return await user_progress_service.delete_user_deck(
         user_id=user_id,
         deck_id=deck_id,
         base_url=str(request.base_url),
+        compact=compact,
     )
 
 
@@ -70,12 +110,14 @@ async def change_user_deck(
     user_progress_service: UserProgressService = Depends(get_user_progress_service),
     user_id: int = Path(..., gt=0),
     deck_id: int = Path(..., gt=0),
+    compact: bool = Query(False, description="вернуть только измененные данные"),
 ) -> ListDecksResponse:
     return await user_progress_service.patch_user_deck(
         user_id=user_id,
         deck_id=deck_id,
         deck=deck,
         base_url=str(request.base_url),
+        compact=compact,
     )
 
 
@@ -85,10 +127,17 @@ async def manage_resources(
     _=Depends(auth_dependencies.validate_user),
     user_progress_service: UserProgressService = Depends(get_user_progress_service),
     user_id: int = Path(..., gt=0),
+    idempotency_key: str | None = Header(
+        None,
+        alias="Idempotency-Key",
+        max_length=128,
+        description="повтор запроса с тем же ключом не меняет ресурсы повторно",
+    ),
 ) -> UserResources:
     return await user_progress_service.manage_resources(
         user_id=user_id,
         resource_request=resource_request,
+        idempotency_key=idempotency_key,
     )
 
 
@@ -100,12 +149,31 @@ async def manage_craft_mill_card(
     user_progress_service: UserProgressService = Depends(get_user_progress_service),
     user_id: int = Path(..., gt=0),
     card_id: int = Path(..., gt=0),
+    compact: bool = Query(False, description="вернуть только измененные данные"),
 ) -> CardCraftMillResponse:
     return await user_progress_service.manage_craft_mill_process(
         user_id=user_id,
         card_id=card_id,
         subtype=card_request.subtype,
         base_url=str(request.base_url),
+        compact=compact,
+    )
+
+
+@router.post("/{user_id}/cards/batch")
+async def manage_craft_mill_batch(
+    request: Request,
+    batch_request: CardCraftMillBatchRequest,
+    _=Depends(auth_dependencies.validate_user),
+    user_progress_service: UserProgressService = Depends(get_user_progress_service),
+    user_id: int = Path(..., gt=0),
+    compact: bool = Query(False, description="вернуть только измененные данные"),
+) -> CardCraftMillBatchResponse:
+    return await user_progress_service.manage_craft_mill_batch(
+        user_id=user_id,
+        operations=batch_request.operations,
+        base_url=str(request.base_url),
+        compact=compact,
     )
 
 
@@ -116,11 +184,13 @@ async def craft_bonus_cards(
     _=Depends(auth_dependencies.validate_user),
     user_progress_service: UserProgressService = Depends(get_user_progress_service),
     user_id: int = Path(..., gt=0),
+    compact: bool = Query(False, description="вернуть только измененные данные"),
 ) -> CardCraftBonusResponse:
     return await user_progress_service.craft_bonus_cards(
         user_id=user_id,
         cards_ids=craft_bonus_request.cards_ids,
         base_url=str(request.base_url),
+        compact=compact,
     )
 
 
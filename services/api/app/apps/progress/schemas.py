@@ -1,8 +1,62 @@
+from enum import StrEnum
+from functools import cached_property
+
 from lib.utils.schemas import Base
-from lib.utils.schemas.game import CardActionSubtype, LevelDifficulty, ResourceActionSubtype
+from lib.utils.schemas.game import CardActionSubtype, CardColorName, LevelDifficulty, ResourceActionSubtype
+from pydantic import ConfigDict, Field
 from services.api.app.apps.cards.schemas import Card, Deck, Enemy, EnemyLeader, Leader
 
 
+class UserProgressEngine(StrEnum):
+    CATALOG = "catalog"
+    SQL = "sql"
+
+
+class GameConstants(Base):
+    """
+    Игровые константы из game_constants.data.
+    Типизируем только то, что использует бэкенд, остальные ключи (для фронта) храним как есть
+    """
+
+    model_config = ConfigDict(extra="allow")
+
+    craft_bronze: int
+    craft_silver: int
+    craft_gold: int
+    craft_leader: int
+    mill_bronze: int
+    mill_silver: int
+    mill_gold: int
+    mill_leader: int
+    play_level_easy: int
+    play_level_normal: int
+    play_level_hard: int
+
+    @cached_property
+    def craft_card(self) -> dict[CardColorName, int]:
+        return {
+            CardColorName.BRONZE: self.craft_bronze,
+            CardColorName.SILVER: self.craft_silver,
+            CardColorName.GOLD: self.craft_gold,
+        }
+
+    @cached_property
+    def mill_card(self) -> dict[CardColorName, int]:
+        return {
+            CardColorName.BRONZE: self.mill_bronze,
+            CardColorName.SILVER: self.mill_silver,
+            CardColorName.GOLD: self.mill_gold,
+        }
+
+    @cached_property
+    def play_level(self) -> dict[LevelDifficulty, int]:
+        return {
+            LevelDifficulty.EASY: self.play_level_easy,
+            LevelDifficulty.NORMAL: self.play_level_normal,
+            LevelDifficulty.HARD: self.play_level_hard,
+        }
+
+
 class UserResources(Base):
     scraps: int
     kegs: int
@@ -77,6 +131,39 @@ class UserProgressResponse(Base):
     game_const: dict
 
 
+class UserDatabaseSync(Base):
+    cards: list[UserCard]
+    leaders: list[UserLeader]
+    # колоды отдаем только целиком и только если они поменялись
+    decks: list[UserDeck] | None
+
+
+class UserProgressSyncRemoved(Base):
+    cards: list[int] = []
+    leaders: list[int] = []
+    seasons: list[int] = []
+    enemies: list[int] = []
+    enemy_leaders: list[int] = []
+
+
+class UserProgressSyncResponse(Base):
+    """
+    Изменения прогресса с момента выдачи токена.
+    full - пришел полный прогресс (первая синхронизация, битый токен или слишком старая версия каталога),
+    фронт заменяет все локальные данные, иначе - обновляет полученные сущности по id
+    """
+
+    token: str
+    full: bool
+    user_database: UserDatabaseSync
+    seasons: list[Season]
+    resources: UserResources | None
+    enemies: list[Enemy]
+    enemy_leaders: list[EnemyLeader]
+    game_const: dict | None
+    removed: UserProgressSyncRemoved
+
+
 class CreateDeckRequest(Base):
     deck_name: str
     leader_id: int
@@ -101,6 +188,26 @@ class CardCraftMillResponse(Base):
     resources: UserResources
 
 
+class CardCraftMillOperation(Base):
+    card_id: int = Field(..., gt=0)
+    subtype: CardActionSubtype
+
+
+class CardCraftMillBatchRequest(Base):
+    operations: list[CardCraftMillOperation] = Field(
+        ...,
+        min_length=1,
+        max_length=200,
+    )
+
+
+class CardCraftMillBatchResponse(Base):
+    # в одной пачке могут быть и карты, и лидеры
+    cards: list[UserCard]
+    leaders: list[UserLeader]
+    resources: UserResources
+
+
 class OpenRelatedLevelsResponse(Base):
     seasons: list[Season]
 
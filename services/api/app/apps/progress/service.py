@@ -1,5 +1,8 @@
+import asyncio
+from collections.abc import Awaitable
+from datetime import datetime, timedelta
 import logging
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, TypeVar
 
 import asyncpg
 
@@ -11,22 +14,33 @@ from lib.utils.schemas.game import (
     ResourceActionSubtype,
     ResourceType,
 )
-from services.api.app.apps.progress import logic
+from services.api.app.apps.progress import json_engine, logic
+from services.api.app.apps.progress.catalog import Catalog, CatalogCache, CatalogFingerprints, CatalogView
 from services.api.app.apps.progress.schemas import (
     CardCraftBonusResponse,
+    CardCraftMillBatchResponse,
+    CardCraftMillOperation,
     CardCraftMillResponse,
     CreateDeckRequest,
+    GameConstants,
     ListDecksResponse,
     OpenRelatedLevelsResponse,
     ResourcesRequest,
     UserCard,
     UserDatabase,
+    UserDatabaseSync,
+    UserDeck,
     UserLeader,
+    UserProgressEngine,
     UserProgressResponse,
+    UserProgressSyncRemoved,
+    UserProgressSyncResponse,
     UserResources,
 )
+from services.api.app.apps.progress.sync import SyncToken, diff_fingerprints, from_watermark, hash_decks, to_watermark
 from services.api.app.config import Config
 from services.api.app.exceptions.exceptions import CraftMillCardProcessError, ManageResourcesProcessError
+from services.api.app.utils.images import build_image_url
 
 
 if TYPE_CHECKING:
@@ -35,63 +49,319 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# reason строки журнала ресурсов для пачки крафтов/миллов, у одиночных операций и ресурсов - их подтип
+CRAFT_MILL_BATCH_REASON = "craft_mill_batch"
+
 
 class UserProgressService:
     def __init__(
         self,
         db_pool: Database,
         config: Config,
+        catalog: CatalogCache,
     ):
         self.db_pool = db_pool
         self.config = config
+        self.catalog = catalog
+
+    async def _get_catalog(
+        self,
+        base_url: str,
+    ) -> CatalogView:
+        catalog = await self.catalog.get()
+        return catalog.view(base_url)
 
     async def get_user_progress(
         self,
         user_id: int,
         base_url: str,
     ) -> UserProgressResponse:
-        async with self.db_pool.connection() as connection:
+        if self.config.USER_PROGRESS_ENGINE == UserProgressEngine.SQL:
+            async with self.db_pool.connection(readonly=True, user_id=user_id) as connection:
+                user_progress: dict = await json_engine.get_user_progress_json(
+                    connection=connection,
+                    user_id=user_id,
+                    media_url=build_image_url(base_url, ""),
+                )
+            return UserProgressResponse.model_validate(user_progress)
+
+        catalog_snapshot: Catalog = await self.catalog.get()
+        catalog: CatalogView = catalog_snapshot.view(base_url)
+        user_resources, user_cards, user_leaders, user_levels, user_decks = await self._get_user_progress_rows(
+            user_id=user_id,
+            catalog=catalog,
+        )
+
+        return UserProgressResponse(
+            user_database=UserDatabase(
+                cards=logic.construct_user_cards(catalog=catalog, user_cards=user_cards),
+                leaders=logic.construct_user_leaders(catalog=catalog, user_leaders=user_leaders),
+                decks=user_decks,
+            ),
+            resources=user_resources,
+            seasons=logic.construct_seasons(catalog=catalog, user_levels=user_levels),
+            game_const=catalog_snapshot.game_constants_data,
+            enemies=list(catalog.enemies.values()),
+            enemy_leaders=list(catalog.enemy_leaders.values()),
+        )
+
+    async def get_user_progress_json(
+        self,
+        user_id: int,
+        base_url: str,
+    ) -> bytes:
+        """
+        То же самое, что get_user_progress, но сразу готовый json для ответа:
+        статические части каталога сериализованы заранее, модели ответа не строятся
+        """
+        if self.config.USER_PROGRESS_ENGINE == UserProgressEngine.SQL:
+            async with self.db_pool.connection(readonly=True, user_id=user_id) as connection:
+                user_progress: str = await json_engine.get_user_progress_raw(
+                    connection=connection,
+                    user_id=user_id,
+                    media_url=build_image_url(base_url, ""),
+                )
+            return user_progress.encode()
+
+        catalog_snapshot: Catalog = await self.catalog.get()
+        catalog: CatalogView = catalog_snapshot.view(base_url)
+        user_resources, user_cards, user_leaders, user_levels, user_decks = await self._get_user_progress_rows(
+            user_id=user_id,
+            catalog=catalog,
+        )
+
+        return logic.dump_user_progress(
+            catalog=catalog,
+            game_constants_json=catalog_snapshot.game_constants_json,
+            user_cards=user_cards,
+            user_leaders=user_leaders,
+            user_levels=user_levels,
+            user_decks=user_decks,
+            user_resources=user_resources,
+        )
+
+    async def _get_user_progress_rows(
+        self,
+        user_id: int,
+        catalog: CatalogView,
+    ) -> tuple[UserResources, dict, dict, dict, list[UserDeck]]:
+        if self.config.USER_PROGRESS_CONCURRENT_FETCH:
+            return await self._get_user_progress_rows_concurrent(user_id=user_id, catalog=catalog)
+
+        async with self.db_pool.connection(readonly=True, user_id=user_id) as connection:
             user_resources: UserResources = await logic.get_user_resources(
                 connection=connection,
                 user_id=user_id,
             )
 
-            game_constants: dict = await logic.get_game_constants(
+            user_cards, user_leaders, user_levels = await logic.get_user_collection(
                 connection=connection,
+                user_id=user_id,
             )
 
-            enemies, enemy_leaders, seasons = await logic.process_enemies(
+            user_decks: list[UserDeck] = await logic.construct_user_decks(
                 connection=connection,
                 user_id=user_id,
-                base_url=base_url,
+                catalog=catalog,
             )
 
-            user_cards, user_leaders, user_decks = await logic.process_cards(
+        return user_resources, user_cards, user_leaders, user_levels, user_decks
+
+    async def _get_user_progress_rows_concurrent(
+        self,
+        user_id: int,
+        catalog: CatalogView,
+    ) -> tuple[UserResources, dict, dict, dict, list[UserDeck]]:
+        """
+        Те же запросы, но параллельно на трех соединениях: время ответа - самый долгий запрос, а не сумма.
+        Согласованность как у одного соединения - первое экспортирует снимок, остальные его импортируют
+        """
+        async with self.db_pool.connections(3, readonly=True, user_id=user_id) as (
+            connection,
+            collection_connection,
+            decks_connection,
+        ):
+            async with connection.transaction(isolation="repeatable_read", readonly=True):
+                snapshot_id: str = await connection.fetchval("""SELECT pg_export_snapshot()""")
+                user_resources, (user_cards, user_leaders, user_levels), user_decks = await asyncio.gather(
+                    logic.get_user_resources(connection=connection, user_id=user_id),
+                    self._in_snapshot(
+                        collection_connection,
+                        snapshot_id,
+                        logic.get_user_collection(connection=collection_connection, user_id=user_id),
+                    ),
+                    self._in_snapshot(
+                        decks_connection,
+                        snapshot_id,
+                        logic.construct_user_decks(connection=decks_connection, user_id=user_id, catalog=catalog),
+                    ),
+                )
+
+        return user_resources, user_cards, user_leaders, user_levels, user_decks
+
+    @staticmethod
+    async def _in_snapshot(
+        connection: asyncpg.Connection,
+        snapshot_id: str,
+        query: Awaitable[T],
+    ) -> T:
+        async with connection.transaction(isolation="repeatable_read", readonly=True):
+            # id снимка вернул сам постгрес, параметром SET TRANSACTION его передать нельзя
+            await connection.execute(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+            return await query
+
+    async def get_user_progress_version(
+        self,
+        user_id: int,
+        base_url: str,
+    ) -> str:
+        """Версия ответа get_user_progress для ETag, без сборки самого прогресса"""
+        catalog_snapshot: Catalog = await self.catalog.get()
+        async with self.db_pool.connection(readonly=True, user_id=user_id) as connection:
+            revision: int = await logic.get_user_progress_revision(
                 connection=connection,
                 user_id=user_id,
-                base_url=base_url,
             )
+        return f"{catalog_snapshot.version}:{base_url}:{revision}"
 
-        return UserProgressResponse(
-            user_database=UserDatabase(
-                cards=user_cards,
-                leaders=user_leaders,
-                decks=user_decks,
+    async def sync_user_progress(
+        self,
+        user_id: int,
+        base_url: str,
+        token: str | None,
+    ) -> UserProgressSyncResponse | None:
+        """
+        Изменения прогресса с момента выдачи token (без токена - полный прогресс).
+        Каталог сравниваем по хешам сущностей его версий, строки юзера - по updated_at.
+        None - ничего не поменялось
+        """
+        catalog_snapshot: Catalog = await self.catalog.get()
+        catalog: CatalogView = catalog_snapshot.view(base_url)
+
+        previous: SyncToken | None = SyncToken.decode(token)
+        if previous is not None and previous.user_id != user_id:
+            previous = None
+        old_fingerprints: CatalogFingerprints | None = (
+            self.catalog.get_fingerprints(previous.catalog_version) if previous else None
+        )
+        full = old_fingerprints is None
+
+        async with self.db_pool.connection(readonly=True, user_id=user_id) as connection:
+            # строки юзера и колоды читаем из одного снимка, иначе метка в токене может обогнать колоды
+            async with connection.transaction(isolation="repeatable_read", readonly=True):
+                user_cards, user_leaders, user_levels = await logic.get_user_collection(
+                    connection=connection,
+                    user_id=user_id,
+                )
+                user_resources = await logic.get_user_resources_row(
+                    connection=connection,
+                    user_id=user_id,
+                )
+                user_decks: list[UserDeck] = await logic.construct_user_decks(
+                    connection=connection,
+                    user_id=user_id,
+                    catalog=catalog,
+                )
+
+        rows = [*user_cards.values(), *user_leaders.values(), *user_levels.values(), user_resources]
+        new_token = SyncToken(
+            user_id=user_id,
+            catalog_version=catalog_snapshot.version,
+            watermark=to_watermark(max(row["updated_at"] for row in rows)),
+            decks_hash=hash_decks(user_decks),
+        )
+
+        if full:
+            return UserProgressSyncResponse(
+                token=new_token.encode(),
+                full=True,
+                user_database=UserDatabaseSync(
+                    cards=logic.construct_user_cards(catalog=catalog, user_cards=user_cards),
+                    leaders=logic.construct_user_leaders(catalog=catalog, user_leaders=user_leaders),
+                    decks=user_decks,
+                ),
+                seasons=logic.construct_seasons(catalog=catalog, user_levels=user_levels),
+                resources=self._to_user_resources(user_resources),
+                enemies=list(catalog.enemies.values()),
+                enemy_leaders=list(catalog.enemy_leaders.values()),
+                game_const=catalog_snapshot.game_constants_data,
+                removed=UserProgressSyncRemoved(),
+            )
+
+        # 304 решает только токен: окно перечитывания ниже лишь выбирает строки для ответа, иначе любая
+        # запись юзера давала бы 200 еще USER_PROGRESS_SYNC_OVERLAP_SECONDS
+        if new_token == previous:
+            return None
+
+        since: datetime = from_watermark(previous.watermark) - timedelta(
+            seconds=self.config.USER_PROGRESS_SYNC_OVERLAP_SECONDS,
+        )
+
+        new_fingerprints: CatalogFingerprints = catalog_snapshot.fingerprints
+        card_ids, removed_cards = diff_fingerprints(old_fingerprints.cards, new_fingerprints.cards)
+        leader_ids, removed_leaders = diff_fingerprints(old_fingerprints.leaders, new_fingerprints.leaders)
+        enemy_ids, removed_enemies = diff_fingerprints(old_fingerprints.enemies, new_fingerprints.enemies)
+        enemy_leader_ids, removed_enemy_leaders = diff_fingerprints(
+            old_fingerprints.enemy_leaders,
+            new_fingerprints.enemy_leaders,
+        )
+        season_ids, removed_seasons = diff_fingerprints(old_fingerprints.seasons, new_fingerprints.seasons)
+
+        card_ids |= {card_id for card_id, row in user_cards.items() if row["updated_at"] > since}
+        leader_ids |= {leader_id for leader_id, row in user_leaders.items() if row["updated_at"] > since}
+        # сезон отдаем целиком, если поменялся хотя бы один его уровень у юзера
+        changed_levels = {level_id for level_id, row in user_levels.items() if row["updated_at"] > since}
+        season_ids |= {season.id for season in catalog.seasons if changed_levels.intersection(season.level_ids)}
+
+        return UserProgressSyncResponse(
+            token=new_token.encode(),
+            full=False,
+            user_database=UserDatabaseSync(
+                cards=logic.construct_user_cards(catalog=catalog, user_cards=user_cards, card_ids=card_ids),
+                leaders=logic.construct_user_leaders(catalog=catalog, user_leaders=user_leaders, leader_ids=leader_ids),
+                decks=user_decks if new_token.decks_hash != previous.decks_hash else None,
+            ),
+            seasons=logic.construct_seasons(catalog=catalog, user_levels=user_levels, season_ids=season_ids),
+            resources=(self._to_user_resources(user_resources) if user_resources["updated_at"] > since else None),
+            enemies=[enemy for enemy_id, enemy in catalog.enemies.items() if enemy_id in enemy_ids],
+            enemy_leaders=[
+                enemy_leader
+                for enemy_leader_id, enemy_leader in catalog.enemy_leaders.items()
+                if enemy_leader_id in enemy_leader_ids
+            ],
+            game_const=(
+                catalog_snapshot.game_constants_data
+                if old_fingerprints.game_constants != new_fingerprints.game_constants
+                else None
+            ),
+            removed=UserProgressSyncRemoved(
+                cards=removed_cards,
+                leaders=removed_leaders,
+                seasons=removed_seasons,
+                enemies=removed_enemies,
+                enemy_leaders=removed_enemy_leaders,
             ),
-            resources=user_resources,
-            seasons=seasons,
-            game_const=game_constants,
-            enemies=enemies,
-            enemy_leaders=enemy_leaders,
         )
 
+    @staticmethod
+    def _to_user_resources(
+        row: asyncpg.Record,
+    ) -> UserResources:
+        return UserResources.model_validate({field: row[field] for field in UserResources.model_fields})
+
     async def create_user_deck(
         self,
         user_id: int,
         deck: CreateDeckRequest,
         base_url: str,
+        compact: bool = False,
     ) -> ListDecksResponse:
-        async with self.db_pool.transaction() as connection:
+        """compact - вернуть только созданную колоду, иначе все колоды юзера (для старых клиентов)"""
+        catalog: CatalogView = await self._get_catalog(base_url)
+
+        async with self.db_pool.transaction(user_id=user_id) as connection:
             deck_id = await connection.fetchval(
                 """
                     INSERT INTO decks
@@ -126,10 +396,11 @@ class UserProgressService:
                 deck_id,
             )
 
-            _, _, user_decks = await logic.process_cards(
+            user_decks: list[UserDeck] = await logic.construct_user_decks(
                 connection=connection,
                 user_id=user_id,
-                base_url=base_url,
+                catalog=catalog,
+                deck_id=deck_id if compact else None,
             )
             print("STR121", len(user_decks))
 
@@ -142,8 +413,12 @@ class UserProgressService:
         user_id: int,
         deck_id: int,
         base_url: str,
+        compact: bool = False,
     ) -> ListDecksResponse:
-        async with self.db_pool.transaction() as connection:
+        """compact - пустой список (фронт сам убирает удаленную колоду), иначе все оставшиеся колоды юзера"""
+        catalog: CatalogView = await self._get_catalog(base_url)
+
+        async with self.db_pool.transaction(user_id=user_id) as connection:
             await connection.execute(
                 """
                 DELETE FROM user_decks
@@ -170,10 +445,13 @@ class UserProgressService:
                 """,
                 deck_id,
             )
-            _, _, user_decks = await logic.process_cards(
+            if compact:
+                return ListDecksResponse(decks=[])
+
+            user_decks: list[UserDeck] = await logic.construct_user_decks(
                 connection=connection,
                 user_id=user_id,
-                base_url=base_url,
+                catalog=catalog,
             )
             print("STR183", len(user_decks))
 
@@ -187,8 +465,12 @@ class UserProgressService:
         deck_id: int,
         deck: CreateDeckRequest,
         base_url: str,
+        compact: bool = False,
     ) -> ListDecksResponse:
-        async with self.db_pool.transaction() as connection:
+        """compact - вернуть только измененную колоду, иначе все колоды юзера"""
+        catalog: CatalogView = await self._get_catalog(base_url)
+
+        async with self.db_pool.transaction(user_id=user_id) as connection:
             await connection.fetchrow(
                 """
                     UPDATE decks
@@ -222,10 +504,11 @@ class UserProgressService:
                 card_decks,
             )
 
-            _, _, user_decks = await logic.process_cards(
+            user_decks: list[UserDeck] = await logic.construct_user_decks(
                 connection=connection,
                 user_id=user_id,
-                base_url=base_url,
+                catalog=catalog,
+                deck_id=deck_id if compact else None,
             )
             print("STR235", len(user_decks))
 
@@ -237,7 +520,12 @@ class UserProgressService:
         self,
         user_id: int,
         resource_request: ResourcesRequest,
+        idempotency_key: str | None = None,
     ) -> UserResources:
+        """
+        Каждое изменение - строка в журнале ресурсов (см. logic.append_user_resources).
+        Повтор запроса с тем же idempotency_key ничего не меняет и возвращает текущий баланс
+        """
         logger.info("Got here for user %s, resource request: %s", user_id, resource_request)
         subtype: ResourceActionSubtype = resource_request.subtype
 
@@ -246,53 +534,46 @@ class UserProgressService:
                 """ { subtype: start_game, data: {level_id: int}} """
                 level_id: int = resource_request.data["level_id"]
 
-                async with self.db_pool.transaction() as connection:
-                    difficulty: LevelDifficulty = await connection.fetchval(
-                        """
-                            SELECT difficulty
-                            FROM levels
-                            WHERE levels.id = $1
-                        """,
-                        level_id,
-                    )
-
-                    game_constants: dict = await logic.get_game_constants(
-                        connection=connection,
-                    )
-
-                    if difficulty == LevelDifficulty.EASY:
-                        pay_resources = {ResourceType.WOOD: game_constants["play_level_easy"]}
-                    elif difficulty == LevelDifficulty.NORMAL:
-                        pay_resources = {ResourceType.WOOD: game_constants["play_level_normal"]}
-                    elif difficulty == LevelDifficulty.HARD:
-                        pay_resources = {ResourceType.WOOD: game_constants["play_level_hard"]}
-                    else:
-                        raise TypeError(f"Invalid level difficulty {difficulty}")
-
-                    user_resources: UserResources = await self._change_resources(
+                # сложность уровня и стоимость игры берем из кеша каталога
+                catalog: Catalog = await self.catalog.get()
+                difficulty: LevelDifficulty | None = catalog.level_difficulties.get(level_id)
+                play_level_cost: int | None = catalog.game_constants.play_level.get(difficulty)
+                if play_level_cost is None:
+                    raise TypeError(f"Invalid level difficulty {difficulty}")
+                pay_resources = {ResourceType.WOOD: play_level_cost}
+
+                async with self.db_pool.transaction(user_id=user_id) as connection:
+                    await logic.lock_user_resources(connection=connection, user_id=user_id)
+                    row: asyncpg.Record = await self._change_resources(
                         connection=connection,
                         user_id=user_id,
+                        subtype=subtype,
                         resources_to_change=pay_resources,
+                        idempotency_key=idempotency_key,
+                        check_negative=True,
                     )
 
-                    if user_resources.wood < 0:
-                        msg = "Can not change resources for user %s, seems to be negative value wood"
-                        logger.error(msg, user_id)
-                        raise ManageResourcesProcessError(msg, user_id)
+                if not row["appended"] and not row["duplicate"]:
+                    msg = "Can not change resources for user %s, seems to be negative value wood"
+                    logger.error(msg, user_id)
+                    raise ManageResourcesProcessError(msg, user_id)
 
-                    return user_resources
+                return self._to_user_resources(row)
 
             case subtype.WIN_SEASON_LEVEL:
                 """
                 data: { wood: 201, scraps: 185, etc }
                 Тут придет словарь с ресурсами, которые нужно начислить
                 """
-                async with self.db_pool.connection() as connection:
-                    return await self._change_resources(
+                async with self.db_pool.connection(user_id=user_id) as connection:
+                    row: asyncpg.Record = await self._change_resources(
                         connection=connection,
                         user_id=user_id,
+                        subtype=subtype,
                         resources_to_change=resource_request.data,
+                        idempotency_key=idempotency_key,
                     )
+                return self._to_user_resources(row)
 
             case subtype.BONUS_REWARD:
                 """
@@ -300,20 +581,23 @@ class UserProgressService:
                 Тут придет словарь с ресурсами, которые нужно списать или наоборот начислить
                 Отличие от бонуса в том, что тут нужно проверять, не стало ли минус, и кинуть ошибку если стало
                 """
-                async with self.db_pool.transaction() as connection:
-                    user_resources: UserResources = await self._change_resources(
+                async with self.db_pool.transaction(user_id=user_id) as connection:
+                    await logic.lock_user_resources(connection=connection, user_id=user_id)
+                    row: asyncpg.Record = await self._change_resources(
                         connection=connection,
                         user_id=user_id,
+                        subtype=subtype,
                         resources_to_change=resource_request.data,
+                        idempotency_key=idempotency_key,
+                        check_negative=True,
                     )
 
-                    for resource in resource_request.data:
-                        if getattr(user_resources, resource) < 0:
-                            msg = "Can not process bonus resources for user %s, seems to be negative value for %s"
-                            logger.error(msg, user_id, resource)
-                            raise ManageResourcesProcessError(msg, user_id)
+                if not row["appended"] and not row["duplicate"]:
+                    msg = "Can not process bonus resources for user %s, seems to be negative value for %s"
+                    logger.error(msg, user_id, list(resource_request.data))
+                    raise ManageResourcesProcessError(msg, user_id)
 
-                    return user_resources
+                return self._to_user_resources(row)
 
             case _:
                 raise TypeError(f"Invalid subtype {subtype}")
@@ -322,31 +606,29 @@ class UserProgressService:
         self,
         connection: asyncpg.Connection,
         user_id: int,
+        subtype: ResourceActionSubtype,
         resources_to_change: dict[ResourceType:int],
-    ) -> UserResources:
-        set_parts = []
-        query_params = [user_id]
-
-        for i, (resource, delta) in enumerate(resources_to_change.items(), start=2):
-            set_parts.append(f"{resource} = {resource} + ${i}")
-            query_params.append(delta)
-
-        query = f"""
-            UPDATE user_resources
-            SET {", ".join(set_parts)}
-            WHERE id = $1
-            RETURNING *
-        """  # noqa: S608
-
-        result = await connection.fetchrow(query, *query_params)
-        return UserResources(
-            wood=result["wood"],
-            scraps=result["scraps"],
-            kegs=result["kegs"],
-            big_kegs=result["big_kegs"],
-            chests=result["chests"],
-            keys=result["keys"],
+        idempotency_key: str | None,
+        check_negative: bool = False,
+    ) -> asyncpg.Record:
+        unknown_resources = resources_to_change.keys() - set(ResourceType)
+        if unknown_resources:
+            msg = "Can not change resources for user %s, unknown resources %s"
+            logger.error(msg, user_id, unknown_resources)
+            raise ManageResourcesProcessError(msg, user_id)
+
+        row: asyncpg.Record = await logic.append_user_resources(
+            connection=connection,
+            user_id=user_id,
+            reason=subtype,
+            resources_to_change=resources_to_change,
+            idempotency_key=idempotency_key,
+            check_negative=check_negative,
         )
+        if row["duplicate"]:
+            msg = "Resources change with idempotency key %s for user %s is already applied"
+            logger.info(msg, idempotency_key, user_id)
+        return row
 
     async def manage_craft_mill_process(
         self,
@@ -354,327 +636,222 @@ class UserProgressService:
         card_id: int,
         subtype: CardActionSubtype,
         base_url: str,
+        compact: bool = False,
     ) -> CardCraftMillResponse:
-        logger.info("Got here for user %s trying (subtype %s) for card %s", user_id, subtype, card_id)
-        match subtype:
-            case subtype.CRAFT_CARD:
-                async with self.db_pool.transaction() as connection:
-                    # 1. Спишем ресурсы за созданную карту
-                    # 1.1. Ищем цвет карты, чтобы понять, сколько за нее начислить
-                    card_color: CardColorName = await connection.fetchval(
-                        """
-                            SELECT colors.name
-                            FROM cards
-                            JOIN colors ON cards.color_id = colors.id
-                            WHERE cards.id = $1
-                        """,
-                        card_id,
-                    )
-
-                    # 1.2. В константах лежат параметры, сколько списать за крафт той или иной карты
-                    game_constants: dict = await logic.get_game_constants(
-                        connection=connection,
-                    )
-
-                    if card_color == CardColorName.BRONZE:
-                        pay_resources = {ResourceType.SCRAPS: game_constants["craft_bronze"]}
-                    elif card_color == CardColorName.SILVER:
-                        pay_resources = {ResourceType.SCRAPS: game_constants["craft_silver"]}
-                    elif card_color == CardColorName.GOLD:
-                        pay_resources = {ResourceType.SCRAPS: game_constants["craft_gold"]}
-                    else:
-                        logger.error("Unknown color %s", card_color)
-                        raise TypeError(f"Invalid card color {card_color}")
-
-                    # 1.3. Попытались списать ресурсы
-                    user_resources: UserResources = await self._change_resources(
-                        connection=connection,
-                        user_id=user_id,
-                        resources_to_change=pay_resources,
-                    )
-
-                    # 1.4. Если получилось, что ресурсов на списание не хватило, отменяем транзакцию!
-                    if user_resources.scraps < 0:
-                        msg = "Can not craft card %s for user %s, not enough scraps"
-                        logger.error(msg, card_id, user_id)
-                        raise CraftMillCardProcessError(msg, card_id, user_id)
-
-                    # 2. Создаем юзеру карту
-                    # 2.1. Крафтим карту - пытаемся сделать инзерт, а если такая уже есть, делаем count += 1
-                    await connection.fetchrow(
-                        """
-                            INSERT INTO user_cards
-                            (user_id, card_id, count)
-                            VALUES ($1, $2, 1)
-                            ON CONFLICT (user_id, card_id)
-                            DO UPDATE
-                            SET
-                                count = user_cards.count + 1,
-                                updated_at = NOW()
-                        """,
-                        user_id,
-                        card_id,
-                    )
-
-                    # 2.2. После создания возвращаем на фронт весь список UserCard, чтобы обновить там карты
-                    user_cards: list[UserCard] = await logic.get_user_cards(
-                        connection=connection,
-                        user_id=user_id,
-                        base_url=base_url,
-                    )
-
-                    logger.info("Successfully crafted card %s for user %s", card_id, user_id)
-                    return CardCraftMillResponse(
-                        cards=user_cards,
-                        resources=user_resources,
-                    )
-
-            case subtype.CRAFT_LEADER:
-                async with self.db_pool.transaction() as connection:
-                    # 1. Спишем ресурсы за карту лидера
-                    # 1.1. Берем опять же игровые константы
-                    game_constants: dict = await logic.get_game_constants(
-                        connection=connection,
-                    )
-                    # 1.2. А тут проще - не нужно делать запрос, мы всегда знаем стоимость за крафт лидера
-                    pay_resources = {ResourceType.SCRAPS: game_constants["craft_leader"]}
-
-                    # 1.3. Попытались списать ресурсы
-                    user_resources: UserResources = await self._change_resources(
-                        connection=connection,
-                        user_id=user_id,
-                        resources_to_change=pay_resources,
-                    )
-
-                    # 1.4. Если получилось, что ресурсов на списание не хватило, отменяем транзакцию!
-                    if user_resources.scraps < 0:
-                        msg = "Can not craft leader card %s for user %s, not enough scraps"
-                        logger.error(msg, card_id, user_id)
-                        raise CraftMillCardProcessError(msg, card_id, user_id)
-
-                    # 2. Создаем юзеру карту лидера
-                    # 2.1. Крафтим карту лидера - пытаемся сделать инзерт, а если такая уже есть, делаем count += 1
-                    await connection.fetchrow(
-                        """
-                            INSERT INTO user_leaders
-                            (user_id, leader_id, count)
-                            VALUES ($1, $2, 1)
-                            ON CONFLICT (user_id, leader_id)
-                            DO UPDATE
-                            SET
-                                count = user_leaders.count + 1,
-                                updated_at = NOW()
-                        """,
-                        user_id,
-                        card_id,
-                    )
-
-                    # 2.2. После создания возвращаем на фронт весь список UserLeader, чтобы обновить там лидеров
-                    user_leaders: list[UserLeader] = await logic.get_user_leaders(
-                        connection=connection,
-                        user_id=user_id,
-                        base_url=base_url,
-                    )
-
-                    logger.info("Successfully crafted leader card %s for user %s", card_id, user_id)
-                    return CardCraftMillResponse(
-                        cards=user_leaders,
-                        resources=user_resources,
-                    )
-
-            case subtype.MILL_CARD:
-                async with self.db_pool.transaction() as connection:
-                    # 1. А здесь делаем наоборот - вначале уничтожаем карту, потом начисляем ресурсы
-                    # 1.1. Ищем, карта из дефолтного набора (unlocked) или нет + смотрим ее user_cards.count
-                    user_card: dict = await connection.fetchrow(
-                        """
-                            SELECT
-                                cards.unlocked,
-                                user_cards.id,
-                                user_cards.count
-                            FROM user_cards
-                            JOIN cards ON cards.id = user_cards.card_id
-                            AND user_cards.user_id = $1
-                            AND user_cards.card_id = $2
-                        """,
-                        user_id,
-                        card_id,
-                    )
-
-                    if not user_card:
-                        msg = "Cannot find such card %s for user %s"
-                        logger.error(msg, card_id, user_id)
-                        raise CraftMillCardProcessError(msg, card_id, user_id)
-
-                    # 1.2. Если карта из дефолтного набора и ее у юзера 1, то ее нельзя миллить!
-                    if user_card["unlocked"] and user_card["count"] <= 1:
-                        msg = "Cannot mill default unlocked card %s for user %s"
-                        logger.error(msg, card_id, user_id)
-                        raise CraftMillCardProcessError(msg, card_id, user_id)
-
-                    # 1.3. Если карта НЕ из дефолтного набора, то ее нельзя миллить если ее и так нету
-                    if not user_card["unlocked"] and user_card["count"] <= 0:
-                        msg = "Cannot mill card %s for user %s, seems user doesn't have it"
-                        logger.error(msg, card_id, user_id)
-                        raise CraftMillCardProcessError(msg, card_id, user_id)
-
-                    # 1.4. Пытаемся уничтожить эту карту, поставив ей user_cards.count -= 1
-                    card_count: int = await connection.fetchval(
-                        """
-                            UPDATE user_cards
-                            SET
-                                count = user_cards.count - 1,
-                                updated_at = NOW()
-                            WHERE user_cards.id = $1
-                            RETURNING user_cards.count
-                        """,
-                        user_card["id"],
-                    )
-
-                    # 1.5. Если вдруг как-то карты стало отрицательное значение, отменяем транзакцию
-                    if card_count < 0:
-                        msg = "Cannot mill card %s for user %s, count seems to be negative value"
-                        logger.error(msg, card_id, user_id)
-                        raise CraftMillCardProcessError(msg, card_id, user_id)
-
-                    # 2. А теперь начисляем ресурсы за униточженную карту
-                    # 2.1. Ищем цвет карты, чтобы понять какие ресурсы за нее
-                    card_color: CardColorName = await connection.fetchval(
-                        """
-                            SELECT
-                                colors.name
-                            FROM cards
-                            JOIN colors ON cards.color_id = colors.id
-                            WHERE cards.id = $1
-                        """,
-                        card_id,
-                    )
-
-                    # 2.2. Достаем игровые константы
-                    game_constants: dict = await logic.get_game_constants(
-                        connection=connection,
-                    )
-
-                    if card_color == CardColorName.BRONZE:
-                        pay_resources = {ResourceType.SCRAPS: game_constants["mill_bronze"]}
-                    elif card_color == CardColorName.SILVER:
-                        pay_resources = {ResourceType.SCRAPS: game_constants["mill_silver"]}
-                    elif card_color == CardColorName.GOLD:
-                        pay_resources = {ResourceType.SCRAPS: game_constants["mill_gold"]}
-                    else:
-                        raise TypeError(f"Invalid card color {card_color}")
-
-                    # 2.3. Добавляем тут юзеру ресурсы
-                    user_resources: UserResources = await self._change_resources(
-                        connection=connection,
-                        user_id=user_id,
-                        resources_to_change=pay_resources,
-                    )
-
-                    # 3. Карту уничтожили, ресурсы добавили, можем собирать все карты юзера для ответа
-                    user_cards: list[UserCard] = await logic.get_user_cards(
-                        connection=connection,
-                        user_id=user_id,
-                        base_url=base_url,
-                    )
-
-                    logger.info("Successfully milled card %s for user %s", card_id, user_id)
-                    return CardCraftMillResponse(
-                        cards=user_cards,
-                        resources=user_resources,
-                    )
-
-            case subtype.MILL_LEADER:
-                async with self.db_pool.transaction() as connection:
-                    # 1. А здесь делаем наоборот - вначале уничтожаем карту лидера, потом начисляем ресурсы
-                    # 1.1. Ищем, карта лидера из дефолтного набора (unlocked) или нет + смотрим ее user_leaders.count
-                    user_leader: dict = await connection.fetchrow(
-                        """
-                            SELECT
-                                leaders.unlocked,
-                                user_leaders.id,
-                                user_leaders.count
-                            FROM user_leaders
-                            JOIN leaders ON leaders.id = user_leaders.leader_id
-                            AND user_leaders.user_id = $1
-                            AND user_leaders.leader_id = $2
-                        """,
-                        user_id,
-                        card_id,
-                    )
+        """
+        Каждый подтип - один запрос (см. logic.craft_user_item/mill_user_item): проверки, изменение count
+        и запись в журнал ресурсов выполняются атомарно одной командой. Крафт списывает scraps - перед ним
+        берем блокировку ресурсов юзера, милл только начисляет и идет без транзакции.
+        compact - в ответе только измененная карта/лидер, иначе весь список карт/лидеров юзера
+        """
+        catalog_snapshot: Catalog = await self.catalog.get()
+        catalog: CatalogView = catalog_snapshot.view(base_url)
 
-                    if not user_leader:
-                        msg = "Cannot find such leader card %s for user %s"
-                        logger.error(msg, card_id, user_id)
-                        raise CraftMillCardProcessError(msg, card_id, user_id)
-
-                    # 1.2. Если карта лидера из дефолтного набора и ее у юзера 1, то ее нельзя миллить!
-                    if user_leader["unlocked"] and user_leader["count"] <= 1:
-                        msg = "Cannot mill default unlocked leader card %s for user %s"
-                        logger.error(msg, card_id, user_id)
-                        raise CraftMillCardProcessError(msg, card_id, user_id)
-
-                    # 1.3. Если карта лидера НЕ из дефолтного набора, то ее нельзя миллить если ее и так нету
-                    if not user_leader["unlocked"] and user_leader["count"] <= 0:
-                        msg = "Cannot mill leader card %s for user %s, seems user doesn't have it"
-                        logger.error(msg, card_id, user_id)
-                        raise CraftMillCardProcessError(msg, card_id, user_id)
-
-                    # 1.4. Пытаемся уничтожить эту карту лидера, поставив ей user_leaders.count -= 1
-                    await connection.fetchrow(
-                        """
-                            UPDATE user_leaders
-                            SET
-                                count = user_leaders.count - 1,
-                                updated_at = NOW()
-                            WHERE user_leaders.id = $1
-                        """,
-                        user_leader["id"],
-                    )
-
-                    # 2. А теперь начисляем ресурсы за униточженную карту лидера
-                    # 2.1. С лидером проще - за него всегда одна и та же сумма
-                    game_constants: dict = await logic.get_game_constants(
-                        connection=connection,
-                    )
-                    pay_resources = {ResourceType.SCRAPS: game_constants["mill_leader"]}
-
-                    # 2.2. Добавляем тут юзеру ресурсы
-                    user_resources: UserResources = await self._change_resources(
-                        connection=connection,
-                        user_id=user_id,
-                        resources_to_change=pay_resources,
-                    )
-
-                    # 3. Карту лидера уничтожили, ресурсы добавили, можем собирать все карты лидера юзера для ответа
+        logger.info("Got here for user %s trying (subtype %s) for card %s", user_id, subtype, card_id)
+        kind, scraps_delta, unlocked = self._get_craft_mill_params(
+            catalog=catalog_snapshot,
+            user_id=user_id,
+            card_id=card_id,
+            subtype=subtype,
+        )
 
-                    user_leaders: list[UserLeader] = await logic.get_user_leaders(
+        async with self.db_pool.connection(user_id=user_id) as connection:
+            if subtype in (CardActionSubtype.CRAFT_CARD, CardActionSubtype.CRAFT_LEADER):
+                # если scraps не хватает, запрос ничего не меняет
+                async with connection.transaction():
+                    await logic.lock_user_resources(connection=connection, user_id=user_id)
+                    row = await logic.craft_user_item(
                         connection=connection,
                         user_id=user_id,
-                        base_url=base_url,
+                        kind=kind,
+                        item_id=card_id,
+                        cost=scraps_delta,
+                        reason=subtype,
                     )
+                if row is None:
+                    msg = "Can not craft %s %s for user %s, not enough scraps"
+                    logger.error(msg, kind, card_id, user_id)
+                    raise CraftMillCardProcessError(msg, kind, card_id, user_id)
+            else:
+                # карту из дефолтного набора нельзя миллить до нуля, остальные - пока они есть
+                row = await logic.mill_user_item(
+                    connection=connection,
+                    user_id=user_id,
+                    kind=kind,
+                    item_id=card_id,
+                    reward=scraps_delta,
+                    min_count=1 if unlocked else 0,
+                    reason=subtype,
+                )
+                if row is None:
+                    msg = "Cannot mill %s %s for user %s, seems user doesn't have it"
+                    logger.error(msg, kind, card_id, user_id)
+                    raise CraftMillCardProcessError(msg, kind, card_id, user_id)
+
+            user_resources: UserResources = self._to_user_resources(row)
+            logger.info("Successfully processed %s %s (subtype %s) for user %s", kind, card_id, subtype, user_id)
+
+            if kind == "card":
+                cards: list[UserCard] = (
+                    [UserCard(id=row["id"], count=row["count"], card=catalog.cards[card_id])]
+                    if compact
+                    else await logic.get_user_cards(connection=connection, user_id=user_id, catalog=catalog)
+                )
+                return CardCraftMillResponse(cards=cards, resources=user_resources)
+
+            leaders: list[UserLeader] = (
+                [UserLeader(id=row["id"], count=row["count"], card=catalog.leaders[card_id])]
+                if compact
+                else await logic.get_user_leaders(connection=connection, user_id=user_id, catalog=catalog)
+            )
+            return CardCraftMillResponse(cards=leaders, resources=user_resources)
 
-                    logger.info("Successfully milled leader card %s for user %s", card_id, user_id)
-                    return CardCraftMillResponse(
-                        cards=user_leaders,
-                        resources=user_resources,
-                    )
+    @staticmethod
+    def _get_craft_mill_params(
+        catalog: Catalog,
+        user_id: int,
+        card_id: int,
+        subtype: CardActionSubtype,
+    ) -> tuple[str, int, bool]:
+        """
+        Тип сущности (card/leader), изменение scraps и флаг unlocked для операции крафта/милла.
+        Стоимости и флаги берем из кеша каталога, в базу идет только сама операция
+        """
+        game_constants: GameConstants = catalog.game_constants
+        match subtype:
+            case subtype.CRAFT_CARD | subtype.MILL_CARD:
+                if card_id not in catalog.card_colors:
+                    msg = "Cannot find such card %s for user %s"
+                    logger.error(msg, card_id, user_id)
+                    raise CraftMillCardProcessError(msg, card_id, user_id)
+                card_color: CardColorName = catalog.card_colors[card_id]
+                scraps_delta: int | None = (
+                    game_constants.craft_card.get(card_color)
+                    if subtype == CardActionSubtype.CRAFT_CARD
+                    else game_constants.mill_card.get(card_color)
+                )
+                if scraps_delta is None:
+                    logger.error("Unknown color %s", card_color)
+                    raise TypeError(f"Invalid card color {card_color}")
+                return "card", scraps_delta, catalog.card_unlocked[card_id]
+
+            case subtype.CRAFT_LEADER | subtype.MILL_LEADER:
+                if card_id not in catalog.leader_unlocked:
+                    msg = "Cannot find such leader card %s for user %s"
+                    logger.error(msg, card_id, user_id)
+                    raise CraftMillCardProcessError(msg, card_id, user_id)
+                scraps_delta: int = (
+                    game_constants.craft_leader
+                    if subtype == CardActionSubtype.CRAFT_LEADER
+                    else game_constants.mill_leader
+                )
+                return "leader", scraps_delta, catalog.leader_unlocked[card_id]
 
             case _:
                 msg = "Unknown subtype %s for craft/mill card process"
                 logger.error(msg, subtype)
                 raise CraftMillCardProcessError(msg, subtype)
 
+    async def manage_craft_mill_batch(
+        self,
+        user_id: int,
+        operations: list[CardCraftMillOperation],
+        base_url: str,
+        compact: bool = False,
+    ) -> CardCraftMillBatchResponse:
+        """
+        Пачка крафтов/миллов одной транзакцией и одним запросом: по каждой карте/лидеру считаем итоговое
+        изменение count, по ресурсам - суммарное изменение scraps. Проверяется итоговое состояние:
+        scraps не ушли в минус, а миллить было что (дефолтные карты/лидеры - не ниже 1).
+        compact - в ответе только измененные карты/лидеры, иначе все карты и лидеры юзера
+        """
+        catalog_snapshot: Catalog = await self.catalog.get()
+        catalog: CatalogView = catalog_snapshot.view(base_url)
+
+        logger.info("Processing %s craft/mill operations for user %s", len(operations), user_id)
+        count_deltas: dict[str, dict[int, int]] = {"card": {}, "leader": {}}
+        min_counts: dict[str, dict[int, int]] = {"card": {}, "leader": {}}
+        scraps_delta = 0
+        for operation in operations:
+            kind, operation_scraps, unlocked = self._get_craft_mill_params(
+                catalog=catalog_snapshot,
+                user_id=user_id,
+                card_id=operation.card_id,
+                subtype=operation.subtype,
+            )
+            is_craft = operation.subtype in (CardActionSubtype.CRAFT_CARD, CardActionSubtype.CRAFT_LEADER)
+            deltas = count_deltas[kind]
+            deltas[operation.card_id] = deltas.get(operation.card_id, 0) + (1 if is_craft else -1)
+            min_counts[kind][operation.card_id] = 1 if unlocked else 0
+            scraps_delta += operation_scraps
+
+        # крафт и милл одной и той же карты взаимно сокращаются
+        for deltas in count_deltas.values():
+            for item_id in [item_id for item_id, delta in deltas.items() if delta == 0]:
+                del deltas[item_id]
+
+        async with self.db_pool.connection(user_id=user_id) as connection:
+            async with connection.transaction():
+                if scraps_delta < 0:
+                    await logic.lock_user_resources(connection=connection, user_id=user_id)
+                rows = await logic.apply_craft_mill_batch(
+                    connection=connection,
+                    user_id=user_id,
+                    card_deltas=count_deltas["card"],
+                    leader_deltas=count_deltas["leader"],
+                    scraps_delta=scraps_delta,
+                    reason=CRAFT_MILL_BATCH_REASON,
+                )
+                user_resources: UserResources = self._to_user_resources(rows[0])
+                if user_resources.scraps < 0:
+                    msg = "Can not process craft/mill batch for user %s, not enough scraps"
+                    logger.error(msg, user_id)
+                    raise CraftMillCardProcessError(msg, user_id)
+
+                for row in rows:
+                    if row["item_id"] is None or count_deltas[row["kind"]][row["item_id"]] > 0:
+                        continue
+                    if row["count"] < min_counts[row["kind"]][row["item_id"]]:
+                        msg = "Cannot mill %s %s for user %s, seems user doesn't have it"
+                        logger.error(msg, row["kind"], row["item_id"], user_id)
+                        raise CraftMillCardProcessError(msg, row["kind"], row["item_id"], user_id)
+
+            logger.info("Successfully processed craft/mill batch for user %s", user_id)
+            if compact:
+                user_cards = {row["item_id"]: row for row in rows if row["kind"] == "card"}
+                user_leaders = {row["item_id"]: row for row in rows if row["kind"] == "leader"}
+                return CardCraftMillBatchResponse(
+                    cards=logic.construct_user_cards(
+                        catalog=catalog,
+                        user_cards=user_cards,
+                        card_ids=set(user_cards),
+                    ),
+                    leaders=logic.construct_user_leaders(
+                        catalog=catalog,
+                        user_leaders=user_leaders,
+                        leader_ids=set(user_leaders),
+                    ),
+                    resources=user_resources,
+                )
+
+            return CardCraftMillBatchResponse(
+                cards=await logic.get_user_cards(connection=connection, user_id=user_id, catalog=catalog),
+                leaders=await logic.get_user_leaders(connection=connection, user_id=user_id, catalog=catalog),
+                resources=user_resources,
+            )
+
     async def open_level_related_levels(
         self,
         user_id: int,
         user_level_id: int,
         base_url: str,
     ) -> OpenRelatedLevelsResponse:
+        catalog: CatalogView = await self._get_catalog(base_url)
+
         logger.info("Opening related_levels for user_level %s and user %s", user_level_id, user_id)
 
         # Ставим текущему user_levels.finished = true, уровень пройден
-        async with self.db_pool.transaction() as connection:
+        async with self.db_pool.transaction(user_id=user_id) as connection:
             await connection.execute(
                 """
                     UPDATE user_levels
@@ -715,7 +892,7 @@ class UserProgressService:
             _, _, seasons = await logic.process_enemies(
                 connection=connection,
                 user_id=user_id,
-                base_url=base_url,
+                catalog=catalog,
             )
 
         return OpenRelatedLevelsResponse(
@@ -727,9 +904,13 @@ class UserProgressService:
         user_id: int,
         cards_ids: list[int],
         base_url: str,
+        compact: bool = False,
     ) -> CardCraftBonusResponse:
+        """compact - в ответе только полученные карты, иначе все карты юзера"""
+        catalog: CatalogView = await self._get_catalog(base_url)
+
         logger.info("Crafting bonus cards %s for user %s", cards_ids, user_id)
-        async with self.db_pool.transaction() as connection:
+        async with self.db_pool.transaction(user_id=user_id) as connection:
             r = await connection.fetch(
                 """
                     WITH card_counts AS (
@@ -756,7 +937,8 @@ class UserProgressService:
             user_cards = await logic.get_user_cards(
                 connection=connection,
                 user_id=user_id,
-                base_url=base_url,
+                catalog=catalog,
+                card_ids=set(cards_ids) if compact else None,
             )
 
         return CardCraftBonusResponse(
@@ -0,0 +1,77 @@
+"""
+Дельта-синхронизация прогресса юзера.
+Токен синхронизации непрозрачен для фронта: внутри версия каталога, метка последнего изменения
+строк юзера (max updated_at) и хеш его колод. Битый или чужой токен - отдаем полный прогресс
+"""
+
+import base64
+import binascii
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from hashlib import blake2b
+import json
+
+from pydantic_core import to_json
+from services.api.app.apps.progress.schemas import UserDeck
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+# updated_at строк юзера не раньше эпохи, сверху - предел datetime
+MAX_WATERMARK = (datetime.max.replace(tzinfo=UTC) - EPOCH) // timedelta(microseconds=1)
+
+
+@dataclass(frozen=True)
+class SyncToken:
+    user_id: int
+    catalog_version: int
+    # max updated_at строк юзера в микросекундах от эпохи
+    watermark: int
+    decks_hash: str
+
+    def encode(self) -> str:
+        data = to_json([self.user_id, self.catalog_version, self.watermark, self.decks_hash])
+        return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+    @classmethod
+    def decode(
+        cls,
+        token: str | None,
+    ) -> "SyncToken | None":
+        if not token:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            user_id, catalog_version, watermark, decks_hash = data
+        except (binascii.Error, ValueError, TypeError):
+            return None
+        if not all(isinstance(value, int) for value in (user_id, catalog_version, watermark)):
+            return None
+        if not isinstance(decks_hash, str):
+            return None
+        # метка вне диапазона datetime - from_watermark упадет с OverflowError
+        if not 0 <= watermark <= MAX_WATERMARK:
+            return None
+        return cls(user_id=user_id, catalog_version=catalog_version, watermark=watermark, decks_hash=decks_hash)
+
+
+def to_watermark(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_watermark(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+def hash_decks(user_decks: list[UserDeck]) -> str:
+    # колоды юзера маленькие, удаление и пересборку колоды проще поймать хешем, чем по updated_at
+    return blake2b(to_json(user_decks), digest_size=8).hexdigest()
+
+
+def diff_fingerprints(
+    old: dict[int, bytes],
+    new: dict[int, bytes],
+) -> tuple[set[int], list[int]]:
+    """Возвращает id новых/измененных сущностей и id удаленных"""
+    changed = {entity_id for entity_id, fingerprint in new.items() if old.get(entity_id) != fingerprint}
+    removed = sorted(old.keys() - new.keys())
+    return changed, removed
@@ -18,6 +18,33 @@ class Config(BaseConfig):
     ALGORITHM = get_secret("ALGORITHM", default="HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES = get_secret("ACCESS_TOKEN_EXPIRE_MINUTES", default=30)
 
+    # пул потоков для хеширования паролей: число потоков и сколько задач может ждать в очереди (дальше - 503)
+    PASSWORD_HASHER_WORKERS = get_secret("PASSWORD_HASHER_WORKERS", default=4, cast=int)
+    PASSWORD_HASHER_QUEUE_SIZE = get_secret("PASSWORD_HASHER_QUEUE_SIZE", default=64, cast=int)
+
+    # сколько уже проверенных токенов держим в памяти
+    VERIFIED_TOKEN_CACHE_SIZE = get_secret("VERIFIED_TOKEN_CACHE_SIZE", default=10000, cast=int)
+
+    # кеш юзеров для проверки токена: размер и время жизни записи
+    AUTH_USER_CACHE_SIZE = get_secret("AUTH_USER_CACHE_SIZE", default=10000, cast=int)
+    AUTH_USER_CACHE_TTL_SECONDS = get_secret("AUTH_USER_CACHE_TTL_SECONDS", default=60, cast=int)
+
+    # движок сборки прогресса юзера: catalog - кеш каталога + данные юзера, sql - один запрос с json_agg
+    USER_PROGRESS_ENGINE = get_secret("USER_PROGRESS_ENGINE", default="catalog")
+    # строки юзера для движка catalog читаем параллельно на трех соединениях пула в общем снимке
+    USER_PROGRESS_CONCURRENT_FETCH = get_secret("USER_PROGRESS_CONCURRENT_FETCH", default=False, cast=bool)
+
+    # ручка /metrics в формате Prometheus (вне /api/v1, закрывать снаружи на уровне балансировщика)
+    METRICS_ENDPOINT_ENABLED = get_secret("METRICS_ENDPOINT_ENABLED", default=True, cast=bool)
+
+    # дельта-синхронизация прогресса: сколько версий каталога помним для сравнения
+    CATALOG_HISTORY_SIZE = get_secret("CATALOG_HISTORY_SIZE", default=16, cast=int)
+    # сколько представлений каталога (по base_url из заголовка Host) держим в памяти на одну версию
+    CATALOG_VIEWS_SIZE = get_secret("CATALOG_VIEWS_SIZE", default=4, cast=int)
+    # на сколько секунд назад от метки в токене перечитываем строки юзера - ловим транзакции,
+    # которые закоммитились позже, чем был выдан токен, но с более ранним updated_at
+    USER_PROGRESS_SYNC_OVERLAP_SECONDS = get_secret("USER_PROGRESS_SYNC_OVERLAP_SECONDS", default=5, cast=int)
+
 
 class TestingConfig(BaseTestingConfig, Config): ...
 
@@ -1,7 +1,10 @@
 from fastapi import Depends, FastAPI
 from lib.utils.db.pool import Database
+from services.api.app.apps.auth.cache import AuthUserCache
+from services.api.app.apps.auth.hashing import PasswordHasher
 from services.api.app.apps.auth.service import AuthService
 from services.api.app.apps.news.service import NewsService
+from services.api.app.apps.progress.catalog import CatalogCache
 from services.api.app.apps.progress.service import UserProgressService
 from services.api.app.config import Config
 
@@ -25,13 +28,29 @@ async def get_db() -> Database:
     return _app.state.db
 
 
+async def get_catalog() -> CatalogCache:
+    return _app.state.catalog
+
+
+async def get_auth_user_cache() -> AuthUserCache:
+    return _app.state.auth_user_cache
+
+
+async def get_password_hasher() -> PasswordHasher:
+    return _app.state.password_hasher
+
+
 async def get_auth_service(
     db_pool: Database = Depends(get_db),
     config: Config = Depends(get_config),
+    user_cache: AuthUserCache = Depends(get_auth_user_cache),
+    password_hasher: PasswordHasher = Depends(get_password_hasher),
 ) -> AuthService:
     return AuthService(
         db_pool=db_pool,
         config=config,
+        user_cache=user_cache,
+        password_hasher=password_hasher,
     )
 
 
@@ -48,8 +67,10 @@ async def get_news_service(
 async def get_user_progress_service(
     db_pool: Database = Depends(get_db),
     config: Config = Depends(get_config),
+    catalog: CatalogCache = Depends(get_catalog),
 ) -> UserProgressService:
     return UserProgressService(
         db_pool=db_pool,
         config=config,
+        catalog=catalog,
     )
@@ -16,3 +16,15 @@ class ManageResourcesProcessError(Exception):
 
 class CraftMillCardProcessError(Exception):
     pass
+
+
+class NotModifiedError(Exception):
+    """Клиентская копия ответа актуальна, отвечаем 304"""
+
+    def __init__(self, etag: str):
+        super().__init__(etag)
+        self.etag = etag
+
+
+class PasswordHasherOverloadedError(Exception):
+    pass
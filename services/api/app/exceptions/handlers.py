@@ -1,9 +1,10 @@
 from typing import Any
 
-from fastapi import FastAPI, Request, status
+from fastapi import FastAPI, Request, Response, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from services.api.app.exceptions import UserAlreadyExistsError
+from services.api.app.exceptions.exceptions import NotModifiedError, PasswordHasherOverloadedError
 
 
 async def global_exception_handler(
@@ -163,8 +164,41 @@ async def validation_exception_handler(
     )
 
 
+async def not_modified_exception_handler(
+    request: Request,
+    exc: NotModifiedError,
+) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": exc.etag},
+    )
+
+
+async def password_hasher_overloaded_exception_handler(
+    request: Request,
+    exc: Exception,
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "error": {
+                "code": "SERVICE_UNAVAILABLE",
+                "message": "Too many login attempts, try again later",
+                "details": exc.__repr__(),
+            },
+        },
+        headers={
+            "Retry-After": "1",
+            "Access-Control-Allow-Origin": request.headers.get("origin", "*"),
+            "Access-Control-Allow-Credentials": "true",
+        },
+    )
+
+
 def add_exceptions(app: FastAPI) -> FastAPI:
     app.add_exception_handler(RequestValidationError, validation_exception_handler)
+    app.add_exception_handler(NotModifiedError, not_modified_exception_handler)
+    app.add_exception_handler(PasswordHasherOverloadedError, password_hasher_overloaded_exception_handler)
     app.add_exception_handler(UserAlreadyExistsError, user_already_exists_exception_handler)
     app.add_exception_handler(Exception, global_exception_handler)
     return app
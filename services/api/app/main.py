@@ -2,12 +2,19 @@ from contextlib import asynccontextmanager
 import logging.config
 
 from fastapi import APIRouter, FastAPI
+from lib.utils.db.listener import NotificationListener
 from lib.utils.db.pool import Database
 from lib.utils.elk.elastic_logger import ElasticLoggerManager
 from lib.utils.elk.elastic_tracer import ElasticTracerManager
+from lib.utils.metrics import MetricsReporter
+from lib.utils.models import CATALOG_VERSION_CHANNEL, USER_CHANGED_CHANNEL
 from services.api.app.apps.api_docs.routes import router as swagger_router
+from services.api.app.apps.auth.cache import AuthUserCache
+from services.api.app.apps.auth.hashing import PasswordHasher
 from services.api.app.apps.auth.routes import router as users_router
+from services.api.app.apps.metrics.routes import router as metrics_router
 from services.api.app.apps.news.routes import router as news_router
+from services.api.app.apps.progress.catalog import CatalogCache
 from services.api.app.apps.progress.routes import router as progress_router
 from services.api.app.config import get_config as get_app_settings
 from services.api.app.dependencies import set_global_app
@@ -45,9 +52,46 @@ async def lifespan(app: FastAPI):
     await db.connect()
     app.state.db = db
 
+    # статический контент игры держим в памяти.
+    # Правки контента в админке поднимают версию каталога и шлют NOTIFY, по нему сбрасываем кеш.
+    # Подписываемся до первой загрузки, чтобы не пропустить изменения между ними
+    catalog = CatalogCache(
+        db,
+        history_size=config.CATALOG_HISTORY_SIZE,
+        views_size=config.CATALOG_VIEWS_SIZE,
+    )
+    listener = NotificationListener(config)
+    listener.subscribe(CATALOG_VERSION_CHANNEL, catalog.on_version_notification)
+
+    # активных юзеров для проверки токена держим в памяти, деактивация в админке сбрасывает запись через NOTIFY
+    auth_user_cache = AuthUserCache(
+        max_size=config.AUTH_USER_CACHE_SIZE,
+        ttl=config.AUTH_USER_CACHE_TTL_SECONDS,
+    )
+    listener.subscribe(USER_CHANGED_CHANNEL, auth_user_cache.on_user_notification)
+
+    await listener.start()
+    await catalog.get()
+    app.state.catalog = catalog
+    app.state.auth_user_cache = auth_user_cache
+
+    # PBKDF2 считаем вне event loop, в ограниченном пуле потоков
+    password_hasher = PasswordHasher(
+        max_workers=config.PASSWORD_HASHER_WORKERS,
+        max_queue=config.PASSWORD_HASHER_QUEUE_SIZE,
+    )
+    app.state.password_hasher = password_hasher
+
+    # метрики отдаем ручкой /metrics и периодически пишем в лог
+    metrics_reporter = MetricsReporter(interval=config.METRICS_REPORT_INTERVAL_SECONDS)
+    await metrics_reporter.start()
+
     set_global_app(app)
 
     yield
+    await metrics_reporter.stop()
+    password_hasher.shutdown()
+    await listener.stop()
     await db.disconnect()
 
 
@@ -72,3 +116,5 @@ api_v1_router.include_router(news_router, prefix="/news", tags=["news"])
 api_v1_router.include_router(progress_router, prefix="/user-progress", tags=["progress"])
 
 app.include_router(api_v1_router)
+if config.METRICS_ENDPOINT_ENABLED:
+    app.include_router(metrics_router, tags=["metrics"])
@@ -0,0 +1,53 @@
+"""
+ETag / If-None-Match для GET ручек.
+Ручка подключает etag_dependency(get_version), где get_version - дешевая зависимость, возвращающая
+строку-версию ответа (версия каталога, max updated_at и т.п.). Если версия совпала с If-None-Match,
+отвечаем 304 до того, как выполнится сама ручка с тяжелыми запросами
+"""
+
+from collections.abc import Awaitable, Callable
+from hashlib import blake2b
+
+from fastapi import Depends, Request, Response
+from services.api.app.exceptions.exceptions import NotModifiedError
+
+
+def make_etag(*parts: object) -> str:
+    """Сильный ETag из частей версии ответа"""
+    digest = blake2b("|".join(str(part) for part in parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(
+    if_none_match: str | None,
+    etag: str,
+) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # слабые валидаторы (W/"...") сравниваем по значению, как того требует If-None-Match
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def etag_dependency(
+    get_version: Callable[..., Awaitable[str]],
+) -> Callable[..., Awaitable[str]]:
+    """
+    Зависимость для ручки: считает ETag, при совпадении кидает NotModifiedError (-> 304),
+    иначе ставит заголовок ETag и возвращает его. Если ручка сама собирает Response,
+    заголовок нужно передать в него - FastAPI не переносит заголовки зависимостей в готовый Response
+    """
+
+    async def check_etag(
+        request: Request,
+        response: Response,
+        version: str = Depends(get_version),
+    ) -> str:
+        etag = make_etag(request.url.path, version)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise NotModifiedError(etag)
+        response.headers["ETag"] = etag
+        return etag
+
+    return check_etag
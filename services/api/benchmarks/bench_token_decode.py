@@ -0,0 +1,60 @@
+"""
+Микро-бенчмарк проверки токена на каждый запрос: полная проверка подписи и claims (jose.jwt.decode,
+как было раньше) против decode_token с кешем проверенных токенов. База не нужна.
+Запуск: make bench-token ITERATIONS=100000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from services.api.app.apps.auth.lib import create_access_token, decode_token_payload, verified_tokens, verify_token
+from services.api.app.config import get_config
+
+
+def bench(
+    func,  # noqa: ANN001
+    iterations: int,
+    repeats: int = 5,
+) -> list[float]:
+    """Время одного вызова в микросекундах, по каждому из repeats прогонов"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        timings.append((time.perf_counter() - started) / iterations * 1_000_000)
+    return timings
+
+
+def report(
+    name: str,
+    timings: list[float],
+) -> None:
+    print(f"{name:<10} best={min(timings):.2f}us mean={statistics.mean(timings):.2f}us per call")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    config = get_config()
+    token = create_access_token(config=config, data={"sub": "user@mail.ru", "uid": 1})
+
+    verified_tokens.clear()
+    uncached = bench(lambda: verify_token(config=config, token=token), args.iterations)
+    cached = bench(lambda: decode_token_payload(config=config, token=token), args.iterations)
+
+    report("jwt", uncached)
+    report("cached", cached)
+    print(f"speedup x{min(uncached) / min(cached):.1f}")
+
+
+if __name__ == "__main__":
+    main()
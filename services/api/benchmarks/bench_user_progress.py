@@ -0,0 +1,112 @@
+"""
+Сравнение движков сборки прогресса юзера (USER_PROGRESS_ENGINE) на реальной базе:
+через pydantic-модели (model) и через заранее сериализованный каталог (json, так работает роут).
+Для движка catalog дополнительно - параллельное чтение строк юзера (USER_PROGRESS_CONCURRENT_FETCH)
+Запуск: make bench-progress USER_ID=1 ITERATIONS=200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from lib.utils.db.pool import Database
+from services.api.app.apps.progress.catalog import CatalogCache
+from services.api.app.apps.progress.schemas import UserProgressEngine
+from services.api.app.apps.progress.service import UserProgressService
+from services.api.app.config import get_config
+
+
+async def bench_engine(
+    service: UserProgressService,
+    engine: UserProgressEngine,
+    serialized: bool,
+    concurrent: bool,
+    user_id: int,
+    base_url: str,
+    iterations: int,
+) -> list[float]:
+    service.config.USER_PROGRESS_ENGINE = engine
+    service.config.USER_PROGRESS_CONCURRENT_FETCH = concurrent
+
+    async def run() -> bytes:
+        if serialized:
+            return await service.get_user_progress_json(user_id=user_id, base_url=base_url)
+        response = await service.get_user_progress(user_id=user_id, base_url=base_url)
+        return response.model_dump_json().encode()
+
+    # прогрев: кеш каталога, prepared statements в соединениях пула
+    for _ in range(5):
+        await run()
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(
+    name: str,
+    timings: list[float],
+) -> None:
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(
+        f"{name:<25} n={len(timings)} mean={statistics.mean(timings):.2f}ms "
+        f"p50={statistics.median(timings):.2f}ms p95={p95:.2f}ms max={timings[-1]:.2f}ms",
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--base-url", default="http://localhost/")
+    args = parser.parse_args()
+
+    config = get_config()
+    db = Database(config)
+    await db.connect()
+
+    service = UserProgressService(
+        db_pool=db,
+        config=config,
+        catalog=CatalogCache(db),
+    )
+
+    variants = [(engine, serialized, False) for engine in UserProgressEngine for serialized in (False, True)]
+    variants += [(UserProgressEngine.CATALOG, serialized, True) for serialized in (False, True)]
+
+    try:
+        medians = {}
+        for engine, serialized, concurrent in variants:
+            timings = await bench_engine(
+                service=service,
+                engine=engine,
+                serialized=serialized,
+                concurrent=concurrent,
+                user_id=args.user_id,
+                base_url=args.base_url,
+                iterations=args.iterations,
+            )
+            name = f"{engine}/{'json' if serialized else 'model'}{'/concurrent' if concurrent else ''}"
+            report(name, timings)
+            medians[name] = statistics.median(timings)
+
+        for serialized in ("model", "json"):
+            sequential = medians[f"{UserProgressEngine.CATALOG}/{serialized}"]
+            concurrent = medians[f"{UserProgressEngine.CATALOG}/{serialized}/concurrent"]
+            print(f"concurrent speedup {UserProgressEngine.CATALOG}/{serialized}: x{sequential / concurrent:.2f} (p50)")
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -260,7 +260,7 @@ class LevelFactory(BaseModelFactory):
 
     name = factory.Sequence(lambda n: f"Level {n}")
     starting_enemies_number = 3
-    difficulty = "NORMAL"
+    difficulty = "normal"
     unlocked = False
     x = 0
     y = 0
@@ -4,6 +4,9 @@ from fastapi import FastAPI
 from httpx import ASGITransport, AsyncClient
 from lib.utils.db.pool import Database
 import pytest_asyncio
+from services.api.app.apps.auth.cache import AuthUserCache
+from services.api.app.apps.auth.hashing import PasswordHasher
+from services.api.app.apps.progress.catalog import CatalogCache
 from services.api.app.config import Config, get_config
 from services.api.app.config import get_config as get_app_settings
 
@@ -21,6 +24,10 @@ async def app(db_pool) -> FastAPI:
     # Переопределяем метод connect чтобы использовать существующий пул
     db.pool = db_pool
     fastapi_app.state.db = db
+    # кеш каталога грузится лениво, уже после того как тест заполнит базу
+    fastapi_app.state.catalog = CatalogCache(db)
+    fastapi_app.state.auth_user_cache = AuthUserCache()
+    fastapi_app.state.password_hasher = PasswordHasher()
 
     # Устанавливаем глобальное приложение
     from services.api.app.dependencies import set_global_app
@@ -44,3 +51,38 @@ async def client(app: FastAPI) -> AsyncClient:
 @pytest.fixture(scope="session")
 def config() -> Config:
     return get_config()
+
+
+@pytest_asyncio.fixture
+async def registered_user(
+    client: AsyncClient,
+    init_db_cards,
+    game_constants_factory,
+) -> dict:
+    """Регистрируем юзера через API (с дефолтным контентом) и логинимся, отдаем id и заголовки с токеном"""
+    await game_constants_factory()
+
+    response = await client.post(
+        "users/register-user",
+        json={
+            "email": "user@mail.ru",
+            "password": "password",
+            "username": "username",
+        },
+    )
+    assert response.status_code == 200
+
+    response = await client.post(
+        "users/login-user",
+        json={
+            "email": "user@mail.ru",
+            "password": "password",
+        },
+    )
+    assert response.status_code == 200
+    response_json = response.json()
+
+    return {
+        "id": response_json["id"],
+        "headers": {"Authorization": f"Bearer {response_json['token']['access_token']}"},
+    }
@@ -0,0 +1,91 @@
+import asyncio
+from contextlib import suppress
+import threading
+
+import pytest
+
+from httpx import AsyncClient
+from services.api.app.apps.auth import hashing
+from services.api.app.apps.auth.hashing import PasswordHasher
+from services.api.app.apps.auth.lib import get_password_hash
+from services.api.app.exceptions.exceptions import PasswordHasherOverloadedError, UserIncorrectPasswordError
+
+
+class TestPasswordHasher:
+    @pytest.mark.asyncio
+    async def test_hash_and_verify(self):
+        hasher = PasswordHasher(max_workers=2, max_queue=0)
+        try:
+            password_hash = await hasher.hash("password")
+            await hasher.verify("password", password_hash)
+            with pytest.raises(UserIncorrectPasswordError):
+                await hasher.verify("wrong", password_hash)
+        finally:
+            hasher.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_request_keeps_slot_until_done(self, monkeypatch):
+        release = threading.Event()
+        monkeypatch.setattr(hashing, "get_password_hash", lambda password: release.wait())
+        hasher = PasswordHasher(max_workers=1, max_queue=0)
+        try:
+            request = asyncio.create_task(hasher.hash("password"))
+            await asyncio.sleep(0.01)
+            request.cancel()
+            with suppress(asyncio.CancelledError):
+                await request
+
+            # клиент отключился, но хеш еще считается в потоке - место в пуле не освободилось
+            with pytest.raises(PasswordHasherOverloadedError):
+                await asyncio.wait_for(hasher.hash("password"), timeout=1)
+
+            release.set()
+            for _ in range(100):
+                if hasher._in_flight == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert await hasher.hash("password")
+        finally:
+            release.set()
+            hasher.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_login_when_overloaded(
+        self,
+        app,
+        client: AsyncClient,
+        user_factory,
+        monkeypatch,
+    ):
+        await user_factory(email="email@mail.ru", password=get_password_hash("password"), username="username")
+        hasher = PasswordHasher(max_workers=1, max_queue=0)
+        monkeypatch.setattr(app.state, "password_hasher", hasher)
+        # хеш держит поток, пока тест не отпустит - иначе bcrypt может закончить раньше запроса логина
+        release = threading.Event()
+        monkeypatch.setattr(hashing, "get_password_hash", lambda password: release.wait())
+
+        # единственный поток пула занят
+        busy = asyncio.create_task(hasher.hash("password"))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(PasswordHasherOverloadedError):
+                await hasher.hash("password")
+
+            response = await client.post(
+                "users/login-user",
+                json={"email": "email@mail.ru", "password": "password"},
+            )
+            assert response.status_code == 503
+            assert response.headers["retry-after"] == "1"
+
+            # поток освободился - снова пускаем
+            release.set()
+            await busy
+            response = await client.post(
+                "users/login-user",
+                json={"email": "email@mail.ru", "password": "password"},
+            )
+            assert response.status_code == 200
+        finally:
+            release.set()
+            hasher.shutdown()
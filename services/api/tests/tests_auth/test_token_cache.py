@@ -0,0 +1,31 @@
+import time
+
+from services.api.app.apps.auth.lib import VerifiedTokenCache
+
+
+class TestVerifiedTokenCache:
+    def test_cached_until_exp(self):
+        cache = VerifiedTokenCache(max_size=10)
+        payload = {"sub": "user@mail.ru", "uid": 1, "exp": time.time() + 60}
+
+        cache.set("token", payload)
+        assert cache.get("token") is payload
+
+        cache.set("expired", {"sub": "user@mail.ru", "exp": time.time() - 1})
+        assert cache.get("expired") is None
+
+        cache.set("no-exp", {"sub": "user@mail.ru"})
+        assert cache.get("no-exp") is None
+
+    def test_lru_eviction(self):
+        cache = VerifiedTokenCache(max_size=2)
+        exp = time.time() + 60
+
+        cache.set("first", {"exp": exp})
+        cache.set("second", {"exp": exp})
+        assert cache.get("first") is not None
+        cache.set("third", {"exp": exp})
+
+        assert cache.get("second") is None
+        assert cache.get("first") is not None
+        assert cache.get("third") is not None
@@ -436,3 +436,30 @@ class TestUserLoginAPI:
 
         assert response.status_code == 401
         assert response_json == {"detail": "Access denied"}
+
+
+class TestAuthUserCache:
+    @pytest.mark.asyncio
+    async def test_cached_user_until_deactivation_notify(
+        self,
+        app,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ) -> None:
+        endpoint = f"user-progress/{registered_user['id']}"
+
+        response = await client.get(endpoint, headers=registered_user["headers"])
+        assert response.status_code == 200
+        assert app.state.auth_user_cache.get(registered_user["id"]) is not None
+
+        # юзер в кеше - деактивация в базе не видна, пока не пришло уведомление от триггера
+        await db_connection.execute("""UPDATE users SET is_active = FALSE WHERE id = $1""", registered_user["id"])
+        response = await client.get(endpoint, headers=registered_user["headers"])
+        assert response.status_code == 200
+
+        app.state.auth_user_cache.on_user_notification(str(registered_user["id"]))
+
+        response = await client.get(endpoint, headers=registered_user["headers"])
+        assert response.status_code == 500
+        assert response.json()["error"]["message"] == "UserNotFoundError"
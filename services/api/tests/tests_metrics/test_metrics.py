@@ -0,0 +1,15 @@
+import pytest
+
+from httpx import AsyncClient
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: AsyncClient, registered_user: dict):
+    await client.get(f"user-progress/{registered_user['id']}", headers=registered_user["headers"])
+
+    response = await client.get("http://test/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE db_pool_in_use_seconds histogram" in response.text
+    assert 'db_pool_in_use_seconds_bucket{caller="' in response.text
@@ -0,0 +1,31 @@
+import pytest
+
+from httpx import AsyncClient
+
+
+class TestNewsAPI:
+    endpoint = "news/list-news"
+
+    @pytest.mark.asyncio
+    async def test_list_news_etag(
+        self,
+        client: AsyncClient,
+        db_connection,
+    ):
+        await db_connection.execute("INSERT INTO news (title, text) VALUES ('First', 'text')")
+
+        response = await client.get(self.endpoint)
+        assert response.status_code == 200
+        assert [news["title"] for news in response.json()] == ["First"]
+        etag = response.headers["etag"]
+
+        response = await client.get(self.endpoint, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        # выключенная новость не видна, но версия списка меняется
+        await db_connection.execute("INSERT INTO news (title, text, is_active) VALUES ('Second', 'text', false)")
+
+        response = await client.get(self.endpoint, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert [news["title"] for news in response.json()] == ["First"]
+        assert response.headers["etag"] != etag
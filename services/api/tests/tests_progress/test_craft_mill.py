@@ -0,0 +1,206 @@
+import pytest
+
+from httpx import AsyncClient
+from lib.utils.schemas.game import CardActionSubtype
+from services.api.app.apps.progress.service import UserProgressService
+from services.api.app.exceptions.exceptions import CraftMillCardProcessError
+
+
+class TestCraftMillCardAPI:
+    @staticmethod
+    def endpoint(user_id: int, card_id: int) -> str:
+        return f"user-progress/{user_id}/card/{card_id}"
+
+    @pytest.mark.asyncio
+    async def test_craft_and_mill_card(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        card_id = await db_connection.fetchval(
+            """SELECT cards.id FROM cards JOIN colors ON cards.color_id = colors.id WHERE colors.name = 'Bronze'""",
+        )
+
+        response = await client.post(
+            self.endpoint(registered_user["id"], card_id),
+            json={"subtype": "craft_card"},
+            headers=registered_user["headers"],
+        )
+        response_json = response.json()
+
+        assert response.status_code == 200
+        # craft_bronze = -200
+        assert response_json["resources"]["scraps"] == 800
+        assert {card["card"]["id"]: card["count"] for card in response_json["cards"]}[card_id] == 2
+
+        response = await client.post(
+            self.endpoint(registered_user["id"], card_id),
+            json={"subtype": "mill_card"},
+            headers=registered_user["headers"],
+        )
+        response_json = response.json()
+
+        assert response.status_code == 200
+        # mill_bronze = 20
+        assert response_json["resources"]["scraps"] == 820
+        assert {card["card"]["id"]: card["count"] for card in response_json["cards"]}[card_id] == 1
+
+    @pytest.mark.asyncio
+    async def test_craft_card_compact(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        card_id = await db_connection.fetchval(
+            """SELECT cards.id FROM cards JOIN colors ON cards.color_id = colors.id WHERE colors.name = 'Silver'""",
+        )
+
+        response = await client.post(
+            self.endpoint(registered_user["id"], card_id),
+            params={"compact": True},
+            json={"subtype": "craft_card"},
+            headers=registered_user["headers"],
+        )
+        response_json = response.json()
+
+        assert response.status_code == 200
+        assert [(card["card"]["id"], card["count"]) for card in response_json["cards"]] == [(card_id, 2)]
+        assert response_json["resources"]["scraps"] < 1000
+
+    @pytest.mark.asyncio
+    async def test_craft_card_not_enough_scraps(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        card_id = await db_connection.fetchval(
+            """SELECT cards.id FROM cards JOIN colors ON cards.color_id = colors.id WHERE colors.name = 'Gold'""",
+        )
+
+        response = await client.post(
+            self.endpoint(registered_user["id"], card_id),
+            json={"subtype": "craft_card"},
+            headers=registered_user["headers"],
+        )
+
+        # craft_gold = -2000, а у юзера 1000, транзакция откатывается
+        assert response.status_code == 500
+        assert await db_connection.fetchval("""SELECT scraps FROM user_resources""") == 1000
+        assert await db_connection.fetchval("""SELECT COUNT(*) FROM user_cards WHERE card_id = $1""", card_id) == 0
+
+    @pytest.mark.asyncio
+    async def test_mill_last_default_card(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        card_id = await db_connection.fetchval(
+            """SELECT cards.id FROM cards JOIN colors ON cards.color_id = colors.id WHERE colors.name = 'Bronze'""",
+        )
+
+        response = await client.post(
+            self.endpoint(registered_user["id"], card_id),
+            json={"subtype": "mill_card"},
+            headers=registered_user["headers"],
+        )
+
+        # открытая по умолчанию карта одна - миллить нельзя, ни count, ни ресурсы не меняются
+        assert response.status_code == 500
+        assert await db_connection.fetchval("""SELECT scraps FROM user_resources""") == 1000
+        assert await db_connection.fetchval("""SELECT count FROM user_cards WHERE card_id = $1""", card_id) == 1
+
+    @pytest.mark.asyncio
+    async def test_craft_unknown_card(
+        self,
+        app,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        card_id = await db_connection.fetchval("""SELECT MAX(id) + 1 FROM cards""")
+
+        response = await client.post(
+            self.endpoint(registered_user["id"], card_id),
+            json={"subtype": "craft_card"},
+            headers=registered_user["headers"],
+        )
+
+        assert response.status_code == 500
+        assert await db_connection.fetchval("""SELECT scraps FROM user_resources""") == 1000
+
+        catalog = await app.state.catalog.get()
+        for subtype in (CardActionSubtype.CRAFT_CARD, CardActionSubtype.MILL_CARD):
+            with pytest.raises(CraftMillCardProcessError):
+                UserProgressService._get_craft_mill_params(catalog, registered_user["id"], card_id, subtype)
+
+
+class TestCraftMillBatchAPI:
+    @staticmethod
+    def endpoint(user_id: int) -> str:
+        return f"user-progress/{user_id}/cards/batch"
+
+    @staticmethod
+    async def get_card_id(db_connection, color: str) -> int:
+        return await db_connection.fetchval(
+            """SELECT cards.id FROM cards JOIN colors ON cards.color_id = colors.id WHERE colors.name = $1""",
+            color,
+        )
+
+    @pytest.mark.asyncio
+    async def test_craft_mill_batch(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        bronze_id = await self.get_card_id(db_connection, "Bronze")
+
+        response = await client.post(
+            self.endpoint(registered_user["id"]),
+            params={"compact": True},
+            json={
+                "operations": [
+                    {"card_id": bronze_id, "subtype": "craft_card"},
+                    {"card_id": bronze_id, "subtype": "craft_card"},
+                    {"card_id": bronze_id, "subtype": "mill_card"},
+                ],
+            },
+            headers=registered_user["headers"],
+        )
+        response_json = response.json()
+
+        assert response.status_code == 200
+        # 2 * craft_bronze (-200) + mill_bronze (20)
+        assert response_json["resources"]["scraps"] == 620
+        assert [(card["card"]["id"], card["count"]) for card in response_json["cards"]] == [(bronze_id, 2)]
+        assert response_json["leaders"] == []
+
+    @pytest.mark.asyncio
+    async def test_craft_mill_batch_is_atomic(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        bronze_id = await self.get_card_id(db_connection, "Bronze")
+        silver_id = await self.get_card_id(db_connection, "Silver")
+
+        response = await client.post(
+            self.endpoint(registered_user["id"]),
+            json={
+                "operations": [
+                    {"card_id": bronze_id, "subtype": "craft_card"},
+                    {"card_id": silver_id, "subtype": "mill_card"},
+                ],
+            },
+            headers=registered_user["headers"],
+        )
+
+        # серебряная карта открыта по умолчанию и она одна - вся пачка откатывается
+        assert response.status_code == 500
+        assert await db_connection.fetchval("""SELECT scraps FROM user_resources""") == 1000
+        assert await db_connection.fetchval("""SELECT count FROM user_cards WHERE card_id = $1""", bronze_id) == 1
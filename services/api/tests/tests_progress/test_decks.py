@@ -1,3 +1,59 @@
+import pytest
+
+from httpx import AsyncClient
+
+
+class TestUserDecksAPI:
+    @pytest.mark.asyncio
+    async def test_compact_deck_responses(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        user_id = registered_user["id"]
+        cards = [row["id"] for row in await db_connection.fetch("SELECT id FROM cards WHERE unlocked ORDER BY id")]
+        leader_id = await db_connection.fetchval("SELECT id FROM leaders LIMIT 1")
+
+        response = await client.post(
+            f"user-progress/{user_id}/create-deck",
+            params={"compact": True},
+            json={"deck_name": "New deck", "leader_id": leader_id, "cards": cards},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 200
+        decks = response.json()["decks"]
+        # у юзера уже есть базовая колода, но в компактном ответе только созданная
+        assert [deck["deck"]["name"] for deck in decks] == ["New deck"]
+        deck_id = decks[0]["deck"]["id"]
+
+        response = await client.patch(
+            f"user-progress/{user_id}/alter-deck/{deck_id}",
+            params={"compact": True},
+            json={"deck_name": "Renamed deck", "leader_id": leader_id, "cards": cards[:1]},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 200
+        decks = response.json()["decks"]
+        assert [(deck["deck"]["name"], len(deck["deck"]["cards"])) for deck in decks] == [("Renamed deck", 1)]
+
+        # без флага - весь список, как раньше
+        response = await client.patch(
+            f"user-progress/{user_id}/alter-deck/{deck_id}",
+            json={"deck_name": "Renamed deck", "leader_id": leader_id, "cards": cards[:1]},
+            headers=registered_user["headers"],
+        )
+        assert len(response.json()["decks"]) == 2
+
+        response = await client.delete(
+            f"user-progress/{user_id}/alter-deck/{deck_id}",
+            params={"compact": True},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 200
+        assert response.json()["decks"] == []
+
+
 # class TestDecksAPI:
 #     @pytest.mark.asyncio
 #     async def test_create_user_deck(
@@ -0,0 +1,208 @@
+import pytest
+
+from httpx import AsyncClient
+from services.api.app.apps.progress.schemas import UserProgressResponse
+from services.api.app.apps.progress.service import UserProgressService
+
+
+class TestUserProgressAPI:
+    @staticmethod
+    def endpoint(user_id: int) -> str:
+        return f"user-progress/{user_id}"
+
+    @pytest.mark.asyncio
+    async def test_get_user_progress(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+    ):
+        response = await client.get(
+            self.endpoint(registered_user["id"]),
+            headers=registered_user["headers"],
+        )
+        response_json = response.json()
+
+        assert response.status_code == 200
+
+        cards = response_json["user_database"]["cards"]
+        assert len(cards) == 3
+        # карты отсортированы по цвету (золото первым), у закрытой карты нет user_card
+        assert [card["card"]["color"] for card in cards] == ["Gold", "Silver", "Bronze"]
+        assert [card["count"] for card in cards] == [0, 1, 1]
+        assert cards[0]["id"] is None
+
+        assert len(response_json["user_database"]["leaders"]) == 1
+        assert response_json["user_database"]["leaders"][0]["count"] == 1
+
+        decks = response_json["user_database"]["decks"]
+        assert len(decks) == 1
+        assert len(decks[0]["deck"]["cards"]) == 3
+
+        assert len(response_json["enemies"]) == 3
+        assert len(response_json["enemy_leaders"]) == 1
+
+        assert len(response_json["seasons"]) == 1
+        levels = response_json["seasons"][0]["levels"]
+        assert [level["level"]["name"] for level in levels] == ["Level 1", "Level 2", "Level 3"]
+        assert [level["unlocked"] for level in levels] == [True, False, False]
+        assert [len(level["level"]["enemies"]) for level in levels] == [1, 2, 3]
+        assert [len(level["level"]["children"]) for level in levels] == [2, 1, 1]
+        # у уровня без связей все равно есть одна пустая запись
+        assert levels[2]["level"]["children"] == [{"related_level_id": None, "line": None, "connection": None}]
+
+        assert response_json["resources"]["scraps"] == 1000
+
+    @pytest.mark.asyncio
+    async def test_catalog_is_cached_until_invalidated(
+        self,
+        app,
+        client: AsyncClient,
+        registered_user: dict,
+        card_factory,
+        db_connection,
+    ):
+        catalog = app.state.catalog
+
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert response.status_code == 200
+        version = catalog.version
+
+        # новая карта в базе не видна, пока кеш не сбросили
+        card_row = await db_connection.fetchrow("SELECT faction_id, color_id, type_id, ability_id FROM cards LIMIT 1")
+        await card_factory(**dict(card_row))
+
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert len(response.json()["user_database"]["cards"]) == 3
+        assert catalog.version == version
+
+        catalog.invalidate()
+
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert len(response.json()["user_database"]["cards"]) == 4
+        assert catalog.version > version
+
+    @pytest.mark.asyncio
+    async def test_catalog_views_are_bounded(
+        self,
+        app,
+        client: AsyncClient,
+        registered_user: dict,
+    ):
+        catalog_cache = app.state.catalog
+
+        # base_url приходит из заголовка Host - разные хосты не должны раздувать кеш
+        for n in range(catalog_cache.views_size * 3):
+            response = await client.get(
+                self.endpoint(registered_user["id"]),
+                headers={**registered_user["headers"], "Host": f"host-{n}.example.com"},
+            )
+            assert response.status_code == 200
+            assert f"host-{n}.example.com" in response.text
+
+        catalog = await catalog_cache.get()
+        assert len(catalog._views) == catalog_cache.views_size
+
+    @pytest.mark.asyncio
+    async def test_sql_engine_matches_catalog_engine(
+        self,
+        app,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+        monkeypatch,
+    ):
+        # фабрики генерят полные url картинок, а в базе лежат относительные пути (urljoin их склеивает иначе)
+        for table in ("cards", "leaders", "enemies", "enemy_leaders"):
+            await db_connection.execute(f"UPDATE {table} SET image_phone = '{table}/' || id || '.png'")  # noqa: S608
+
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert response.status_code == 200
+
+        monkeypatch.setattr(app.state.config, "USER_PROGRESS_ENGINE", "sql")
+        sql_response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert sql_response.status_code == 200
+
+        assert sql_response.json() == response.json()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_fetch_matches_sequential(
+        self,
+        app,
+        client: AsyncClient,
+        registered_user: dict,
+        monkeypatch,
+    ):
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert response.status_code == 200
+
+        monkeypatch.setattr(app.state.config, "USER_PROGRESS_CONCURRENT_FETCH", True)
+        concurrent_response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert concurrent_response.status_code == 200
+
+        assert concurrent_response.json() == response.json()
+
+    @pytest.mark.asyncio
+    async def test_serialized_progress_matches_model(
+        self,
+        app,
+        client: AsyncClient,
+        registered_user: dict,
+    ):
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+
+        service = UserProgressService(db_pool=app.state.db, config=app.state.config, catalog=app.state.catalog)
+        user_progress = await service.get_user_progress(user_id=registered_user["id"], base_url="http://test/")
+
+        assert UserProgressResponse.model_validate_json(response.content) == user_progress
+        assert response.content == user_progress.model_dump_json().encode()
+
+    @pytest.mark.asyncio
+    async def test_etag(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+
+        headers = {**registered_user["headers"], "If-None-Match": etag}
+        response = await client.get(self.endpoint(registered_user["id"]), headers=headers)
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+        await db_connection.execute("UPDATE user_resources SET scraps = 500 WHERE id = $1", registered_user["id"])
+
+        response = await client.get(self.endpoint(registered_user["id"]), headers=headers)
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert response.json()["resources"]["scraps"] == 500
+
+    @pytest.mark.asyncio
+    async def test_etag_late_commit(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_pool,
+    ):
+        async with db_pool.acquire() as early, db_pool.acquire() as late:
+            # транзакция началась раньше, закоммитится позже: ее updated_at меньше уже видимого max updated_at
+            transaction = early.transaction()
+            await transaction.start()
+            await early.execute("SELECT 1")
+            await late.execute("UPDATE user_resources SET scraps = 500 WHERE id = $1", registered_user["id"])
+
+            response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+            etag = response.headers["etag"]
+
+            await early.execute("UPDATE user_cards SET count = count + 1 WHERE user_id = $1", registered_user["id"])
+            await transaction.commit()
+
+        headers = {**registered_user["headers"], "If-None-Match": etag}
+        response = await client.get(self.endpoint(registered_user["id"]), headers=headers)
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from httpx import AsyncClient
+from lib.utils.metrics import registry
+
+
+class TestManageResourcesAPI:
+    @staticmethod
+    def endpoint(user_id: int) -> str:
+        return f"user-progress/{user_id}/resource"
+
+    @pytest.mark.asyncio
+    async def test_bonus_reward(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+    ):
+        response = await client.get(f"user-progress/{registered_user['id']}", headers=registered_user["headers"])
+        resources = response.json()["resources"]
+
+        response = await client.patch(
+            self.endpoint(registered_user["id"]),
+            json={"subtype": "bonus_reward", "data": {"wood": 5, "scraps": -100}},
+            headers=registered_user["headers"],
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {**resources, "wood": resources["wood"] + 5, "scraps": resources["scraps"] - 100}
+
+        # повторный запрос берет подготовленный запрос изменения ресурсов из кеша соединения
+        hits = registry.counter("db.statements.hits").value
+        response = await client.patch(
+            self.endpoint(registered_user["id"]),
+            json={"subtype": "bonus_reward", "data": {"wood": 5, "scraps": -100}},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 200
+        assert registry.counter("db.statements.hits").value > hits
+
+    @pytest.mark.asyncio
+    async def test_unknown_resource(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+    ):
+        response = await client.patch(
+            self.endpoint(registered_user["id"]),
+            json={"subtype": "bonus_reward", "data": {"wood": 5, "gold = 0, scraps": 1}},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 500
+
+        response = await client.get(f"user-progress/{registered_user['id']}", headers=registered_user["headers"])
+        assert response.json()["resources"]["scraps"] == 1000
+
+    @pytest.mark.asyncio
+    async def test_changes_are_appended_to_ledger(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        response = await client.patch(
+            self.endpoint(registered_user["id"]),
+            json={"subtype": "win_season_level", "data": {"wood": 10, "keys": 1}},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 200
+        assert response.json()["wood"] == 1010
+        assert response.json()["keys"] == 4
+
+        rows = await db_connection.fetch("""SELECT reason, wood, keys, scraps FROM user_resource_ledger""")
+        assert [dict(row) for row in rows] == [{"reason": "win_season_level", "wood": 10, "keys": 1, "scraps": 0}]
+        # свернутая часть баланса не меняется до компакции
+        assert await db_connection.fetchval("""SELECT wood FROM user_resources""") == 1000
+
+    @pytest.mark.asyncio
+    async def test_idempotency_key(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        headers = {**registered_user["headers"], "Idempotency-Key": "win-1"}
+        for _ in range(2):
+            response = await client.patch(
+                self.endpoint(registered_user["id"]),
+                json={"subtype": "win_season_level", "data": {"scraps": 50}},
+                headers=headers,
+            )
+            assert response.status_code == 200
+            assert response.json()["scraps"] == 1050
+
+        assert await db_connection.fetchval("""SELECT COUNT(*) FROM user_resource_ledger""") == 1
+
+    @pytest.mark.asyncio
+    async def test_negative_balance(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        response = await client.patch(
+            self.endpoint(registered_user["id"]),
+            json={"subtype": "bonus_reward", "data": {"wood": 5, "scraps": -1001}},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 500
+        assert await db_connection.fetchval("""SELECT COUNT(*) FROM user_resource_ledger""") == 0
+
+    @pytest.mark.asyncio
+    async def test_concurrent_debits(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+    ):
+        # списания одного юзера сериализуются - в минус не уходим, даже если запросы пришли одновременно
+        responses = await asyncio.gather(
+            *(
+                client.patch(
+                    self.endpoint(registered_user["id"]),
+                    json={"subtype": "bonus_reward", "data": {"scraps": -300}},
+                    headers=registered_user["headers"],
+                )
+                for _ in range(5)
+            ),
+        )
+        assert sorted(response.status_code for response in responses) == [200, 200, 200, 500, 500]
+
+        response = await client.get(f"user-progress/{registered_user['id']}", headers=registered_user["headers"])
+        assert response.json()["resources"]["scraps"] == 100
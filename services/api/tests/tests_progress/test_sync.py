@@ -0,0 +1,157 @@
+from dataclasses import replace
+
+import pytest
+
+from httpx import AsyncClient
+from services.api.app.apps.progress.sync import SyncToken
+
+
+class TestUserProgressSyncAPI:
+    @staticmethod
+    def endpoint(user_id: int) -> str:
+        return f"user-progress/{user_id}/sync"
+
+    @pytest.fixture(autouse=True)
+    def no_overlap(self, app, monkeypatch):
+        # строки юзера только что созданы, без окна перечитывания дельта содержит только измененное тестом
+        monkeypatch.setattr(app.state.config, "USER_PROGRESS_SYNC_OVERLAP_SECONDS", 0)
+
+    @pytest.mark.asyncio
+    async def test_full_sync_then_not_modified(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+    ):
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        response_json = response.json()
+
+        assert response.status_code == 200
+        assert response_json["full"] is True
+        assert len(response_json["user_database"]["cards"]) == 3
+        assert len(response_json["user_database"]["decks"]) == 1
+        assert len(response_json["seasons"]) == 1
+        assert len(response_json["enemies"]) == 3
+        assert response_json["resources"]["scraps"] == 1000
+        assert response_json["game_const"]
+
+        response = await client.get(
+            self.endpoint(registered_user["id"]),
+            params={"since": response_json["token"]},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 304
+
+        # битый токен - просто полная синхронизация
+        response = await client.get(
+            self.endpoint(registered_user["id"]),
+            params={"since": "not-a-token"},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 200
+        assert response.json()["full"] is True
+
+        # корректный токен юзера, но метка вне диапазона datetime - тоже полная синхронизация
+        token = SyncToken.decode(response_json["token"])
+        for watermark in (-(10**20), 10**20):
+            response = await client.get(
+                self.endpoint(registered_user["id"]),
+                params={"since": replace(token, watermark=watermark).encode()},
+                headers=registered_user["headers"],
+            )
+            assert response.status_code == 200
+            assert response.json()["full"] is True
+
+    @pytest.mark.asyncio
+    async def test_not_modified_inside_overlap(
+        self,
+        app,
+        client: AsyncClient,
+        registered_user: dict,
+        monkeypatch,
+    ):
+        # строки юзера записаны только что, внутри окна перечитывания - но токен не изменился
+        monkeypatch.setattr(app.state.config, "USER_PROGRESS_SYNC_OVERLAP_SECONDS", 5)
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        assert response.status_code == 200
+
+        response = await client.get(
+            self.endpoint(registered_user["id"]),
+            params={"since": response.json()["token"]},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 304
+
+    @pytest.mark.asyncio
+    async def test_sync_after_craft(
+        self,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        token = response.json()["token"]
+
+        card_id = await db_connection.fetchval(
+            """SELECT cards.id FROM cards JOIN colors ON cards.color_id = colors.id WHERE colors.name = 'Bronze'""",
+        )
+        response = await client.post(
+            f"user-progress/{registered_user['id']}/card/{card_id}",
+            json={"subtype": "craft_card"},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 200
+
+        response = await client.get(
+            self.endpoint(registered_user["id"]),
+            params={"since": token},
+            headers=registered_user["headers"],
+        )
+        response_json = response.json()
+
+        assert response.status_code == 200
+        assert response_json["full"] is False
+        assert [(card["card"]["id"], card["count"]) for card in response_json["user_database"]["cards"]] == [
+            (card_id, 2),
+        ]
+        assert response_json["user_database"]["leaders"] == []
+        assert response_json["user_database"]["decks"] is None
+        assert response_json["resources"]["scraps"] == 800
+        assert response_json["seasons"] == []
+        assert response_json["enemies"] == []
+        assert response_json["game_const"] is None
+
+        response = await client.get(
+            self.endpoint(registered_user["id"]),
+            params={"since": response_json["token"]},
+            headers=registered_user["headers"],
+        )
+        assert response.status_code == 304
+
+    @pytest.mark.asyncio
+    async def test_sync_after_catalog_change(
+        self,
+        app,
+        client: AsyncClient,
+        registered_user: dict,
+        db_connection,
+    ):
+        response = await client.get(self.endpoint(registered_user["id"]), headers=registered_user["headers"])
+        token = response.json()["token"]
+
+        enemy_id = await db_connection.fetchval("""UPDATE enemies SET name = 'Renamed' WHERE id = 1 RETURNING id""")
+        app.state.catalog.invalidate()
+
+        response = await client.get(
+            self.endpoint(registered_user["id"]),
+            params={"since": token},
+            headers=registered_user["headers"],
+        )
+        response_json = response.json()
+
+        assert response.status_code == 200
+        assert response_json["full"] is False
+        assert [(enemy["id"], enemy["name"]) for enemy in response_json["enemies"]] == [(enemy_id, "Renamed")]
+        # враг входит в уровни сезона - сезон отдаем целиком
+        assert len(response_json["seasons"]) == 1
+        assert response_json["user_database"]["cards"] == []
+        assert response_json["resources"] is None
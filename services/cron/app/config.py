@@ -16,6 +16,16 @@ class Config(BaseConfig):
     BBB = "11111111"
     JOBSTORE_TTL: int = 3600
 
+    # журнал ресурсов: строки старше N секунд сворачиваются в user_resources пачками по batch size,
+    # свернутые строки храним N дней (0 - не удаляем, это история изменений)
+    RESOURCE_LEDGER_COMPACT_AFTER_SECONDS: int = get_secret(
+        "RESOURCE_LEDGER_COMPACT_AFTER_SECONDS",
+        default=300,
+        cast=int,
+    )
+    RESOURCE_LEDGER_COMPACT_BATCH_SIZE: int = get_secret("RESOURCE_LEDGER_COMPACT_BATCH_SIZE", default=5000, cast=int)
+    RESOURCE_LEDGER_RETENTION_DAYS: int = get_secret("RESOURCE_LEDGER_RETENTION_DAYS", default=0, cast=int)
+
 
 class TestingConfig(BaseTestingConfig, Config): ...
 
@@ -14,6 +14,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
 
 
 from lib.utils.db.pool import Database
+from lib.utils.events.outbox import OutboxRelay
+from lib.utils.metrics import MetricsReporter
 from lib.utils.tasks.base import TaskScheduler
 from services.cron.app.config import get_config
 
@@ -27,6 +29,9 @@ class Application:
         self.db = Database(self.config)
 
         self.scheduler = TaskScheduler(config=self.config, db=self.db)
+        # в режиме outbox события задач отправляет в Kafka релей
+        self.outbox_relay = OutboxRelay(config=self.config, db=self.db) if self.config.EVENTS_OUTBOX_ENABLED else None
+        self.metrics_reporter = MetricsReporter(interval=self.config.METRICS_REPORT_INTERVAL_SECONDS)
         self.running = False
 
         logging.config.dictConfig(self.config.LOGGING)
@@ -56,6 +61,11 @@ class Application:
         # Запускаем планировщик
         await self.scheduler.start()
 
+        if self.outbox_relay:
+            await self.outbox_relay.start()
+
+        await self.metrics_reporter.start()
+
         # Настройка обработчиков сигналов
         self._setup_signal_handlers()
 
@@ -67,6 +77,9 @@ class Application:
         self.logger.info("Shutting down application")
         self.running = False
         self.scheduler.stop()
+        if self.outbox_relay:
+            await self.outbox_relay.stop()
+        await self.metrics_reporter.stop()
         await self.db.disconnect()
         self.logger.info("Application shutdown complete")
 
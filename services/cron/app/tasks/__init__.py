@@ -1,3 +1,4 @@
+from services.cron.app.tasks.compact_resource_ledger import CompactResourceLedger
 from services.cron.app.tasks.task_one import TaskOne
 from services.cron.app.tasks.task_two import TaskTwo
 
@@ -5,4 +6,5 @@ from services.cron.app.tasks.task_two import TaskTwo
 TASKS = (
     TaskOne,
     TaskTwo,
+    CompactResourceLedger,
 )
@@ -0,0 +1,94 @@
+import logging
+
+from lib.utils.tasks.base import TaskBase
+
+
+logger = logging.getLogger(__name__)
+
+# сворачивает пачку старых строк журнала: помечает их folded_at и прибавляет их суммы к user_resources.
+# Одна команда - вьюха user_balances в любом снимке видит строку либо в журнале, либо уже в user_resources
+FOLD_LEDGER_BATCH = """
+    WITH batch AS (
+        SELECT id
+        FROM user_resource_ledger
+        WHERE folded_at IS NULL AND created_at < NOW() - make_interval(secs => $1)
+        ORDER BY id
+        LIMIT $2
+        FOR UPDATE SKIP LOCKED
+    ),
+    folded AS (
+        UPDATE user_resource_ledger
+        SET folded_at = NOW()
+        FROM batch
+        WHERE user_resource_ledger.id = batch.id
+        RETURNING
+            user_resource_ledger.user_id,
+            user_resource_ledger.scraps,
+            user_resource_ledger.kegs,
+            user_resource_ledger.big_kegs,
+            user_resource_ledger.chests,
+            user_resource_ledger.wood,
+            user_resource_ledger.keys
+    ),
+    sums AS (
+        SELECT
+            user_id,
+            SUM(scraps)::int AS scraps,
+            SUM(kegs)::int AS kegs,
+            SUM(big_kegs)::int AS big_kegs,
+            SUM(chests)::int AS chests,
+            SUM(wood)::int AS wood,
+            SUM(keys)::int AS keys
+        FROM folded
+        GROUP BY user_id
+    ),
+    applied AS (
+        UPDATE user_resources
+        SET
+            scraps = user_resources.scraps + sums.scraps,
+            kegs = user_resources.kegs + sums.kegs,
+            big_kegs = user_resources.big_kegs + sums.big_kegs,
+            chests = user_resources.chests + sums.chests,
+            wood = user_resources.wood + sums.wood,
+            keys = user_resources.keys + sums.keys
+        FROM sums
+        WHERE user_resources.id = sums.user_id
+        RETURNING user_resources.id
+    )
+    SELECT
+        (SELECT COUNT(*) FROM folded) AS rows,
+        (SELECT COUNT(*) FROM applied) AS users
+"""
+
+DELETE_FOLDED_LEDGER_ROWS = """
+    DELETE FROM user_resource_ledger
+    WHERE folded_at < NOW() - make_interval(days => $1)
+"""
+
+
+class CompactResourceLedger(TaskBase):
+    name = "compact_resource_ledger"
+
+    async def do(self):
+        logger.info("Starting resource ledger compaction")
+
+        batch_size: int = self.config.RESOURCE_LEDGER_COMPACT_BATCH_SIZE
+        total_rows = 0
+        async with self.db.connection() as conn:
+            # пачками, чтобы не держать блокировки строк user_resources долго
+            while True:
+                result = await conn.fetchrow(
+                    FOLD_LEDGER_BATCH,
+                    float(self.config.RESOURCE_LEDGER_COMPACT_AFTER_SECONDS),
+                    batch_size,
+                )
+                total_rows += result["rows"]
+                logger.info("Folded %s ledger rows of %s users", result["rows"], result["users"])
+                if result["rows"] < batch_size:
+                    break
+
+            if self.config.RESOURCE_LEDGER_RETENTION_DAYS > 0:
+                status = await conn.execute(DELETE_FOLDED_LEDGER_ROWS, self.config.RESOURCE_LEDGER_RETENTION_DAYS)
+                logger.info("Deleted folded ledger rows: %s", status)
+
+        logger.info("Resource ledger compaction completed, folded %s rows", total_rows)
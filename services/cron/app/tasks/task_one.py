@@ -14,14 +14,16 @@ class TaskOne(TaskBase):
     async def do(self):
         logger.info("Starting TaskOne execution")
 
-        async with self.db.connection() as conn:
+        # в режиме outbox событие пишется в этой же транзакции - уходит в Kafka, только если задача закоммитилась
+        async with self.db.transaction() as conn:
             users = await conn.fetch("SELECT * FROM users")
             logger.info("Total tasks in database: %s", len(users))
 
-        await event_sender.create_event(
-            event_type=EventType.EVENT_1,
-            payload={"users": dict(users[0]) if users else []},
-            config=self.config,
-        )
+            await event_sender.create_event(
+                event_type=EventType.EVENT_1,
+                payload={"users": dict(users[0]) if users else []},
+                config=self.config,
+                connection=conn,
+            )
 
         logger.info("TaskOne completed successfully")
@@ -0,0 +1,153 @@
+"""
+Пропускная способность отправки событий: send_event (send_and_wait на каждое сообщение) против
+send_event_nowait (пачки по linger/max batch size, ждем только flush в конце). event_log пишется в обоих режимах.
+По умолчанию брокер эмулируется в процессе: каждый запрос к нему стоит --rtt-ms, в запрос уходит пачка.
+С --bootstrap-servers - настоящий Kafka, например локальный контейнер.
+Запуск: make bench-events EVENTS=2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from lib.utils.db.pool import Database
+from lib.utils.events.event_sender import EventSender
+from lib.utils.events.event_types import EventType
+from lib.utils.events.producer import create_producer
+from lib.utils.json import dumps_bytes
+from services.cron.app.config import get_config
+
+
+class FakeBrokerProducer:
+    """Продюсер с эмуляцией брокера: пачка копится linger секунд или до batch_size сообщений, запрос - rtt секунд"""
+
+    def __init__(
+        self,
+        rtt: float,
+        linger: float,
+        batch_size: int,
+    ):
+        self.rtt = rtt
+        self.linger = linger
+        self.batch_size = batch_size
+        self.requests = 0
+        self._batch: list[asyncio.Future] = []
+        self._linger_task: asyncio.Task | None = None
+        self._requests: set[asyncio.Task] = set()
+
+    async def send(
+        self,
+        topic: str,
+        value: dict,
+        key: str | None = None,
+    ) -> asyncio.Future:
+        dumps_bytes(value)
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append(future)
+        if len(self._batch) >= self.batch_size:
+            self._send_batch()
+        elif self._linger_task is None:
+            self._linger_task = asyncio.create_task(self._linger())
+        return future
+
+    async def send_and_wait(
+        self,
+        topic: str,
+        value: dict,
+        key: str | None = None,
+    ) -> None:
+        await (await self.send(topic, value, key=key))
+
+    async def flush(self) -> None:
+        self._send_batch()
+        await asyncio.gather(*self._requests)
+
+    async def _linger(self) -> None:
+        await asyncio.sleep(self.linger)
+        self._linger_task = None
+        self._send_batch()
+
+    def _send_batch(self) -> None:
+        if self._linger_task is not None:
+            self._linger_task.cancel()
+            self._linger_task = None
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        task = asyncio.create_task(self._request(batch))
+        self._requests.add(task)
+        task.add_done_callback(self._requests.discard)
+
+    async def _request(
+        self,
+        batch: list[asyncio.Future],
+    ) -> None:
+        self.requests += 1
+        await asyncio.sleep(self.rtt)
+        for future in batch:
+            future.set_result(None)
+
+
+async def bench(
+    sender: EventSender,
+    events: int,
+    nowait: bool,
+) -> float:
+    """Событий в секунду"""
+    started = time.perf_counter()
+    for n in range(events):
+        if nowait:
+            await sender.send_event_nowait(EventType.EVENT_1, {"n": n})
+        else:
+            await sender.send_event(EventType.EVENT_1, {"n": n})
+    await sender.flush()
+    return events / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--rtt-ms", type=float, default=1.0)
+    parser.add_argument("--bootstrap-servers", default=None)
+    args = parser.parse_args()
+
+    config = get_config()
+    config.EVENTS_OUTBOX_ENABLED = False
+    db = Database(config)
+    await db.connect()
+
+    if args.bootstrap_servers:
+        config.KAFKA_BOOTSTRAP_SERVERS = args.bootstrap_servers
+        producer = create_producer(config)
+        await producer.start()
+    else:
+        producer = FakeBrokerProducer(
+            rtt=args.rtt_ms / 1000,
+            linger=config.KAFKA_PRODUCER_LINGER_MS / 1000,
+            # эмуляция считает пачку в сообщениях, а не в байтах
+            batch_size=max(config.KAFKA_PRODUCER_MAX_BATCH_SIZE // 512, 1),
+        )
+
+    sender = EventSender(config=config, db=db, producer=producer)
+    try:
+        # прогрев: соединения пула, метаданные топика
+        await bench(sender, 20, nowait=False)
+
+        waited = await bench(sender, args.events, nowait=False)
+        print(f"{'send_and_wait':<15} {waited:.0f} events/s")
+        nowait = await bench(sender, args.events, nowait=True)
+        print(f"{'nowait':<15} {nowait:.0f} events/s")
+        print(f"speedup x{nowait / waited:.1f}")
+    finally:
+        if args.bootstrap_servers:
+            await producer.stop()
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+import pytest
+
+from services.cron.app.tasks import CompactResourceLedger
+
+
+@pytest.mark.asyncio
+async def test_compact_resource_ledger(
+    config,
+    db,
+    db_connection,
+    monkeypatch,
+):
+    monkeypatch.setattr(config, "RESOURCE_LEDGER_COMPACT_BATCH_SIZE", 2)
+    user_id = await db_connection.fetchval(
+        """INSERT INTO users (email, username, password) VALUES ('ledger@test.com', 'ledger', 'x') RETURNING id""",
+    )
+    await db_connection.execute("""INSERT INTO user_resources (id) VALUES ($1)""", user_id)
+    await db_connection.execute(
+        """
+            INSERT INTO user_resource_ledger (user_id, reason, scraps, wood, created_at)
+            VALUES
+                ($1, 'old', -100, 0, NOW() - INTERVAL '1 hour'),
+                ($1, 'old', 0, 20, NOW() - INTERVAL '1 hour'),
+                ($1, 'old', 30, 0, NOW() - INTERVAL '1 hour'),
+                ($1, 'new', 5, 0, NOW())
+        """,
+        user_id,
+    )
+    balance = await db_connection.fetchrow("""SELECT scraps, wood FROM user_balances WHERE id = $1""", user_id)
+
+    await CompactResourceLedger(config, db).do()
+
+    # старые строки свернуты в user_resources, свежая осталась в журнале, баланс не изменился
+    assert dict(await db_connection.fetchrow("""SELECT scraps, wood FROM user_resources""")) == {
+        "scraps": 930,
+        "wood": 1020,
+    }
+    rows = await db_connection.fetch("""SELECT reason FROM user_resource_ledger WHERE folded_at IS NULL""")
+    assert [row["reason"] for row in rows] == ["new"]
+    assert await db_connection.fetchrow("""SELECT scraps, wood FROM user_balances WHERE id = $1""", user_id) == balance
+    assert dict(balance) == {"scraps": 935, "wood": 1020}
+
+    await db.disconnect()
@@ -19,3 +19,21 @@ async def test_task_one_execution(
     print(call_args)
     call_args = event_sender_mock.call_args
     print(call_args)
+    assert call_args.kwargs["connection"] is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("setup_database")
+async def test_task_one_outbox(
+    config,
+    db,
+    db_connection,
+    monkeypatch,
+):
+    monkeypatch.setattr(config, "EVENTS_OUTBOX_ENABLED", True)
+    task = TaskOne(config, db)
+
+    await task.do()
+
+    # событие записано в транзакции задачи, отправит его OutboxRelay
+    assert await db_connection.fetchval("""SELECT state FROM event_log WHERE type = 'event_1'""") == "pending"
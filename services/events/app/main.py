@@ -1,7 +1,9 @@
 import asyncio
 import logging.config
 import os
+import signal
 import sys
+from types import FrameType
 
 from lib.utils.elk.elastic_logger import ElasticLoggerManager
 
@@ -10,6 +12,7 @@ from lib.utils.elk.elastic_logger import ElasticLoggerManager
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
 
 from lib.utils.events.event_consumer import EventConsumer
+from lib.utils.metrics import MetricsReporter
 from services.events.app.config import get_config
 
 
@@ -32,7 +35,25 @@ async def main():
     logger.info("Starting Event Processor...")
 
     consumer = EventConsumer(config=config)
-    await consumer.start_consuming()
+
+    def signal_handler(
+        signum: int,
+        frame: FrameType,
+    ):
+        # цикл чтения сам дообработает текущую пачку, закоммитит ее и закроет консьюмер и пул
+        logger.info("Received signal %s, initiating shutdown", signum)
+        consumer.request_stop()
+
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    metrics_reporter = MetricsReporter(interval=config.METRICS_REPORT_INTERVAL_SECONDS)
+    await metrics_reporter.start()
+    try:
+        await consumer.start_consuming()
+    finally:
+        await metrics_reporter.stop()
+    logger.info("Event Processor stopped")
 
 
 if __name__ == "__main__":
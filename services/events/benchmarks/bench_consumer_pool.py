@@ -0,0 +1,71 @@
+"""
+Регрессионный бенчмарк обработки событий консьюмером: пул соединений на все время работы против
+закрытия пула после каждого сообщения (так было раньше - следующее сообщение заново открывало пул).
+Kafka не нужна: сообщения подаются прямо в EventConsumer.process_message, база - настоящая.
+Запуск: make bench-consumer MESSAGES=500
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from lib.utils.db.pool import Database
+from lib.utils.events.event_configs import EventConfigRegistry
+from lib.utils.events.event_consumer import EventConsumer
+from lib.utils.events.event_types import EventType
+from lib.utils.schemas.events import EventMessage
+from services.events.app.config import get_config
+
+
+async def bench(
+    consumer: EventConsumer,
+    messages: int,
+    reconnect: bool,
+) -> float:
+    """Сообщений в секунду"""
+    started = time.perf_counter()
+    for n in range(messages):
+        await consumer.process_message(EventMessage(event_type=EventType.EVENT_1, payload={"n": n}))
+        if reconnect:
+            await consumer.db.disconnect()
+    return messages / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500)
+    args = parser.parse_args()
+
+    config = get_config()
+    consumer = EventConsumer(config=config)
+    consumer.db = Database(config)
+    consumer.event_configs = EventConfigRegistry(consumer.db)
+    await consumer.db.connect()
+
+    try:
+        # конфиг события без действий - меряем накладные расходы консьюмера, а не внешние вызовы
+        async with consumer.db.connection() as conn:
+            await conn.execute(
+                """INSERT INTO events (type, processing) VALUES ($1, '[]') ON CONFLICT (type) DO NOTHING""",
+                EventType.EVENT_1,
+            )
+
+        # прогрев соединений пула
+        await bench(consumer, 20, reconnect=False)
+
+        before = await bench(consumer, args.messages, reconnect=True)
+        print(f"{'reconnect':<12} {before:.0f} messages/s")
+        after = await bench(consumer, args.messages, reconnect=False)
+        print(f"{'long-lived':<12} {after:.0f} messages/s")
+        print(f"speedup x{after / before:.1f}")
+    finally:
+        await consumer.db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""catalog version
+
+Revision ID: b7c41e9d2a10
+Revises: 6941bca133b2
+Create Date: 2026-10-18 11:00:12.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c41e9d2a10'
+down_revision = '6941bca133b2'
+branch_labels = None
+depends_on = None
+
+
+CATALOG_VERSION_TABLES = (
+    'factions',
+    'colors',
+    'types',
+    'abilities',
+    'passive_abilities',
+    'cards',
+    'leaders',
+    'moves',
+    'enemy_passive_abilities',
+    'enemy_leader_abilities',
+    'deathwishes',
+    'enemies',
+    'enemy_leaders',
+    'seasons',
+    'levels',
+    'level_enemies',
+    'level_related_levels',
+    'game_constants',
+)
+
+
+def upgrade():
+    op.create_table('catalog_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_catalog_version'))
+    )
+    op.execute("INSERT INTO catalog_version (id, version) VALUES (1, 1)")
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+        DECLARE
+            new_version BIGINT;
+        BEGIN
+            INSERT INTO catalog_version (id, version, updated_at)
+            VALUES (1, 1, NOW())
+            ON CONFLICT (id) DO UPDATE
+            SET
+                version = catalog_version.version + 1,
+                updated_at = NOW()
+            RETURNING version INTO new_version;
+
+            PERFORM pg_notify('catalog_version', new_version::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table in CATALOG_VERSION_TABLES:
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_bump_catalog_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version()
+            """
+        )
+
+
+def downgrade():
+    for table in CATALOG_VERSION_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_bump_catalog_version ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS bump_catalog_version()")
+    op.drop_table('catalog_version')
@@ -0,0 +1,53 @@
+"""updated_at triggers
+
+Revision ID: 4e2d8f61c0a3
+Revises: b7c41e9d2a10
+Create Date: 2026-10-18 11:30:41.902117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4e2d8f61c0a3'
+down_revision = 'b7c41e9d2a10'
+branch_labels = None
+depends_on = None
+
+
+UPDATED_AT_TABLES = (
+    'user_resources',
+    'user_cards',
+    'user_leaders',
+    'user_decks',
+    'user_levels',
+    'decks',
+    'card_decks',
+)
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at = NOW();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table in UPDATED_AT_TABLES:
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_set_updated_at
+            BEFORE UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION set_updated_at()
+            """
+        )
+
+
+def downgrade():
+    for table in UPDATED_AT_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_set_updated_at ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS set_updated_at()")
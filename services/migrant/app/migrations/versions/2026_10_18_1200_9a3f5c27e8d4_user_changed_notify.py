@@ -0,0 +1,40 @@
+"""user changed notify
+
+Revision ID: 9a3f5c27e8d4
+Revises: 4e2d8f61c0a3
+Create Date: 2026-10-18 12:00:27.551930
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3f5c27e8d4'
+down_revision = '4e2d8f61c0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_user_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('user_changed', OLD.id::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_notify_user_changed
+        AFTER UPDATE OF is_active, email, password OR DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION notify_user_changed()
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS users_notify_user_changed ON users")
+    op.execute("DROP FUNCTION IF EXISTS notify_user_changed()")
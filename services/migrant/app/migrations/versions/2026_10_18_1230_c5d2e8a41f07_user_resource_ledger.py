@@ -0,0 +1,112 @@
+"""user resource ledger
+
+Revision ID: c5d2e8a41f07
+Revises: 9a3f5c27e8d4
+Create Date: 2026-10-18 12:30:41.208113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d2e8a41f07'
+down_revision = '9a3f5c27e8d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_resource_ledger',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('reason', sa.String(length=64), nullable=False),
+    sa.Column('idempotency_key', sa.String(length=128), nullable=True),
+    sa.Column('scraps', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('wood', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('kegs', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('big_kegs', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('chests', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('keys', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('folded_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='RESTRICT'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'idempotency_key', name='uq_user_resource_ledger_idempotency_key')
+    )
+    op.create_index(
+        'ix_user_resource_ledger_unfolded',
+        'user_resource_ledger',
+        ['user_id'],
+        unique=False,
+        postgresql_where=sa.text('folded_at IS NULL'),
+    )
+    # текущие значения user_resources становятся свернутой частью баланса
+    op.execute(
+        """
+        CREATE OR REPLACE VIEW user_balances AS
+        SELECT
+            user_resources.id,
+            user_resources.scraps + COALESCE(ledger.scraps, 0) AS scraps,
+            user_resources.kegs + COALESCE(ledger.kegs, 0) AS kegs,
+            user_resources.big_kegs + COALESCE(ledger.big_kegs, 0) AS big_kegs,
+            user_resources.chests + COALESCE(ledger.chests, 0) AS chests,
+            user_resources.wood + COALESCE(ledger.wood, 0) AS wood,
+            user_resources.keys + COALESCE(ledger.keys, 0) AS keys,
+            GREATEST(user_resources.updated_at, ledger.updated_at) AS updated_at
+        FROM user_resources
+        LEFT JOIN LATERAL (
+            SELECT
+                SUM(scraps)::int AS scraps,
+                SUM(kegs)::int AS kegs,
+                SUM(big_kegs)::int AS big_kegs,
+                SUM(chests)::int AS chests,
+                SUM(wood)::int AS wood,
+                SUM(keys)::int AS keys,
+                MAX(created_at) AS updated_at
+            FROM user_resource_ledger
+            WHERE user_resource_ledger.user_id = user_resources.id AND user_resource_ledger.folded_at IS NULL
+        ) AS ledger ON TRUE
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO cron_tasks (name, schedule, is_active)
+        VALUES ('compact_resource_ledger', '*/5 * * * *', TRUE)
+        ON CONFLICT (name) DO NOTHING
+        """
+    )
+
+
+def downgrade():
+    # перед удалением журнала сворачиваем его в user_resources, иначе несвернутые изменения потеряются
+    op.execute(
+        """
+        UPDATE user_resources
+        SET
+            scraps = user_resources.scraps + ledger.scraps,
+            kegs = user_resources.kegs + ledger.kegs,
+            big_kegs = user_resources.big_kegs + ledger.big_kegs,
+            chests = user_resources.chests + ledger.chests,
+            wood = user_resources.wood + ledger.wood,
+            keys = user_resources.keys + ledger.keys
+        FROM (
+            SELECT
+                user_id,
+                SUM(scraps)::int AS scraps,
+                SUM(kegs)::int AS kegs,
+                SUM(big_kegs)::int AS big_kegs,
+                SUM(chests)::int AS chests,
+                SUM(wood)::int AS wood,
+                SUM(keys)::int AS keys
+            FROM user_resource_ledger
+            WHERE folded_at IS NULL
+            GROUP BY user_id
+        ) AS ledger
+        WHERE user_resources.id = ledger.user_id
+        """
+    )
+    op.execute("DELETE FROM cron_tasks WHERE name = 'compact_resource_ledger'")
+    op.execute("DROP VIEW IF EXISTS user_balances")
+    op.drop_index('ix_user_resource_ledger_unfolded', table_name='user_resource_ledger')
+    op.drop_table('user_resource_ledger')
@@ -0,0 +1,30 @@
+"""event log outbox
+
+Revision ID: e1f7a3b96c52
+Revises: c5d2e8a41f07
+Create Date: 2026-10-18 13:00:12.730415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f7a3b96c52'
+down_revision = 'c5d2e8a41f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_event_log_pending',
+        'event_log',
+        ['created_at'],
+        unique=False,
+        postgresql_where=sa.text("state = 'pending'"),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_event_log_pending', table_name='event_log')
@@ -0,0 +1,40 @@
+"""events changed notify
+
+Revision ID: 7b9e4d2c1a68
+Revises: e1f7a3b96c52
+Create Date: 2026-10-18 13:30:05.118462
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7b9e4d2c1a68'
+down_revision = 'e1f7a3b96c52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_events_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('events_changed', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER events_notify_events_changed
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON events
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_events_changed()
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS events_notify_events_changed ON events")
+    op.execute("DROP FUNCTION IF EXISTS notify_events_changed()")
@@ -0,0 +1,84 @@
+"""user progress revisions
+
+Revision ID: 3c8a6f1e9d25
+Revises: 7b9e4d2c1a68
+Create Date: 2026-10-18 14:00:12.530841
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8a6f1e9d25'
+down_revision = '7b9e4d2c1a68'
+branch_labels = None
+depends_on = None
+
+
+# таблица -> колонка с id юзера и как по ней найти юзера (deck - через user_decks)
+USER_PROGRESS_REVISION_TABLES = {
+    'user_resources': ('id', 'user'),
+    'user_resource_ledger': ('user_id', 'user'),
+    'user_cards': ('user_id', 'user'),
+    'user_leaders': ('user_id', 'user'),
+    'user_decks': ('user_id', 'user'),
+    'user_levels': ('user_id', 'user'),
+    'decks': ('id', 'deck'),
+    'card_decks': ('deck_id', 'deck'),
+}
+
+
+def upgrade():
+    # строки нет - ревизия 0, заполнять для существующих юзеров не нужно
+    op.create_table('user_progress_revisions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.BigInteger(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION bump_user_progress_revision() RETURNS trigger AS $$
+        DECLARE
+            row_data JSONB;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row_data := to_jsonb(OLD);
+            ELSE
+                row_data := to_jsonb(NEW);
+            END IF;
+
+            IF TG_ARGV[1] = 'deck' THEN
+                INSERT INTO user_progress_revisions (user_id, revision)
+                SELECT user_id, 1
+                FROM user_decks
+                WHERE deck_id = (row_data ->> TG_ARGV[0])::int
+                ON CONFLICT (user_id) DO UPDATE
+                SET revision = user_progress_revisions.revision + 1;
+            ELSE
+                INSERT INTO user_progress_revisions (user_id, revision)
+                VALUES ((row_data ->> TG_ARGV[0])::int, 1)
+                ON CONFLICT (user_id) DO UPDATE
+                SET revision = user_progress_revisions.revision + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table, (column, kind) in USER_PROGRESS_REVISION_TABLES.items():
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_bump_user_progress_revision
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION bump_user_progress_revision('{column}', '{kind}')
+            """
+        )
+
+
+def downgrade():
+    for table in USER_PROGRESS_REVISION_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_bump_user_progress_revision ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS bump_user_progress_revision()")
+    op.drop_table('user_progress_revisions')